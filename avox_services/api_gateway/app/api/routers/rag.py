@@ -1,17 +1,35 @@
-from fastapi import APIRouter, HTTPException
+import uuid
+from typing import AsyncIterator, Optional
+
+import httpx
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.datastructures import UploadFile
 
 from api_gateway.app.deps import HttpClientDep, AuthTokenDep, KNOWLEDGE_SERVICE_URL
-from avox_shared.knowledge_service.document import DocumentIngestRequest
-from avox_shared.knowledge_service.rag import RAGQuery
+from avox_shared.knowledge_service.document import DocumentIngestRequest, DocumentUpdateRequest
+from avox_shared.knowledge_service.rag import RAGQuery, RAGSearchQuery
 
 router = APIRouter(prefix="/api/rag", tags=["RAG Gateway"])
 
-@router.post("/ingest-documents")
+# Порция чтения загруженного файла при пересылке
+UPLOAD_READ_SIZE = 64 * 1024
+
+
+async def iter_upload(upload: UploadFile) -> AsyncIterator[bytes]:
+    while data := await upload.read(UPLOAD_READ_SIZE):
+        yield data
+
+@router.post("/ingest-documents", status_code=202)
 async def ingest_documents(
     req: DocumentIngestRequest,
     client: HttpClientDep,
     token: AuthTokenDep,
 ):
+    """
+    Knowledge service отвечает 202 с job_id сразу после записи чанков — эмбеддинги считаются в фоне,
+    поэтому таймаут клиента не зависит от размера документа.
+    """
     headers = {"Authorization": f"Bearer {token}"} if token else {}
     try:
         resp = await client.post(
@@ -19,11 +37,104 @@ async def ingest_documents(
             json=req.model_dump(),
             headers=headers,
         )
-        if resp.status_code >= 400:
-            raise HTTPException(status_code=resp.status_code, detail=resp.text)
-        return resp.json()
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Gateway error: {e}")
+    if resp.status_code >= 400:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    return JSONResponse(status_code=resp.status_code, content=resp.json())
+
+@router.post("/ingest-documents/stream", status_code=202)
+async def ingest_document_stream(
+    request: Request,
+    token: AuthTokenDep,
+    title: Optional[str] = None,
+    source_type: str = "file",
+    access_level: str = "restricted",
+):
+    """
+    Потоковая загрузка большого документа: multipart/form-data (поле file, необязательное title)
+    или сырое тело (text/plain, в т.ч. chunked). Тело уходит в knowledge service потоком, без парсинга
+    в модель: multipart-файл Starlette держит во временном файле на диске, сырое тело не буферизуется.
+    """
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    content_type = request.headers.get("content-type", "text/plain")
+    form = None
+
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            await form.close()
+            raise HTTPException(status_code=400, detail="multipart upload requires a 'file' field")
+        title = title or form.get("title") or upload.filename
+        body = iter_upload(upload)
+        headers["Content-Type"] = upload.content_type or "text/plain"
+    else:
+        body = request.stream()
+        headers["Content-Type"] = content_type
+
+    if not title:
+        if form is not None:
+            await form.close()
+        raise HTTPException(status_code=400, detail="title is required")
+
+    # Время записи тела не ограничено: файл может идти долго
+    client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, write=None))
+    try:
+        resp = await client.post(
+            f"{KNOWLEDGE_SERVICE_URL}/rag/ingest-documents/stream",
+            params={"title": title, "source_type": source_type, "access_level": access_level},
+            content=body,
+            headers=headers,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Gateway error: {e}")
+    finally:
+        await client.aclose()
+        if form is not None:
+            await form.close()
+
+    if resp.status_code >= 400:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    return JSONResponse(status_code=resp.status_code, content=resp.json())
+
+@router.put("/documents/{document_id}")
+async def update_document(
+    document_id: uuid.UUID,
+    req: DocumentUpdateRequest,
+    client: HttpClientDep,
+    token: AuthTokenDep,
+):
+    """
+    Новая версия документа: 202 с job_id, если нужно досчитать эмбеддинги изменённых чанков, иначе 200.
+    """
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    try:
+        resp = await client.put(
+            f"{KNOWLEDGE_SERVICE_URL}/rag/documents/{document_id}",
+            json=req.model_dump(),
+            headers=headers,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Gateway error: {e}")
+    if resp.status_code >= 400:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    return JSONResponse(status_code=resp.status_code, content=resp.json())
+
+@router.get("/ingest-jobs/{job_id}")
+async def ingest_job_status(
+    job_id: uuid.UUID,
+    client: HttpClientDep,
+    token: AuthTokenDep,
+):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    resp = await client.get(
+        f"{KNOWLEDGE_SERVICE_URL}/rag/ingest-jobs/{job_id}",
+        headers=headers,
+    )
+    if resp.status_code >= 400:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    return resp.json()
 
 @router.post("/query")
 async def query_single_document(
@@ -39,4 +150,63 @@ async def query_single_document(
     )
     if resp.status_code >= 400:
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
-    return resp.json()
\ No newline at end of file
+    return resp.json()
+
+@router.post("/search")
+async def search(
+    req: RAGSearchQuery,
+    client: HttpClientDep,
+    token: AuthTokenDep,
+):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    resp = await client.post(
+        f"{KNOWLEDGE_SERVICE_URL}/rag/search",
+        json=req.model_dump(),
+        headers=headers,
+    )
+    if resp.status_code >= 400:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    return resp.json()
+
+@router.post("/query/stream")
+async def query_stream(
+    req: RAGQuery,
+    token: AuthTokenDep,
+):
+    """
+    Проксирует SSE-поток /rag/query/stream без буферизации.
+    Клиент создаётся здесь, а не через HttpClientDep: он должен жить, пока идёт поток.
+    """
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=None))
+    request = client.build_request(
+        "POST",
+        f"{KNOWLEDGE_SERVICE_URL}/rag/query/stream",
+        json=req.model_dump(mode="json"),
+        headers=headers,
+    )
+    try:
+        resp = await client.send(request, stream=True)
+    except Exception as e:
+        await client.aclose()
+        raise HTTPException(status_code=502, detail=f"Gateway error: {e}")
+
+    if resp.status_code >= 400:
+        body = await resp.aread()
+        await resp.aclose()
+        await client.aclose()
+        raise HTTPException(status_code=resp.status_code, detail=body.decode(errors="replace"))
+
+    async def relay():
+        try:
+            async for chunk in resp.aiter_raw():
+                yield chunk
+        finally:
+            await resp.aclose()
+            await client.aclose()
+
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,5 +1,6 @@
 import uuid
-from typing import Optional
+from datetime import datetime
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -12,8 +13,63 @@ class DocumentIngestRequest(BaseModel):
     source_type: SourceType = Field(..., description="Тип источника")
     access_level: DocAccessLevel = Field(..., description="Уровень доступа")
 
+class IngestStats(BaseModel):
+    documents: int = Field(0, description="Документов записано")
+    chunks: int = Field(0, description="Чанков записано")
+    subchunks: int = Field(0, description="Подчанков (эмбеддингов) записано")
+    subchunks_encoded: int = Field(0, description="Подчанков, прошедших через модель")
+    subchunks_reused: int = Field(0, description="Подчанков, вектор которых взят из хранилища или дубля в партии")
+    dedup_ratio: float = Field(0.0, description="Доля повторно использованных векторов, 0..1")
+    model_ms_saved: float = Field(0.0, description="Оценка сэкономленного времени модели, мс")
+    encode_ms: float = Field(0.0, description="Время кодирования подчанков, мс")
+    write_ms: float = Field(0.0, description="Время записи в БД, мс")
+    total_ms: float = Field(0.0, description="Общее время, мс")
+    docs_per_sec: float = Field(0.0, description="Документов в секунду")
+    subchunks_per_sec: float = Field(0.0, description="Подчанков в секунду")
+
 class DocumentIngestResponse(BaseModel):
     document_id: Optional[uuid.UUID] = Field(None, description="UUID созданного документа")
     title: str = Field(..., description="Заголовок")
-    status: str = Field(..., description="success / failed")
+    status: str = Field(..., description="success / accepted / failed")
     error: Optional[str] = Field(None, description="Описание ошибки, если есть")
+    job_id: Optional[uuid.UUID] = Field(None, description="Задание расчёта эмбеддингов (status=accepted)")
+    stats: Optional[IngestStats] = Field(None, description="Объём и скорость инжеста")
+
+class DocumentBulkIngestResponse(BaseModel):
+    results: List[DocumentIngestResponse] = Field(default_factory=list, description="Результаты по документам")
+    stats: IngestStats = Field(..., description="Суммарный объём и скорость инжеста")
+
+class DocumentUpdateRequest(BaseModel):
+    text: str = Field(..., description="Полный текст новой версии документа")
+    title: Optional[str] = Field(None, description="Новый заголовок; по умолчанию прежний")
+    version: Optional[int] = Field(None, description="Ожидаемая текущая версия; при несовпадении — 409")
+
+class DocumentUpdateResponse(BaseModel):
+    document_id: uuid.UUID = Field(..., description="UUID документа")
+    title: str = Field(..., description="Заголовок")
+    version: int = Field(..., description="Версия документа после обновления")
+    status: str = Field(..., description="updated / accepted / unchanged")
+    job_id: Optional[uuid.UUID] = Field(None, description="Задание расчёта эмбеддингов изменённых чанков")
+    chunks_kept: int = Field(0, description="Чанков сохранено вместе с эмбеддингами")
+    chunks_inserted: int = Field(0, description="Чанков добавлено")
+    chunks_deleted: int = Field(0, description="Чанков удалено")
+    subchunks_total: int = Field(0, description="Подчанков в добавленных чанках")
+    subchunks_reused: int = Field(0, description="Из них с вектором из хранилища по хэшу содержимого")
+
+class IngestJobResponse(BaseModel):
+    job_id: uuid.UUID = Field(..., description="UUID задания")
+    document_id: uuid.UUID = Field(..., description="UUID документа")
+    status: str = Field(..., description="queued / running / completed / failed")
+    chunks_total: int = Field(0, description="Чанков в документе")
+    chunks_embedded: int = Field(0, description="Чанков, все подчанки которых посчитаны")
+    subchunks_total: int = Field(0, description="Подчанков (эмбеддингов) всего")
+    subchunks_embedded: int = Field(0, description="Подчанков посчитано")
+    subchunks_failed: int = Field(0, description="Подчанков с ошибкой")
+    subchunks_reused: int = Field(0, description="Подчанков, векторы которых взяты из хранилища при постановке")
+    dedup_ratio: float = Field(0.0, description="Доля повторно использованных векторов, 0..1")
+    progress: float = Field(0.0, description="Доля обработанных подчанков, 0..1")
+    eta_seconds: Optional[float] = Field(None, description="Оценка оставшегося времени по текущей скорости")
+    error: Optional[str] = Field(None, description="Ошибка задания, если есть")
+    created_at: Optional[datetime] = Field(None, description="Время постановки")
+    started_at: Optional[datetime] = Field(None, description="Начало расчёта эмбеддингов")
+    finished_at: Optional[datetime] = Field(None, description="Окончание задания")
@@ -0,0 +1,17 @@
+from enum import Enum
+from typing import Optional, TypedDict
+
+
+# Уровень достоверности факта
+class FactCertainty(str, Enum):
+    HIGH = "high"            # Факт подтверждён с высокой уверенностью
+    MEDIUM = "medium"        # Факт вероятен, но есть небольшие сомнения
+    LOW = "low"              # Факт с низкой достоверностью
+    CONTRADICTS = "contradicts"  # Факт противоречит имеющимся данным
+
+# Структура факта
+class Fact(TypedDict):
+    id: Optional[str]        # Уникальный идентификатор факта, может быть None для новых фактов
+    fact: str                # Краткое описание факта
+    certainty: FactCertainty # Уровень достоверности факта
+    reasoning: str           # Краткое объяснение или источник факта
@@ -1,12 +1,22 @@
-from typing import List, Optional
+from enum import Enum
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
+from avox_shared.knowledge_service.facts import Fact, FactCertainty
+
+
+class AnswerStrategy(str, Enum):
+    """How retrieved documents are passed through the LLM"""
+    SEQUENTIAL = "sequential"   # один документ за другим, с накоплением фактов
+    MAP_REDUCE = "map_reduce"   # параллельное извлечение фактов + один шаг синтеза
 
 class RAGQuery(BaseModel):
     """Request model for RAG queries"""
     question: str
     doc_ids: Optional[List[str]] = None
+    strategy: Optional[AnswerStrategy] = None
+    conversation_id: Optional[str] = None   # диалог, к которому относится вопрос; пусто — диалог по умолчанию
 
 class RAGResponse(BaseModel):
     """Response model for RAG queries"""
@@ -20,3 +30,31 @@ class RAGResponse(BaseModel):
     processing_time_ms: int
     warnings: List[str] = []
     truncated: bool = False
+    strategy: Optional[AnswerStrategy] = None
+    stage_timings_ms: Dict[str, int] = {}
+    context_tokens_saved: int = 0   # оценка токенов перекрытия чанков, не отправленных в LLM
+    cache_hit: bool = False         # ответ взят из семантического кэша
+    conversation_id: Optional[str] = None
+
+class RAGSearchQuery(BaseModel):
+    """Request model for retrieval-only search"""
+    question: str
+    doc_ids: Optional[List[str]] = None
+    limit: int = Field(20, ge=1, le=100, description="Чанков на странице")
+    cursor: Optional[str] = Field(None, description="next_cursor предыдущей страницы")
+    include_text: bool = Field(False, description="Возвращать текст чанков")
+
+class ScoredChunk(BaseModel):
+    """Chunk found by search with its ranking scores"""
+    chunk_id: str
+    document_id: str
+    chunk_idx: int
+    score: float                        # векторный скор (0.6 best + 0.3 avg + 0.1 match)
+    rrf_score: Optional[float] = None   # только в гибридном режиме, по нему идёт сортировка
+    chunk_text: Optional[str] = None
+
+class RAGSearchResponse(BaseModel):
+    """Response model for retrieval-only search"""
+    results: List[ScoredChunk]
+    next_cursor: Optional[str] = None
+    processing_time_ms: int
@@ -1,46 +1,173 @@
-from http.client import HTTPException
+import uuid
 
-from fastapi import APIRouter
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from avox_shared.knowledge_service.document import DocumentIngestRequest, DocumentIngestResponse
-from avox_shared.knowledge_service.rag import RAGQuery, RAGResponse
-from knowledge_service.app.deps import RAGPipelineDep, RAGUserDep, RAGDocumentIngestor
+from avox_shared.knowledge_service.document import (
+    DocumentIngestRequest,
+    DocumentIngestResponse,
+    DocumentUpdateRequest,
+    DocumentUpdateResponse,
+    IngestJobResponse,
+)
+from avox_shared.knowledge_service.rag import RAGQuery, RAGResponse, RAGSearchQuery, RAGSearchResponse
+from knowledge_service.app.api.sse import SSE_HEADERS, format_sse
+from knowledge_service.app.core import config
+from knowledge_service.app.deps import DbSessionDep, RAGPipelineDep, RAGUserDep, RAGDocumentIngestor
+from knowledge_service.app.embeddings import get_query_encoder, query_embedding_cache
+from knowledge_service.app.llm.answer_cache import answer_cache
+from knowledge_service.app.llm.conversation import conversation_store
+from knowledge_service.app.models.core.company import User
+from knowledge_service.app.models.enums import DocAccessLevel, SourceType, UserType
+from knowledge_service.app.retrieval import InvalidCursor, access_set_cache, get_chunk_reranker
+from knowledge_service.app.services.ingest_jobs import get_ingest_job, job_progress, run_ingest_job
+from knowledge_service.app.services.ingestion import DocumentEditForbidden, DocumentVersionConflict
+from knowledge_service.app.services.streaming import charset_from_content_type, ingest_stream
 
 router = APIRouter(prefix="/rag", tags=["RAG Operations"])
 
-@router.post("/ingest-documents", response_model=DocumentIngestResponse)
+@router.post("/ingest-documents", response_model=DocumentIngestResponse, status_code=status.HTTP_202_ACCEPTED)
 def ingest_documents(
     req: DocumentIngestRequest,
     current_user: RAGUserDep,
     ingestor: RAGDocumentIngestor,
+    background_tasks: BackgroundTasks,
+    response: Response,
 ):
+    """
+    Документ и чанки записываются сразу, эмбеддинги считаются в фоне: ответ 202 с job_id,
+    прогресс — GET /rag/ingest-jobs/{job_id}. До расчёта эмбеддингов чанки в поиск не попадают.
+    """
     result: DocumentIngestResponse
 
     if not current_user or not current_user.company_id:
         raise HTTPException(status_code=400, detail="Invalid user context")
 
     try:
-        result = ingestor.ingest(
-            text=req.text,
+        job = ingestor.enqueue(req, company_id=current_user.company_id, owner_id=current_user.id)
+        # В режиме worker эмбеддинги считает пул обработчиков, разбуженный NOTIFY из enqueue
+        if config.INGEST_EMBEDDING_EXECUTOR == "background":
+            background_tasks.add_task(run_ingest_job, job.id)
+        result = DocumentIngestResponse(
+            document_id=job.document_id,
+            title=req.title,
+            status="accepted",
+            job_id=job.id,
+        )
+    except Exception as e:
+        ingestor.db.rollback()
+        response.status_code = status.HTTP_200_OK
+        result = DocumentIngestResponse(
+            document_id=None,
             title=req.title,
+            status="failed",
+            error=str(e)
+        )
+
+    return result
+
+@router.post("/ingest-documents/stream", response_model=DocumentIngestResponse, status_code=status.HTTP_202_ACCEPTED)
+async def ingest_document_stream(
+    request: Request,
+    current_user: RAGUserDep,
+    ingestor: RAGDocumentIngestor,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    title: str = Query(..., max_length=512, description="Заголовок документа"),
+    source_type: SourceType = Query(SourceType.FILE, description="Тип источника"),
+    access_level: DocAccessLevel = Query(DocAccessLevel.RESTRICTED, description="Уровень доступа"),
+):
+    """
+    Потоковая загрузка: текст документа — сырое тело запроса (в т.ч. chunked), метаданные — в query.
+    Предложения и чанки выделяются по мере поступления байтов, память не зависит от размера файла.
+    Дальше — как /ingest-documents: 202 с job_id, эмбеддинги в фоне.
+    """
+    result: DocumentIngestResponse
+
+    if not current_user or not current_user.company_id:
+        raise HTTPException(status_code=400, detail="Invalid user context")
+
+    try:
+        job = await ingest_stream(
+            ingestor,
+            request.stream(),
+            title=title,
+            source_type=source_type,
+            access_level=access_level,
             company_id=current_user.company_id,
             owner_id=current_user.id,
-            source_type=req.source_type,
-            access_level=req.access_level,
+            encoding=charset_from_content_type(request.headers.get("content-type")),
+        )
+        if config.INGEST_EMBEDDING_EXECUTOR == "background":
+            background_tasks.add_task(run_ingest_job, job.id)
+        result = DocumentIngestResponse(
+            document_id=job.document_id,
+            title=title,
+            status="accepted",
+            job_id=job.id,
         )
     except Exception as e:
+        ingestor.db.rollback()
+        response.status_code = status.HTTP_200_OK
         result = DocumentIngestResponse(
             document_id=None,
-            title=req.title,
+            title=title,
             status="failed",
             error=str(e)
         )
 
     return result
 
+@router.put("/documents/{document_id}", response_model=DocumentUpdateResponse)
+def update_document(
+    document_id: uuid.UUID,
+    req: DocumentUpdateRequest,
+    current_user: RAGUserDep,
+    ingestor: RAGDocumentIngestor,
+    background_tasks: BackgroundTasks,
+    response: Response,
+):
+    """
+    Новая версия текста документа. Пересчитываются только эмбеддинги изменённых чанков:
+    если такие есть — ответ 202 с job_id (как у /ingest-documents), иначе 200.
+    version в запросе — ожидаемая текущая версия (409, если документ успели изменить).
+    Менять текст может владелец, сотрудник компании (INTERNAL/PUBLIC) или держатель гранта EDITOR, иначе 403.
+    """
+    if not current_user or not current_user.company_id:
+        raise HTTPException(status_code=400, detail="Invalid user context")
+
+    try:
+        result = ingestor.update(document_id, req, user=current_user)
+    except DocumentEditForbidden as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except DocumentVersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    if result.status == "accepted":
+        if config.INGEST_EMBEDDING_EXECUTOR == "background":
+            background_tasks.add_task(run_ingest_job, result.job_id)
+        response.status_code = status.HTTP_202_ACCEPTED
+    return result
+
+@router.get("/ingest-jobs/{job_id}", response_model=IngestJobResponse)
+def ingest_job_status(
+    job_id: uuid.UUID,
+    current_user: RAGUserDep,
+    db: DbSessionDep,
+):
+    if not current_user or not current_user.company_id:
+        raise HTTPException(status_code=400, detail="Invalid user context")
+
+    job = get_ingest_job(db, job_id, company_id=current_user.company_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job_progress(db, job)
+
 @router.post("/query", response_model=RAGResponse)
-def query(
+async def query(
     rag_query: RAGQuery,
     pipeline: RAGPipelineDep,
     current_user: RAGUserDep,
@@ -49,7 +176,96 @@ def query(
     if not current_user or not current_user.company_id:
         raise HTTPException(status_code=400, detail="Invalid user context")
 
-    return pipeline.iterative_answer(user=current_user, doc_ids=rag_query.doc_ids, question=rag_query.question);
+    return await pipeline.aiterative_answer(
+        user=current_user,
+        doc_ids=rag_query.doc_ids,
+        question=rag_query.question,
+        strategy=rag_query.strategy,
+        conversation_id=rag_query.conversation_id
+    )
+
+@router.post("/query/stream")
+async def query_stream(
+    rag_query: RAGQuery,
+    pipeline: RAGPipelineDep,
+    current_user: RAGUserDep,
+):
+    """
+    Тот же запрос, что /query, но в виде Server-Sent Events:
+    sources, facts по каждому документу, answer / answer_delta и итоговый done с RAGResponse.
+    """
+    if not current_user or not current_user.company_id:
+        raise HTTPException(status_code=400, detail="Invalid user context")
+
+    async def events():
+        try:
+            async for event, payload in pipeline.aiterative_answer_stream(
+                user=current_user,
+                doc_ids=rag_query.doc_ids,
+                question=rag_query.question,
+                strategy=rag_query.strategy,
+                conversation_id=rag_query.conversation_id
+            ):
+                yield format_sse(event, payload)
+        finally:
+            # Сессия зависимости закрывается до начала потока — закрываем повторно, когда поток завершён
+            await pipeline.db.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/search", response_model=RAGSearchResponse)
+async def search(
+    search_query: RAGSearchQuery,
+    pipeline: RAGPipelineDep,
+    current_user: RAGUserDep,
+):
+    """
+    Ранжированные чанки без вызовов LLM (тот же поиск и контроль доступа, что у /query).
+    Следующая страница — тот же вопрос с cursor = next_cursor.
+    """
+    if not current_user or not current_user.company_id:
+        raise HTTPException(status_code=400, detail="Invalid user context")
+
+    try:
+        return await pipeline.asearch(
+            user=current_user,
+            question=search_query.question,
+            limit=search_query.limit,
+            cursor=search_query.cursor,
+            include_text=search_query.include_text,
+            doc_ids=search_query.doc_ids
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def require_internal_user(current_user: User) -> None:
+    """Метрики процесса общие для всех компаний: доступны только сотрудникам (INTERNAL)"""
+    if not current_user or current_user.user_type != UserType.INTERNAL:
+        raise HTTPException(status_code=403, detail="Internal users only")
+
+@router.get("/cache-stats")
+def cache_stats(current_user: RAGUserDep):
+    """
+    Метрики кэшей: попадания, размер, занимаемая память.
+    """
+    require_internal_user(current_user)
+    reranker = get_chunk_reranker()
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "access_sets": access_set_cache.stats(),
+        "rerank_scores": reranker.stats() if reranker else None,
+        "answers": answer_cache.stats(),
+        "conversations": conversation_store.stats(),
+    }
+
+@router.get("/embedding-stats")
+def embedding_stats(current_user: RAGUserDep):
+    """
+    Метрики очереди кодирования вопросов: глубина очереди, размеры партий, время ожидания.
+    """
+    require_internal_user(current_user)
+    query_encoder = get_query_encoder()
+    return {"query_encoder": query_encoder.stats() if query_encoder else None}
 
 class HealthResponse(BaseModel):
     status: str
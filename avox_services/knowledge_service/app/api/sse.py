@@ -0,0 +1,20 @@
+import json
+from typing import Any
+
+from pydantic import BaseModel
+
+# Заголовки, без которых прокси (nginx) буферизует поток целиком
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(event: str, payload: Any) -> str:
+    """
+    Одно событие Server-Sent Events: поле event и JSON в data.
+    """
+    if isinstance(payload, BaseModel):
+        payload = payload.model_dump(mode="json")
+    data = json.dumps(payload, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {data}\n\n"
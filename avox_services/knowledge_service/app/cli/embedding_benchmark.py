@@ -0,0 +1,120 @@
+"""
+Сравнение рантаймов модели эмбеддингов (torch и onnx): пропускная способность на партиях,
+задержка одиночного запроса (как encode вопроса) и расхождение векторов с torch.
+
+Тексты — из файла (по одному в строке) или чанки из базы.
+
+    python -m knowledge_service.app.cli.embedding_benchmark --texts 512 --onnx-file onnx/model_qint8_avx512_vnni.onnx
+"""
+import argparse
+import statistics
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+from sentence_transformers import SentenceTransformer
+
+from knowledge_service.app.core import config
+from knowledge_service.app.embeddings.registry import load_sentence_transformer
+
+SAMPLE_TEXTS = [
+    "Как оформить ежегодный оплачиваемый отпуск?",
+    "Договор поставки № 123/45-А действует до 31 декабря 2025 года.",
+    "Сотрудник обязан уведомить руководителя о болезни в первый день нетрудоспособности.",
+    "The API gateway forwards RAG queries to the knowledge service.",
+    "Код продукта AB-1234 снят с производства, замена — AB-1240.",
+    "Командировочные расходы возмещаются по авансовому отчёту в течение 10 рабочих дней.",
+    "Доступ к документам отдела выдаётся через группу в настройках компании.",
+    "ООО «Ромашка» является дистрибьютором в Северо-Западном регионе.",
+]
+
+CHUNK_TEXTS_SQL = """
+SELECT chunk_text
+FROM document_chunks
+ORDER BY random()
+LIMIT :limit
+"""
+
+
+def load_texts(path: Optional[str], limit: int) -> List[str]:
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()][:limit]
+
+    from knowledge_service.app.db.session import SessionLocal
+
+    db = SessionLocal()
+    try:
+        texts = [row[0] for row in db.execute(text(CHUNK_TEXTS_SQL), {"limit": limit})]
+    finally:
+        db.close()
+    return texts or SAMPLE_TEXTS
+
+
+def vector_agreement(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """
+    Косинусная близость векторов одного текста в двух рантаймах и максимальное отклонение компоненты.
+    """
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = np.sum(reference * candidate, axis=1)
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "max_abs_diff": float(np.abs(reference - candidate).max()),
+    }
+
+
+def measure(model: SentenceTransformer, texts: List[str], batch_size: int, single_queries: int) -> Dict[str, float]:
+    model.encode(texts[:batch_size], batch_size=batch_size)  # прогрев
+
+    start = time.perf_counter()
+    model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    throughput = len(texts) / (time.perf_counter() - start)
+
+    latencies = []
+    for question in texts[:single_queries]:
+        start = time.perf_counter()
+        model.encode([question], convert_to_numpy=True)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "texts_per_s": throughput,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк рантаймов модели эмбеддингов")
+    parser.add_argument("--model", default=config.EMBEDDING_MODEL_NAME)
+    parser.add_argument("--onnx-path", default=config.EMBEDDING_ONNX_PATH)
+    parser.add_argument("--onnx-file", default=config.EMBEDDING_ONNX_FILE)
+    parser.add_argument("--texts", type=int, default=512, help="сколько текстов брать из файла или базы")
+    parser.add_argument("--texts-file", default=None)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--single-queries", type=int, default=100)
+    args = parser.parse_args()
+
+    texts = load_texts(args.texts_file, args.texts)
+    models = {
+        "torch": load_sentence_transformer(args.model, "torch"),
+        "onnx": load_sentence_transformer(args.model, "onnx", args.onnx_path, args.onnx_file),
+    }
+
+    print(f"texts={len(texts)} batch_size={args.batch_size} onnx_file={args.onnx_file}")
+    print(f"{'backend':<8}{'texts/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for backend, model in models.items():
+        result = measure(model, texts, args.batch_size, args.single_queries)
+        print(f"{backend:<8}{result['texts_per_s']:>10.1f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}")
+
+    agreement = vector_agreement(
+        models["torch"].encode(texts, batch_size=args.batch_size, convert_to_numpy=True),
+        models["onnx"].encode(texts, batch_size=args.batch_size, convert_to_numpy=True),
+    )
+    print("onnx vs torch: " + ", ".join(f"{k}={v:.5f}" for k, v in agreement.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Пул обработчиков PENDING-эмбеддингов асинхронного инжеста (INGEST_EMBEDDING_EXECUTOR=worker).
+
+Каждый процесс держит свою модель и соединение, забирает партии через FOR UPDATE SKIP LOCKED и,
+пока очередь пуста, ждёт NOTIFY от /rag/ingest-documents. Процессы одного и разных хостов берут
+непересекающиеся партии, поэтому пропускная способность растёт с числом ядер и хостов.
+
+    python -m knowledge_service.app.cli.embedding_worker --processes 4 --batch 256
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from typing import Optional
+
+import psycopg
+from psycopg import sql
+
+from knowledge_service.app.core import config
+from knowledge_service.app.db.session import SessionLocal, engine
+from knowledge_service.app.services.ingest_jobs import sync_ingest_jobs
+from knowledge_service.app.services.ingestion import DocumentIngestor
+
+logger = logging.getLogger("embedding_worker")
+
+
+def listen_connection(channel: str) -> psycopg.Connection:
+    """Отдельное autocommit-соединение psycopg 3 под LISTEN (сессия SQLAlchemy для этого не подходит)"""
+    url = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+    conn = psycopg.connect(url, autocommit=True)
+    conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+    return conn
+
+
+def wait_for_notify(conn: psycopg.Connection, timeout: float, stop_event) -> None:
+    """Ждёт уведомления не дольше timeout; короткие интервалы — чтобы быстро заметить остановку"""
+    deadline = time.monotonic() + timeout
+    while not stop_event.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        for _ in conn.notifies(timeout=min(remaining, 1.0), stop_after=1):
+            return
+
+
+def run_worker(index: int, batch_size: int, idle_timeout: float, stop_event) -> None:
+    # Остановку координирует родительский процесс через stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s worker-{index} %(levelname)s %(message)s")
+
+    db = SessionLocal()
+    listener = listen_connection(config.EMBEDDING_NOTIFY_CHANNEL)
+    ingestor = DocumentIngestor(db)
+    logger.info(f"started: batch={batch_size}, threads={config.EMBEDDING_THREADS}")
+    try:
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            batch = ingestor.embed_pending(limit=batch_size)
+            if batch.claimed:
+                sync_ingest_jobs(db, batch.document_ids)
+                db.commit()
+                elapsed = time.perf_counter() - start
+                logger.info(
+                    f"batch: {batch.completed} embedded ({batch.reused} reused), {batch.retried} retry, {batch.failed} failed "
+                    f"in {elapsed:.2f}s ({batch.claimed / elapsed:.1f} subchunks/s)"
+                )
+                continue
+
+            # Очередь пуста: спим до NOTIFY, ближайшего повтора или idle_timeout
+            delay: Optional[float] = ingestor.next_pending_delay()
+            timeout = idle_timeout if delay is None else min(max(delay, 0.1), idle_timeout)
+            wait_for_notify(listener, timeout, stop_event)
+    finally:
+        listener.close()
+        db.close()
+        logger.info("stopped")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пул обработчиков PENDING-эмбеддингов")
+    parser.add_argument("--processes", type=int, default=config.EMBEDDING_WORKER_PROCESSES)
+    parser.add_argument("--batch", type=int, default=config.EMBEDDING_WORKER_BATCH_SIZE,
+                        help="подчанков в одной партии (один проход модели)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="потоков модели на процесс; по умолчанию ядра / процессы")
+    parser.add_argument("--idle-timeout", type=float, default=config.EMBEDDING_WORKER_IDLE_TIMEOUT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s main %(levelname)s %(message)s")
+
+    # Ядра делятся между процессами: иначе каждый проход модели занимает все ядра
+    threads = args.threads or config.EMBEDDING_THREADS or max(1, (os.cpu_count() or 1) // args.processes)
+    os.environ["EMBEDDING_THREADS"] = str(threads)
+
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    workers = [
+        ctx.Process(
+            target=run_worker,
+            args=(i, args.batch, args.idle_timeout, stop_event),
+            name=f"embedding-worker-{i}",
+        )
+        for i in range(args.processes)
+    ]
+
+    def stop(signum, frame):
+        logger.info("stopping workers")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for worker in workers:
+        worker.start()
+    logger.info(f"{len(workers)} workers, {threads} threads each")
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
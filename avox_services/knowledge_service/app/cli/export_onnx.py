@@ -0,0 +1,54 @@
+"""
+Экспорт модели эмбеддингов в ONNX (опционально — с динамической int8-квантизацией) для EMBEDDING_BACKEND=onnx.
+После экспорта векторы сверяются с torch-моделью: при косинусной близости ниже --min-cosine команда завершается ошибкой.
+
+    python -m knowledge_service.app.cli.export_onnx --quantize avx512_vnni
+    EMBEDDING_BACKEND=onnx EMBEDDING_ONNX_FILE=onnx/model_qint8_avx512_vnni.onnx ...
+"""
+import argparse
+import sys
+
+from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+from knowledge_service.app.cli.embedding_benchmark import SAMPLE_TEXTS, vector_agreement
+from knowledge_service.app.core import config
+from knowledge_service.app.embeddings.registry import load_sentence_transformer
+
+QUANTIZATION_CONFIGS = ("arm64", "avx2", "avx512", "avx512_vnni")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Экспорт модели эмбеддингов в ONNX")
+    parser.add_argument("--model", default=config.EMBEDDING_MODEL_NAME)
+    parser.add_argument("--output", default=config.EMBEDDING_ONNX_PATH)
+    parser.add_argument("--quantize", choices=QUANTIZATION_CONFIGS, default=None,
+                        help="динамическая int8-квантизация под набор инструкций CPU")
+    parser.add_argument("--min-cosine", type=float, default=None,
+                        help="допуск расхождения с torch (по умолчанию 0.999 для fp32, 0.99 для int8)")
+    args = parser.parse_args()
+
+    # backend="onnx" без готового файла экспортирует модель через optimum; сохраняется вместе с токенайзером и пулингом
+    model = SentenceTransformer(args.model, backend="onnx")
+    model.save_pretrained(args.output)
+    onnx_file = "onnx/model.onnx"
+    print(f"exported {args.model} -> {args.output}/{onnx_file}")
+
+    if args.quantize:
+        export_dynamic_quantized_onnx_model(model, args.quantize, args.output)
+        onnx_file = f"onnx/model_qint8_{args.quantize}.onnx"
+        print(f"quantized -> {args.output}/{onnx_file}")
+
+    min_cosine = args.min_cosine or (0.99 if args.quantize else 0.999)
+    reference = load_sentence_transformer(args.model, "torch").encode(SAMPLE_TEXTS, convert_to_numpy=True)
+    exported = load_sentence_transformer(args.model, "onnx", args.output, onnx_file)
+    agreement = vector_agreement(reference, exported.encode(SAMPLE_TEXTS, convert_to_numpy=True))
+    print("onnx vs torch: " + ", ".join(f"{k}={v:.5f}" for k, v in agreement.items()))
+
+    if agreement["min_cosine"] < min_cosine:
+        print(f"min_cosine below tolerance {min_cosine}")
+        sys.exit(1)
+    print(f"EMBEDDING_BACKEND=onnx EMBEDDING_ONNX_PATH={args.output} EMBEDDING_ONNX_FILE={onnx_file}")
+
+
+if __name__ == "__main__":
+    main()
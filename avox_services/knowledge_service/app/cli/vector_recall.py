@@ -0,0 +1,153 @@
+"""
+Сравнение recall и задержки поиска по полному вектору и по компактным представлениям (halfvec / binary).
+Компактное представление сравнивается, если его колонка есть в схеме.
+
+Эталон — точный перебор без индекса. Запросы — вопросы из файла (по одному в строке)
+или случайные эмбеддинги из базы (сама строка-запрос из выдачи исключается).
+
+    python -m knowledge_service.app.cli.vector_recall --k 10 --queries 200 --rescore-factor 4
+"""
+import argparse
+import statistics
+import time
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from knowledge_service.app.cli.vector_storage import COLUMNS_SQL, QUANTIZED_COLUMNS
+from knowledge_service.app.db.session import SessionLocal
+from knowledge_service.app.retrieval.config import HNSW_MAX_EF_SEARCH, VECTOR_STORAGES
+from knowledge_service.app.retrieval.engine import APPROX_DISTANCES
+
+SAMPLE_QUERIES_SQL = """
+SELECT id, CAST(vector AS text) AS vector
+FROM chunk_embeddings_384
+WHERE status = 'COMPLETED'
+ORDER BY random()
+LIMIT :limit
+"""
+
+EXACT_SQL = """
+SELECT id
+FROM chunk_embeddings_384 emb
+WHERE emb.status = 'COMPLETED'
+  AND emb.id <> CAST(:exclude_id AS uuid)
+ORDER BY emb.vector <=> CAST(:query_vector AS vector)
+LIMIT :k
+"""
+
+# Текущая схема: тот же запрос, но через индекс по полному вектору
+FULL_SQL = EXACT_SQL
+
+QUANTIZED_SQL = """
+WITH approx AS (
+    SELECT emb.id
+    FROM chunk_embeddings_384 emb
+    WHERE emb.status = 'COMPLETED'
+      AND emb.id <> CAST(:exclude_id AS uuid)
+    ORDER BY {approx_distance}
+    LIMIT :approx_limit
+)
+SELECT emb.id
+FROM approx a
+JOIN chunk_embeddings_384 emb ON emb.id = a.id
+ORDER BY emb.vector <=> CAST(:query_vector AS vector)
+LIMIT :k
+"""
+
+INDEX_SIZES_SQL = """
+SELECT indexname, pg_size_pretty(pg_relation_size(CAST(schemaname || '.' || indexname AS regclass))) AS size
+FROM pg_indexes
+WHERE tablename = 'chunk_embeddings_384'
+  AND (indexdef ILIKE '%USING hnsw%' OR indexdef ILIKE '%USING ivfflat%')
+ORDER BY indexname
+"""
+
+NO_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def load_queries(db: Session, questions_path: Optional[str], limit: int) -> List[Dict[str, str]]:
+    if questions_path:
+        from knowledge_service.app.embeddings import embedding_registry
+
+        with open(questions_path, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()][:limit]
+        vectors = embedding_registry.get_embedder().encode(questions)
+        return [{"id": NO_ID, "vector": [float(x) for x in vector]} for vector in vectors]
+
+    rows = db.execute(text(SAMPLE_QUERIES_SQL), {"limit": limit}).mappings().all()
+    return [{"id": str(row["id"]), "vector": row["vector"]} for row in rows]
+
+
+def _search(db: Session, sql: str, params: Dict, settings: Sequence[str]) -> List[str]:
+    for statement in settings:
+        db.execute(text(statement))
+    ids = [str(row[0]) for row in db.execute(text(sql), params)]
+    db.rollback()  # SET LOCAL действует до конца транзакции
+    return ids
+
+
+def benchmark(db: Session, queries: List[Dict], k: int, rescore_factor: int, ef_search: Optional[int]) -> None:
+    approx_limit = k * rescore_factor
+    ef = min(ef_search or approx_limit, HNSW_MAX_EF_SEARCH)
+
+    exact = []
+    for query in queries:
+        params = {"query_vector": query["vector"], "exclude_id": query["id"], "k": k}
+        # Эталон: без индекса расстояние считается для всех строк
+        exact.append(set(_search(db, EXACT_SQL, params, ["SET LOCAL enable_indexscan = off"])))
+
+    print(f"queries={len(queries)} k={k} rescore_factor={rescore_factor} ef_search={ef}")
+    print(f"{'storage':<10}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    # Компактная колонка есть только для настроенного режима (см. app/cli/vector_storage.py)
+    columns = {row[0] for row in db.execute(text(COLUMNS_SQL))}
+    storages = [s for s in VECTOR_STORAGES if s not in QUANTIZED_COLUMNS or QUANTIZED_COLUMNS[s][0] in columns]
+    for storage in storages:
+        if storage in APPROX_DISTANCES:
+            sql = QUANTIZED_SQL.format(approx_distance=APPROX_DISTANCES[storage])
+        else:
+            sql = FULL_SQL
+        recalls, latencies = [], []
+        for query, expected in zip(queries, exact):
+            params = {
+                "query_vector": query["vector"],
+                "exclude_id": query["id"],
+                "k": k,
+                "approx_limit": approx_limit,
+            }
+            start = time.perf_counter()
+            found = _search(db, sql, params, [f"SET LOCAL hnsw.ef_search = {ef}"])
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(expected.intersection(found)) / len(expected) if expected else 1.0)
+
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{storage:<10}{statistics.mean(recalls):>10.3f}{statistics.median(latencies):>10.1f}{p95:>10.1f}")
+
+    print("\nindex sizes:")
+    for row in db.execute(text(INDEX_SIZES_SQL)).mappings():
+        print(f"  {row['indexname']:<32}{row['size']:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall квантованного поиска относительно точного перебора")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--ef-search", type=int, default=None)
+    parser.add_argument("--questions", default=None, help="файл с вопросами, по одному в строке")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        queries = load_queries(db, args.questions, args.queries)
+        if not queries:
+            print("no completed embeddings found")
+            return
+        benchmark(db, queries, args.k, args.rescore_factor, args.ef_search)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Перевод схемы chunk_embeddings_384 на режим хранения векторов (VECTOR_STORAGE).
+
+Миграция создаёт компактную колонку и индекс только для режима, заданного при её применении;
+для смены режима на работающей базе: добавляет колонку и HNSW-индекс нового режима, удаляет
+колонку прежнего и индекс по полному вектору (--keep-full-index оставляет его), при full — возвращает его.
+
+    python -m knowledge_service.app.cli.vector_storage --storage halfvec
+"""
+import argparse
+from typing import List, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from knowledge_service.app.core import config
+from knowledge_service.app.db.session import SessionLocal
+from knowledge_service.app.models.core.document import VECTOR_BIT_EXPRESSION, VECTOR_HALF_EXPRESSION
+from knowledge_service.app.retrieval.config import VECTOR_STORAGES
+
+# Режим -> (колонка, тип, выражение, operator class)
+QUANTIZED_COLUMNS = {
+    "halfvec": ("vector_half", "halfvec(384)", VECTOR_HALF_EXPRESSION, "halfvec_cosine_ops"),
+    "binary": ("vector_bit", "bit(384)", VECTOR_BIT_EXPRESSION, "bit_hamming_ops"),
+}
+
+COLUMNS_SQL = """
+SELECT column_name
+FROM information_schema.columns
+WHERE table_schema = 'kno' AND table_name = 'chunk_embeddings_384'
+"""
+
+INDEXES_SQL = """
+SELECT indexname
+FROM pg_indexes
+WHERE schemaname = 'kno' AND tablename = 'chunk_embeddings_384'
+"""
+
+
+def full_index_ddl() -> str:
+    if config.VECTOR_INDEX_TYPE == "hnsw":
+        return (
+            "CREATE INDEX ix_chunk_vector_hnsw ON chunk_embeddings_384 USING hnsw (vector vector_cosine_ops) "
+            f"WITH (m = {config.HNSW_M}, ef_construction = {config.HNSW_EF_CONSTRUCTION})"
+        )
+    return (
+        "CREATE INDEX ix_chunk_vector_cosine ON chunk_embeddings_384 USING ivfflat (vector vector_cosine_ops) "
+        f"WITH (lists = {config.IVFFLAT_LISTS})"
+    )
+
+
+def plan(storage: str, columns: Set[str], indexes: Set[str], keep_full_index: bool) -> List[str]:
+    """DDL-команды перехода от текущей схемы к режиму storage"""
+    statements = []
+    for mode, (column, column_type, expression, ops) in QUANTIZED_COLUMNS.items():
+        if mode == storage and column not in columns:
+            statements.append(
+                f"ALTER TABLE chunk_embeddings_384 ADD COLUMN {column} {column_type} "
+                f"GENERATED ALWAYS AS ({expression}) STORED"
+            )
+            statements.append(
+                f"CREATE INDEX ix_chunk_{column}_hnsw ON chunk_embeddings_384 USING hnsw ({column} {ops}) "
+                f"WITH (m = {config.HNSW_M}, ef_construction = {config.HNSW_EF_CONSTRUCTION})"
+            )
+        elif mode != storage and column in columns:
+            # Индекс по колонке удаляется вместе с ней
+            statements.append(f"ALTER TABLE chunk_embeddings_384 DROP COLUMN {column}")
+
+    full_indexes = indexes & {"ix_chunk_vector_hnsw", "ix_chunk_vector_cosine"}
+    if storage == "full" and not full_indexes:
+        statements.append(full_index_ddl())
+    elif storage != "full" and not keep_full_index:
+        statements.extend(f"DROP INDEX {index}" for index in sorted(full_indexes))
+    return statements
+
+
+def apply(db: Session, storage: str, keep_full_index: bool, dry_run: bool) -> List[str]:
+    columns = {row[0] for row in db.execute(text(COLUMNS_SQL))}
+    indexes = {row[0] for row in db.execute(text(INDEXES_SQL))}
+    statements = plan(storage, columns, indexes, keep_full_index)
+    if dry_run:
+        return statements
+    for statement in statements:
+        db.execute(text(statement))
+    db.commit()
+    return statements
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Схема хранения векторов под режим VECTOR_STORAGE")
+    parser.add_argument("--storage", choices=VECTOR_STORAGES, default=config.VECTOR_STORAGE)
+    parser.add_argument("--keep-full-index", action="store_true", help="не удалять индекс по полному вектору")
+    parser.add_argument("--dry-run", action="store_true", help="только показать DDL")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        statements = apply(db, args.storage, args.keep_full_index, args.dry_run)
+    finally:
+        db.close()
+    for statement in statements:
+        print(statement)
+    if not statements:
+        print(f"schema already matches storage={args.storage}")
+
+
+if __name__ == "__main__":
+    main()
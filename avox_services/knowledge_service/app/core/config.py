@@ -1,3 +1,4 @@
+import json
 import os
 from urllib.parse import urlparse, urlunparse
 
@@ -51,10 +52,24 @@ def get_database_url():
     # Фолбэк URL
     return f"postgresql+{db_driver}://postgres:{password}@localhost:5432/avox_kno"
 
+
+def with_db_driver(db_url: str, db_driver: str) -> str:
+    """
+    Тот же URL с другим драйвером (postgresql+<driver>).
+    """
+    parsed = urlparse(db_url)
+    return urlunparse(parsed._replace(scheme=f"postgresql+{db_driver}"))
+
+
 PROJECT_NAME = os.getenv("PROJECT_NAME", "AVOX Knowledge")
 PROJECT_VERSION = os.getenv("PROJECT_VERSION", "0.1.0")
 REDIS_URL = os.getenv("REDIS_URL")
 DATABASE_URL = get_database_url()
+# Async-движок (AsyncSession): psycopg 3 работает и в async-режиме и адаптирует списки для CAST(... AS vector)
+ASYNC_DB_DRIVER = os.getenv("ASYNC_DB_DRIVER", "psycopg")
+ASYNC_DATABASE_URL = with_db_driver(DATABASE_URL, ASYNC_DB_DRIVER)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
 
 # LLM Configuration
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openrouter")
@@ -63,4 +78,115 @@ VLLM_MODEL_PATH = os.getenv("VLLM_MODEL_PATH", "local/t5-model")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL")
 OPENROUTER_SITE_URL = os.getenv("OPENROUTER_SITE_URL", "")
-OPENROUTER_SITE_NAME = os.getenv("OPENROUTER_SITE_URL", "")
\ No newline at end of file
+OPENROUTER_SITE_NAME = os.getenv("OPENROUTER_SITE_URL", "")
+
+# Embeddings
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_PRELOAD = os.getenv("EMBEDDING_PRELOAD", "true").lower() == "true"
+# Рантайм модели эмбеддингов (EMBEDDING_BACKEND: torch | onnx). Для onnx модель экспортируется заранее
+# (python -m knowledge_service.app.cli.export_onnx) в EMBEDDING_ONNX_PATH; EMBEDDING_ONNX_FILE — файл внутри,
+# например onnx/model_qint8_avx512_vnni.onnx для int8
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_PATH = os.getenv("EMBEDDING_ONNX_PATH", os.path.join(project_dir, "models", "onnx"))
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model.onnx")
+# Потоки внутри одного прохода модели (torch.set_num_threads / intra_op_num_threads); пусто — по умолчанию рантайма
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS")) if os.getenv("EMBEDDING_THREADS") else None
+# Микробатчинг вопросов: одновременные запросы кодируются одной партией (до EMBEDDING_BATCH_SIZE
+# текстов или EMBEDDING_BATCH_MAX_WAIT_MS ожидания)
+EMBEDDING_BATCHING_ENABLED = os.getenv("EMBEDDING_BATCHING_ENABLED", "false").lower() == "true"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+# Инжест: подчанки всех документов кодируются одним проходом партиями по INGEST_ENCODE_BATCH_SIZE,
+# чанки и эмбеддинги пишутся одной транзакцией (INGEST_WRITE_METHOD: insert — многострочный INSERT, copy — COPY)
+INGEST_ENCODE_BATCH_SIZE = int(os.getenv("INGEST_ENCODE_BATCH_SIZE", "128"))
+INGEST_WRITE_METHOD = os.getenv("INGEST_WRITE_METHOD", "insert")
+# Векторы подчанков, текст которых уже встречался (sha256 нормализованного текста + модель), берутся из БД
+INGEST_DEDUP_ENABLED = os.getenv("INGEST_DEDUP_ENABLED", "true").lower() == "true"
+# Потоковая загрузка (/rag/ingest-documents/stream): чанки пишутся в БД партиями по INGEST_STREAM_BATCH_CHUNKS
+INGEST_STREAM_BATCH_CHUNKS = int(os.getenv("INGEST_STREAM_BATCH_CHUNKS", "200"))
+# Кто считает PENDING-эмбеддинги асинхронного инжеста (INGEST_EMBEDDING_EXECUTOR): background — BackgroundTasks
+# процесса API, worker — только пул python -m knowledge_service.app.cli.embedding_worker (будится NOTIFY)
+INGEST_EMBEDDING_EXECUTOR = os.getenv("INGEST_EMBEDDING_EXECUTOR", "background")
+EMBEDDING_NOTIFY_CHANNEL = os.getenv("EMBEDDING_NOTIFY_CHANNEL", "kno_embeddings_pending")
+EMBEDDING_WORKER_PROCESSES = int(os.getenv("EMBEDDING_WORKER_PROCESSES", "2"))
+EMBEDDING_WORKER_BATCH_SIZE = int(os.getenv("EMBEDDING_WORKER_BATCH_SIZE", "256"))
+# Без уведомлений обработчик всё равно просыпается раз в EMBEDDING_WORKER_IDLE_TIMEOUT секунд
+EMBEDDING_WORKER_IDLE_TIMEOUT = float(os.getenv("EMBEDDING_WORKER_IDLE_TIMEOUT", "30"))
+# Повтор партии после ошибки модели: задержка EMBEDDING_RETRY_BACKOFF * 2^attempts (не больше _MAX) секунд,
+# после EMBEDDING_MAX_ATTEMPTS попыток эмбеддинг помечается FAILED
+EMBEDDING_MAX_ATTEMPTS = int(os.getenv("EMBEDDING_MAX_ATTEMPTS", "5"))
+EMBEDDING_RETRY_BACKOFF = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "10"))
+EMBEDDING_RETRY_BACKOFF_MAX = float(os.getenv("EMBEDDING_RETRY_BACKOFF_MAX", "600"))
+
+# Query embedding cache (backend: memory | redis)
+QUERY_EMBEDDING_CACHE_BACKEND = os.getenv("QUERY_EMBEDDING_CACHE_BACKEND", "memory")
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+QUERY_EMBEDDING_CACHE_TTL = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+
+# Vector index (VECTOR_INDEX_TYPE: hnsw | ivfflat)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+
+# Ширина поиска по индексу на запрос (SET LOCAL); пусто — подбирается по числу кандидатов
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH")) if os.getenv("HNSW_EF_SEARCH") else None
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES")) if os.getenv("IVFFLAT_PROBES") else None
+# Фильтр доступа применяется к строкам, уже отданным индексом: без итеративного сканирования (pgvector >= 0.8)
+# пользователь с малой долей документов компании получает неполную выдачу. off — для pgvector < 0.8
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN", "relaxed_order")  # off | relaxed_order | strict_order
+
+# Представление векторов для первого этапа поиска (VECTOR_STORAGE: full | halfvec | binary).
+# halfvec / binary ищут по компактному индексу и пересчитывают VECTOR_RESCORE_FACTOR × кандидатов по полному вектору.
+# Определяет схему: компактная колонка и её индекс есть только у этого режима (смена — app/cli/vector_storage.py)
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full")
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+
+# Режим поиска (RETRIEVAL_MODE: vector | hybrid): hybrid объединяет полнотекстовый и векторный поиск через RRF
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+RRF_K = int(os.getenv("RRF_K", "60"))
+FTS_CANDIDATES = int(os.getenv("FTS_CANDIDATES", "50"))
+
+# Переранжирование cross-encoder'ом перед LLM: в обработку идут только RERANK_TOP_DOCUMENTS документов
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_TOP_DOCUMENTS = int(os.getenv("RERANK_TOP_DOCUMENTS", "5"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+RERANK_CACHE_TTL = int(os.getenv("RERANK_CACHE_TTL", "3600"))
+
+# Переопределения параметров поиска по компаниям: {"<company_id>": {"ef_search": 200}}
+RETRIEVAL_TENANT_OVERRIDES = json.loads(os.getenv("RETRIEVAL_TENANT_OVERRIDES", "{}"))
+
+# Кэш наборов доступных документов (ACCESS_VERSION_BACKEND: memory | redis)
+ACCESS_VERSION_BACKEND = os.getenv("ACCESS_VERSION_BACKEND", "memory")
+ACCESS_SET_CACHE_SIZE = int(os.getenv("ACCESS_SET_CACHE_SIZE", "10000"))
+ACCESS_SET_CACHE_TTL = int(os.getenv("ACCESS_SET_CACHE_TTL", "600"))
+# До какого размера набор передаётся в запрос списком id; больше — работает SQL-предикат доступа
+ACCESS_SET_INLINE_LIMIT = int(os.getenv("ACCESS_SET_INLINE_LIMIT", "2000"))
+# Поиск по стольким документам и меньше (RAGQuery.doc_ids или маленький набор доступа) — точный перебор
+# их подчанков вместо общего ANN-индекса
+EXACT_SCAN_MAX_DOCUMENTS = int(os.getenv("EXACT_SCAN_MAX_DOCUMENTS", "50"))
+
+# Семантический кэш ответов: похожий вопрос (cosine >= ANSWER_CACHE_SIMILARITY) при том же наборе доступа
+# и неизменных документах отдаёт сохранённый RAGResponse без поиска и вызовов LLM
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))  # на компанию
+
+# История диалогов (CONVERSATION_BACKEND: memory | redis): бюджет токенов истории в промпте,
+# старые сообщения сворачиваются в краткое содержание в фоне
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "memory")
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1500"))
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", "604800"))
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "10000"))
+# Предел времени вызова LLM при свёртке; блокировка свёртки в Redis живёт дольше на запас
+CONVERSATION_FOLD_TIMEOUT = float(os.getenv("CONVERSATION_FOLD_TIMEOUT", "120"))
+
+# Поиск без LLM (/rag/search): глубже SEARCH_MAX_RESULTS чанков страницы не листаются
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "200"))
+
+# Стратегия ответа по умолчанию (sequential | map_reduce) и предел параллельных вызовов LLM для map_reduce
+RAG_ANSWER_STRATEGY = os.getenv("RAG_ANSWER_STRATEGY", "sequential")
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))
@@ -0,0 +1,25 @@
+import logging
+from typing import Any, Optional
+
+from knowledge_service.app.core import config
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[Any] = None
+
+
+def get_redis() -> Optional[Any]:
+    """
+    Возвращает общий синхронный клиент Redis или None, если Redis не настроен
+    (REDIS_URL пуст) или пакет redis не установлен.
+    """
+    global _client
+    if _client is not None or not config.REDIS_URL:
+        return _client
+    try:
+        import redis
+    except ImportError:
+        logger.warning("REDIS_URL is set but the 'redis' package is not installed")
+        return None
+    _client = redis.Redis.from_url(config.REDIS_URL)
+    return _client
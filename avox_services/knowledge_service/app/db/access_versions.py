@@ -0,0 +1,121 @@
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from knowledge_service.app.core import config
+from knowledge_service.app.core.redis_client import get_redis
+from knowledge_service.app.models.access.access_grant import AccessGrant
+from knowledge_service.app.models.core.company import User
+from knowledge_service.app.models.core.document import Document
+
+if TYPE_CHECKING:
+    from knowledge_service.app.retrieval.access import AccessScope
+
+logger = logging.getLogger(__name__)
+
+
+class AccessVersionStore:
+    """
+    Счётчики версий доступа: по компании (документы) и по пользователю (гранты, тип и компания пользователя).
+    Без Redis версии локальны для процесса — для нескольких реплик нужен ACCESS_VERSION_BACKEND=redis.
+    """
+
+    REDIS_PREFIX = "kno:access:v:"
+
+    def __init__(self, redis_client: Optional[Any] = None):
+        self.redis = redis_client
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _company_key(company_id: Any) -> str:
+        return f"company:{company_id}"
+
+    @staticmethod
+    def _user_key(user_id: Any) -> str:
+        return f"user:{user_id}"
+
+    def get(self, scope: "AccessScope") -> Tuple[int, int]:
+        keys = [self._company_key(scope.company_id), self._user_key(scope.user_id)]
+        if self.redis is not None:
+            try:
+                values = self.redis.mget([self.REDIS_PREFIX + k for k in keys])
+                return tuple(int(v) if v is not None else 0 for v in values)
+            except Exception as e:
+                logger.warning(f"Access version store: redis read failed: {e}")
+        with self._lock:
+            return tuple(self._versions.get(k, 0) for k in keys)
+
+    def bump(self, company_ids: Iterable[Any] = (), user_ids: Iterable[Any] = ()) -> None:
+        keys = [self._company_key(c) for c in company_ids] + [self._user_key(u) for u in user_ids]
+        if not keys:
+            return
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline()
+                for key in keys:
+                    pipe.incr(self.REDIS_PREFIX + key)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Access version store: redis bump failed: {e}")
+
+
+def _pending_changes(session: Session) -> Dict[str, Set[Any]]:
+    return session.info.setdefault("access_changes", {"companies": set(), "users": set()})
+
+
+def mark_access_changed(session: Session, company_ids: Iterable[Any] = (), user_ids: Iterable[Any] = ()) -> None:
+    """
+    Для записей сырым SQL (в обход ORM): версии увеличатся после коммита сессии.
+    Для AsyncSession передаётся db.sync_session.
+    """
+    pending = _pending_changes(session)
+    pending["companies"].update(c for c in company_ids if c is not None)
+    pending["users"].update(u for u in user_ids if u is not None)
+
+
+def _collect_access_changes(session: Session, flush_context: Any) -> None:
+    pending = _pending_changes(session)
+    companies: Set[Any] = pending["companies"]
+    users: Set[Any] = pending["users"]
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Document) and obj.company_id is not None:
+            companies.add(obj.company_id)
+        elif isinstance(obj, AccessGrant) and obj.user_id is not None:
+            users.add(obj.user_id)
+        elif isinstance(obj, User) and obj.id is not None:
+            # Смена user_type или company_id меняет набор доступных документов
+            users.add(obj.id)
+
+
+def _publish_access_changes(session: Session) -> None:
+    pending = session.info.pop("access_changes", None)
+    if pending:
+        access_versions.bump(company_ids=pending["companies"], user_ids=pending["users"])
+
+
+def _drop_access_changes(session: Session) -> None:
+    session.info.pop("access_changes", None)
+
+
+def register_access_invalidation() -> None:
+    """
+    Подписывает сессии SQLAlchemy на изменения Document/AccessGrant/User: после коммита версии увеличиваются.
+    Вызывается при создании фабрик сессий (app/db/session.py), поэтому действует и в CLI.
+    Массовые UPDATE/DELETE в обход ORM версии не меняют — для них нужен mark_access_changed().
+    """
+    if not event.contains(Session, "after_flush", _collect_access_changes):
+        event.listen(Session, "after_flush", _collect_access_changes)
+        event.listen(Session, "after_commit", _publish_access_changes)
+        event.listen(Session, "after_rollback", _drop_access_changes)
+
+
+access_versions = AccessVersionStore(
+    redis_client=get_redis() if config.ACCESS_VERSION_BACKEND == "redis" else None
+)
@@ -1,11 +1,27 @@
+from typing import AsyncIterator
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 
-from knowledge_service.app.core.config import DATABASE_URL
+from knowledge_service.app.core.config import ASYNC_DATABASE_URL, DATABASE_URL, DB_MAX_OVERFLOW, DB_POOL_SIZE
+from knowledge_service.app.db.access_versions import register_access_invalidation
 
 engine = create_engine(DATABASE_URL, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async-путь запросов: соединение не держит поток из threadpool, пока ждём LLM
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# Изменения документов, грантов и пользователей инвалидируют кэш наборов доступа — в API и в CLI
+register_access_invalidation()
+
 def get_db() -> Session:
     """
     FastAPI dependency: yields a SQLAlchemy session and ensures it's closed.
@@ -15,3 +31,10 @@ def get_db() -> Session:
         yield db
     finally:
         db.close()
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    FastAPI dependency: yields an AsyncSession and ensures it's closed.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,37 +1,74 @@
 # AVOX\avox_services\knowledge_service\app\deps.py
 
-from typing import Annotated
+from typing import Annotated, Optional
 
 from fastapi import Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from knowledge_service.app.core import config
-from knowledge_service.app.db.session import get_db
+from knowledge_service.app.db.session import get_async_db, get_db
+from knowledge_service.app.embeddings import (
+    EmbeddingRegistry,
+    MicroBatchingEncoder,
+    QueryEmbeddingCache,
+    get_embedding_registry,
+    get_query_embedding_cache,
+    get_query_encoder,
+)
+from knowledge_service.app.llm.answer_cache import SemanticAnswerCache, get_answer_cache
 from knowledge_service.app.llm.base_provider import BaseLLMProvider
 from knowledge_service.app.llm.provider_factory import get_llm_provider
 from knowledge_service.app.llm.rag_pipeline import KnowledgeRAGPipeline
 from knowledge_service.app.models.core.company import User
+from knowledge_service.app.retrieval import (
+    AccessSetCache,
+    ChunkReranker,
+    RetrievalConfig,
+    get_access_set_cache,
+    get_chunk_reranker,
+)
 from knowledge_service.app.services import DocumentIngestor
 from knowledge_service.app.services.auth import get_current_active_user
 
 
-def get_document_ingestor(db: Session = Depends(get_db)) -> DocumentIngestor:
-    return DocumentIngestor(db)
+def get_document_ingestor(
+    db: Annotated[Session, Depends(get_db)],
+    registry: Annotated[EmbeddingRegistry, Depends(get_embedding_registry)],
+) -> DocumentIngestor:
+    return DocumentIngestor(db, registry=registry)
 
 def get_llm() -> BaseLLMProvider:
     return get_llm_provider(provider=config.LLM_PROVIDER)
 
 def get_rag_pipeline(
     current_user: Annotated[User, Depends(get_current_active_user)],
-    db: Annotated[Session, Depends(get_db)],
+    db: Annotated[AsyncSession, Depends(get_async_db)],
     llm: Annotated[BaseLLMProvider, Depends(get_llm)],
+    registry: Annotated[EmbeddingRegistry, Depends(get_embedding_registry)],
+    query_cache: Annotated[QueryEmbeddingCache, Depends(get_query_embedding_cache)],
+    access_cache: Annotated[AccessSetCache, Depends(get_access_set_cache)],
+    reranker: Annotated[Optional[ChunkReranker], Depends(get_chunk_reranker)],
+    answer_cache: Annotated[Optional[SemanticAnswerCache], Depends(get_answer_cache)],
+    query_encoder: Annotated[Optional[MicroBatchingEncoder], Depends(get_query_encoder)],
 ) -> KnowledgeRAGPipeline:
     if not current_user:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Inactive users cannot access knowledge services"
         )
-    return KnowledgeRAGPipeline(db_session=db, llm_provider=llm)
+    # Запросы обслуживаются async-путём (aiterative_answer*), поэтому сессия асинхронная
+    return KnowledgeRAGPipeline(
+        db_session=db,
+        llm_provider=llm,
+        embedder=registry.get_embedder(),
+        query_cache=query_cache,
+        retrieval_config=RetrievalConfig.for_company(current_user.company_id),
+        access_cache=access_cache,
+        reranker=reranker,
+        answer_cache=answer_cache,
+        query_encoder=query_encoder
+    )
 
 
 # Type annotations for common dependency combinations
@@ -39,3 +76,4 @@ LLMDep = Annotated[BaseLLMProvider, Depends(get_llm)]
 RAGUserDep = Annotated[User, Depends(get_current_active_user)]
 RAGPipelineDep = Annotated[KnowledgeRAGPipeline, Depends(get_rag_pipeline)]
 RAGDocumentIngestor = Annotated[DocumentIngestor, Depends(get_document_ingestor)]
+DbSessionDep = Annotated[Session, Depends(get_db)]
@@ -0,0 +1,28 @@
+from knowledge_service.app.embeddings.batching import MicroBatchingEncoder, get_query_encoder
+from knowledge_service.app.embeddings.query_cache import (
+    QueryEmbeddingCache,
+    get_query_embedding_cache,
+    query_embedding_cache,
+)
+from knowledge_service.app.embeddings.registry import (
+    EmbeddingRegistry,
+    SharedCrossEncoder,
+    SharedEmbedder,
+    SharedTokenizer,
+    embedding_registry,
+    get_embedding_registry,
+)
+
+__all__ = [
+    'MicroBatchingEncoder',
+    'get_query_encoder',
+    'QueryEmbeddingCache',
+    'get_query_embedding_cache',
+    'query_embedding_cache',
+    'EmbeddingRegistry',
+    'SharedCrossEncoder',
+    'SharedEmbedder',
+    'SharedTokenizer',
+    'embedding_registry',
+    'get_embedding_registry'
+]
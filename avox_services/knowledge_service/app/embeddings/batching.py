@@ -0,0 +1,158 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from knowledge_service.app.core import config
+from knowledge_service.app.embeddings.registry import SharedEmbedder, embedding_registry
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _EncodeRequest:
+    text: str
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class MicroBatchingEncoder:
+    """
+    Очередь кодирования вопросов: одновременные encode_one() собираются в одну партию
+    (до max_batch_size текстов или max_wait_ms с первого запроса) и кодируются одним проходом модели
+    в отдельном потоке. Вызывающий поток ждёт свой Future.
+    """
+
+    _STOP = object()
+
+    def __init__(
+            self,
+            embedder: SharedEmbedder,
+            max_batch_size: int = config.EMBEDDING_BATCH_SIZE,
+            max_wait_ms: float = config.EMBEDDING_BATCH_MAX_WAIT_MS
+    ):
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size must be positive")
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        # Метрики
+        self.batch_sizes: Counter = Counter()
+        self.items = 0
+        self.errors = 0
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+
+    @property
+    def model_name(self) -> str:
+        return self.embedder.model_name
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_worker()
+        request = _EncodeRequest(text)
+        self._queue.put(request)
+        return request.future
+
+    def encode_one(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    def _collect(self, first: _EncodeRequest) -> List[_EncodeRequest]:
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                # Уже ждущие запросы забираются сразу, новые — пока не истёк max_wait
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                self._queue.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _encode_batch(self, batch: List[_EncodeRequest]) -> None:
+        started = time.monotonic()
+        waits = [started - r.enqueued_at for r in batch]
+        # Одинаковые вопросы в партии кодируются один раз
+        texts = list(dict.fromkeys(r.text for r in batch))
+        try:
+            vectors = self.embedder.encode(texts, batch_size=len(texts))
+        except Exception as e:
+            logger.error(f"Batched encode failed: {e}")
+            self.errors += 1
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, vectors))
+        for request in batch:
+            request.future.set_result(by_text[request.text])
+
+        with self._lock:
+            self.batch_sizes[len(batch)] += 1
+            self.items += len(batch)
+            self.total_wait += sum(waits)
+            self.max_observed_wait = max(self.max_observed_wait, max(waits))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            self._encode_batch(self._collect(item))
+
+    def close(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(self._STOP)
+            self._worker.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            batches = sum(self.batch_sizes.values())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": batches,
+                "items": self.items,
+                "errors": self.errors,
+                "avg_batch_size": self.items / batches if batches else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "avg_wait_ms": self.total_wait / self.items * 1000 if self.items else 0.0,
+                "max_wait_ms": self.max_observed_wait * 1000,
+            }
+
+
+_query_encoder: Optional[MicroBatchingEncoder] = None
+_query_encoder_lock = threading.Lock()
+
+
+def get_query_encoder() -> Optional[MicroBatchingEncoder]:
+    """
+    Общая очередь кодирования вопросов (None, если EMBEDDING_BATCHING_ENABLED выключен).
+    """
+    global _query_encoder
+    if not config.EMBEDDING_BATCHING_ENABLED:
+        return None
+    if _query_encoder is None:
+        with _query_encoder_lock:
+            if _query_encoder is None:
+                _query_encoder = MicroBatchingEncoder(embedding_registry.get_embedder())
+    return _query_encoder
@@ -0,0 +1,117 @@
+import hashlib
+import logging
+import re
+import unicodedata
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from knowledge_service.app.core import config
+from knowledge_service.app.core.cache import LRUTTLCache
+from knowledge_service.app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str, lowercase: bool = False) -> str:
+    """
+    Нормализация текста вопроса для ключа кэша: NFKC и пробелы не влияют на эмбеддинг запроса.
+    Регистр — только для uncased моделей (lowercase), у cased "Apple" и "apple" дают разные векторы.
+    """
+    normalized = _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", question)).strip()
+    return normalized.lower() if lowercase else normalized
+
+
+def query_cache_key(question: str, model_name: str, lowercase: bool = False) -> str:
+    digest = hashlib.sha256(normalize_question(question, lowercase).encode("utf-8")).hexdigest()
+    return f"{model_name}:{digest}"
+
+
+class QueryEmbeddingCache:
+    """
+    Кэш эмбеддингов вопросов: ключ — (нормализованный текст, модель).
+    lowercase — модель uncased, вопросы, отличающиеся только регистром, делят один вектор.
+    Локальный LRU+TTL на процесс и, опционально, общий Redis для всех реплик.
+    """
+
+    REDIS_PREFIX = "kno:qemb:"
+
+    def __init__(
+            self,
+            max_size: int = config.QUERY_EMBEDDING_CACHE_SIZE,
+            ttl_seconds: int = config.QUERY_EMBEDDING_CACHE_TTL,
+            redis_client: Optional[Any] = None
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.local: LRUTTLCache[np.ndarray] = LRUTTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.redis = redis_client
+        self.redis_hits = 0
+        self.redis_errors = 0
+
+    def get(self, question: str, model_name: str, lowercase: bool = False) -> Optional[np.ndarray]:
+        key = query_cache_key(question, model_name, lowercase)
+        vector = self.local.get(key)
+        if vector is not None or self.redis is None:
+            return vector
+
+        try:
+            raw = self.redis.get(self.REDIS_PREFIX + key)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Query embedding cache: redis read failed: {e}")
+            return None
+        if raw is None:
+            return None
+
+        vector = np.frombuffer(raw, dtype=np.float32)
+        self.redis_hits += 1
+        self.local.set(key, vector)
+        return vector
+
+    def set(self, question: str, model_name: str, vector: np.ndarray, lowercase: bool = False) -> None:
+        key = query_cache_key(question, model_name, lowercase)
+        vector = np.asarray(vector, dtype=np.float32)
+        self.local.set(key, vector)
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(self.REDIS_PREFIX + key, vector.tobytes(), ex=self.ttl_seconds)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Query embedding cache: redis write failed: {e}")
+
+    def get_or_compute(
+            self,
+            question: str,
+            model_name: str,
+            compute: Callable[[str], np.ndarray],
+            lowercase: bool = False
+    ) -> np.ndarray:
+        vector = self.get(question, model_name, lowercase)
+        if vector is None:
+            vector = compute(question)
+            self.set(question, model_name, vector, lowercase)
+        return vector
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.local.stats()
+        stats.update({
+            "backend": "redis" if self.redis is not None else "memory",
+            "redis_hits": self.redis_hits,
+            "redis_errors": self.redis_errors,
+        })
+        return stats
+
+
+def _build_query_embedding_cache() -> QueryEmbeddingCache:
+    redis_client = get_redis() if config.QUERY_EMBEDDING_CACHE_BACKEND == "redis" else None
+    return QueryEmbeddingCache(redis_client=redis_client)
+
+
+query_embedding_cache = _build_query_embedding_cache()
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    return query_embedding_cache
@@ -0,0 +1,196 @@
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import nltk
+import numpy as np
+import torch
+from sentence_transformers import CrossEncoder, SentenceTransformer
+from transformers import AutoTokenizer
+
+from knowledge_service.app.core import config
+
+logger = logging.getLogger(__name__)
+
+
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+
+def limit_torch_threads(threads: Optional[int] = config.EMBEDDING_THREADS) -> None:
+    """
+    Ограничивает intra-op потоки torch: иначе каждый encode занимает все ядра и конкурирует с threadpool запросов.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+
+
+def load_sentence_transformer(
+        model_name: str,
+        backend: str = config.EMBEDDING_BACKEND,
+        onnx_path: str = config.EMBEDDING_ONNX_PATH,
+        onnx_file: str = config.EMBEDDING_ONNX_FILE,
+        threads: Optional[int] = config.EMBEDDING_THREADS
+) -> SentenceTransformer:
+    """
+    Загружает модель в нужном рантайме. ONNX-модель берётся из каталога экспорта;
+    имя модели при этом остаётся исходным (им помечаются эмбеддинги в БД и ключи кэшей).
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    if backend == "onnx":
+        model_kwargs: Dict[str, Any] = {"file_name": onnx_file}
+        if threads:
+            import onnxruntime
+
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = threads
+            model_kwargs["session_options"] = session_options
+        return SentenceTransformer(onnx_path, backend="onnx", model_kwargs=model_kwargs)
+    limit_torch_threads(threads)
+    return SentenceTransformer(model_name)
+
+
+class SharedEmbedder:
+    """
+    Общий (на процесс) хэндл модели эмбеддингов.
+    Инференс torch и onnxruntime потокобезопасен, поэтому encode не сериализуется.
+    """
+
+    def __init__(self, model_name: str, model: SentenceTransformer, backend: str = "torch"):
+        self.model_name = model_name
+        self.backend = backend
+        self._model = model
+
+    @property
+    def dimension(self) -> int:
+        return self._model.get_sentence_embedding_dimension()
+
+    @property
+    def lowercase(self) -> bool:
+        """Токенайзер модели приводит текст к нижнему регистру (uncased): регистр не влияет на эмбеддинг"""
+        return bool(getattr(self._model.tokenizer, "do_lower_case", False))
+
+    def encode(self, texts: Union[str, List[str]], **kwargs: Any) -> np.ndarray:
+        kwargs.setdefault("convert_to_numpy", True)
+        return self._model.encode(texts, **kwargs)
+
+
+class SharedCrossEncoder:
+    """
+    Общий хэндл cross-encoder модели для переранжирования пар (вопрос, текст).
+    """
+
+    def __init__(self, model_name: str, model: CrossEncoder):
+        self.model_name = model_name
+        self._model = model
+
+    @property
+    def lowercase(self) -> bool:
+        return bool(getattr(self._model.tokenizer, "do_lower_case", False))
+
+    def predict(self, pairs: List[Tuple[str, str]], batch_size: int = 32) -> np.ndarray:
+        return self._model.predict(pairs, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+
+class SharedTokenizer:
+    """
+    Общий хэндл токенайзера.
+    Fast-токенайзеры HF не потокобезопасны ("Already borrowed"), поэтому вызовы идут под локом.
+    """
+
+    def __init__(self, model_name: str, tokenizer: Any):
+        self.model_name = model_name
+        self._tokenizer = tokenizer
+        self._lock = threading.Lock()
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            return self._tokenizer(*args, **kwargs)
+
+
+class EmbeddingRegistry:
+    """
+    Реестр моделей эмбеддингов: каждая модель и токенайзер загружаются один раз на процесс
+    и выдаются по имени модели всем пайплайнам и инжесторам.
+    """
+
+    def __init__(self, backend: str = config.EMBEDDING_BACKEND):
+        self.backend = backend
+        self._embedders: Dict[str, SharedEmbedder] = {}
+        self._tokenizers: Dict[str, SharedTokenizer] = {}
+        self._cross_encoders: Dict[str, SharedCrossEncoder] = {}
+        self._lock = threading.Lock()
+        self._nltk_ready = False
+
+    def get_embedder(self, model_name: str = config.EMBEDDING_MODEL_NAME) -> SharedEmbedder:
+        embedder = self._embedders.get(model_name)
+        if embedder is None:
+            with self._lock:
+                embedder = self._embedders.get(model_name)
+                if embedder is None:
+                    logger.info(f"Loading embedding model {model_name} ({self.backend})")
+                    embedder = SharedEmbedder(
+                        model_name, load_sentence_transformer(model_name, self.backend), self.backend
+                    )
+                    self._embedders[model_name] = embedder
+        return embedder
+
+    def get_tokenizer(self, model_name: str = config.EMBEDDING_MODEL_NAME) -> SharedTokenizer:
+        tokenizer = self._tokenizers.get(model_name)
+        if tokenizer is None:
+            with self._lock:
+                tokenizer = self._tokenizers.get(model_name)
+                if tokenizer is None:
+                    logger.info(f"Loading tokenizer {model_name}")
+                    tokenizer = SharedTokenizer(model_name, AutoTokenizer.from_pretrained(model_name))
+                    self._tokenizers[model_name] = tokenizer
+        return tokenizer
+
+    def get_cross_encoder(self, model_name: str = config.RERANK_MODEL_NAME) -> SharedCrossEncoder:
+        cross_encoder = self._cross_encoders.get(model_name)
+        if cross_encoder is None:
+            with self._lock:
+                cross_encoder = self._cross_encoders.get(model_name)
+                if cross_encoder is None:
+                    logger.info(f"Loading cross-encoder {model_name}")
+                    cross_encoder = SharedCrossEncoder(model_name, CrossEncoder(model_name))
+                    self._cross_encoders[model_name] = cross_encoder
+        return cross_encoder
+
+    def ensure_nltk(self) -> None:
+        """
+        Проверяет наличие данных punkt для sent_tokenize (однократно на процесс).
+        """
+        if self._nltk_ready:
+            return
+        with self._lock:
+            if self._nltk_ready:
+                return
+            try:
+                nltk.data.find("tokenizers/punkt")
+                nltk.data.find("tokenizers/punkt_tab")
+            except LookupError:
+                nltk.download("punkt")
+                nltk.download("punkt_tab")
+            self._nltk_ready = True
+
+    def preload(self, model_name: str = config.EMBEDDING_MODEL_NAME) -> None:
+        """
+        Загружает модель, токенайзер и nltk-данные заранее (на старте приложения).
+        """
+        self.ensure_nltk()
+        self.get_embedder(model_name)
+        self.get_tokenizer(model_name)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._embedders.clear()
+            self._tokenizers.clear()
+            self._cross_encoders.clear()
+
+
+embedding_registry = EmbeddingRegistry()
+
+
+def get_embedding_registry() -> EmbeddingRegistry:
+    return embedding_registry
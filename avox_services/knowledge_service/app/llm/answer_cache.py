@@ -0,0 +1,280 @@
+import hashlib
+import json
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from avox_shared.knowledge_service.rag import AnswerStrategy, RAGResponse
+from knowledge_service.app.core import config
+from knowledge_service.app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Ближайшие сохранённые вопросы в разделе (компания, набор доступа, стратегия, модель)
+LOOKUP_SQL = """
+SELECT
+    id,
+    response,
+    document_versions,
+    question_vector <=> CAST(:query_vector AS vector) AS distance
+FROM answer_cache_entries
+WHERE company_id = CAST(:company_id AS uuid)
+  AND scope_key = :scope_key
+  AND strategy = :strategy
+  AND embedding_model = :embedding_model
+  AND created_at >= :min_created_at
+ORDER BY question_vector <=> CAST(:query_vector AS vector)
+LIMIT :limit
+"""
+
+# Версия содержимого раздела: последнее изменение среди его документов. updated_at меняется
+# при обновлении документа и при завершении расчёта его эмбеддингов (см. services.ingest_jobs)
+SCOPE_VERSION_SQL = """
+SELECT MAX(updated_at)
+FROM documents
+WHERE id = ANY(CAST(:doc_ids AS uuid[]))
+"""
+
+DOCUMENT_VERSIONS_SQL = """
+SELECT id, updated_at
+FROM documents
+WHERE id = ANY(CAST(:doc_ids AS uuid[]))
+"""
+
+TOUCH_SQL = """
+UPDATE answer_cache_entries
+SET hit_count = hit_count + 1, last_hit_at = now()
+WHERE id = CAST(:id AS uuid)
+"""
+
+DELETE_SQL = """
+DELETE FROM answer_cache_entries
+WHERE id = ANY(CAST(:ids AS uuid[]))
+"""
+
+INSERT_SQL = """
+INSERT INTO answer_cache_entries (
+    id, company_id, scope_key, strategy, embedding_model, question_text, question_vector,
+    response, document_versions, hit_count, created_at, updated_at
+)
+VALUES (
+    CAST(:id AS uuid), CAST(:company_id AS uuid), :scope_key, :strategy, :embedding_model, :question_text,
+    CAST(:query_vector AS vector), CAST(:response AS jsonb), CAST(:document_versions AS jsonb), 0, now(), now()
+)
+"""
+
+# Вытеснение по возрасту (все компании) и по размеру раздела компании (давно не использованные — первыми)
+EVICT_SQL = """
+DELETE FROM answer_cache_entries
+WHERE created_at < :min_created_at
+   OR id IN (
+       SELECT id
+       FROM answer_cache_entries
+       WHERE company_id = CAST(:company_id AS uuid)
+       ORDER BY COALESCE(last_hit_at, created_at) DESC
+       OFFSET :max_entries
+   )
+"""
+
+
+def scope_key(access_fingerprint: str, doc_ids: Optional[Iterable[Any]] = None, content_version: str = "") -> str:
+    """
+    Ключ раздела кэша: отпечаток набора доступных документов, если задано, ограничение doc_ids,
+    и версия содержимого раздела. Новый или изменённый документ раздела меняет ключ,
+    даже если сохранённые ответы на него не ссылались.
+    """
+    restriction = ",".join(sorted(str(doc_id) for doc_id in doc_ids)) if doc_ids else ""
+    return hashlib.sha256(f"{access_fingerprint}|{restriction}|{content_version}".encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class AnswerCacheKey:
+    company_id: uuid.UUID
+    scope_key: str
+    strategy: AnswerStrategy
+    embedding_model: str
+    query_vector: Tuple[float, ...]
+
+
+class SemanticAnswerCache:
+    """
+    Семантический кэш ответов в pgvector.
+    Попадание: cosine-сходство вопроса >= similarity в том же разделе и те же версии (updated_at)
+    всех used_documents. Запись с изменившимся или удалённым документом удаляется при проверке.
+    Документы, добавленные в раздел или изменённые в нём, меняют сам раздел (см. scope_key):
+    старые записи больше не находятся и вытесняются по возрасту.
+    Раздел компании ограничен max_entries, записи старше ttl_seconds не используются и вытесняются.
+    Запросы идут в собственной короткой сессии: ошибка кэша не откатывает транзакцию запроса.
+    """
+
+    # Сколько ближайших вопросов проверяется на актуальность документов
+    CANDIDATES = 5
+
+    def __init__(
+            self,
+            similarity: float = config.ANSWER_CACHE_SIMILARITY,
+            ttl_seconds: int = config.ANSWER_CACHE_TTL,
+            max_entries: int = config.ANSWER_CACHE_MAX_ENTRIES,
+            session_factory: Callable[[], AsyncSession] = AsyncSessionLocal
+    ):
+        self.session_factory = session_factory
+        self.similarity = similarity
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.stores = 0
+        self.errors = 0
+
+    def _min_created_at(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds)
+
+    def _lookup_params(self, key: AnswerCacheKey) -> Dict[str, Any]:
+        return {
+            "company_id": str(key.company_id),
+            "scope_key": key.scope_key,
+            "strategy": key.strategy.value,
+            "embedding_model": key.embedding_model,
+            "query_vector": list(key.query_vector),
+            "min_created_at": self._min_created_at(),
+            "limit": self.CANDIDATES,
+        }
+
+    def _similar_rows(self, rows: Sequence[Mapping[str, Any]]) -> List[Mapping[str, Any]]:
+        max_distance = 1 - self.similarity
+        return [row for row in rows if float(row["distance"]) <= max_distance]
+
+    @staticmethod
+    def _versioned_doc_ids(rows: Sequence[Mapping[str, Any]]) -> List[str]:
+        return sorted({doc_id for row in rows for doc_id in row["document_versions"]})
+
+    @staticmethod
+    def _versions(rows: Sequence[Mapping[str, Any]]) -> Dict[str, str]:
+        return {str(row["id"]): row["updated_at"].isoformat() for row in rows}
+
+    def _pick(
+            self,
+            rows: Sequence[Mapping[str, Any]],
+            current_versions: Dict[str, str]
+    ) -> Tuple[Optional[Mapping[str, Any]], List[str]]:
+        """
+        Первая (самая похожая) запись с актуальными версиями документов и список устаревших записей.
+        """
+        stale_ids = []
+        for row in rows:
+            versions: Dict[str, str] = row["document_versions"]
+            if all(current_versions.get(doc_id) == version for doc_id, version in versions.items()):
+                return row, stale_ids
+            stale_ids.append(str(row["id"]))
+        return None, stale_ids
+
+    def _hit(self, row: Optional[Mapping[str, Any]], stale_ids: List[str]) -> Optional[RAGResponse]:
+        self.stale += len(stale_ids)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        response = RAGResponse.model_validate(row["response"])
+        response.cache_hit = True
+        return response
+
+    @staticmethod
+    def _insert_params(key: AnswerCacheKey, question: str, response: RAGResponse, versions: Dict[str, str]) -> Dict[str, Any]:
+        return {
+            "id": str(uuid.uuid4()),
+            "company_id": str(key.company_id),
+            "scope_key": key.scope_key,
+            "strategy": key.strategy.value,
+            "embedding_model": key.embedding_model,
+            "question_text": question,
+            "query_vector": list(key.query_vector),
+            "response": response.model_dump_json(),
+            "document_versions": json.dumps(versions),
+        }
+
+    @staticmethod
+    def is_cacheable(response: RAGResponse) -> bool:
+        return bool(response.used_documents) and response.final_result != "Error processing request"
+
+    async def acontent_version(self, doc_ids: Sequence[Any]) -> Optional[str]:
+        """
+        Версия содержимого раздела для scope_key; None — прочитать не удалось (кэш не используется).
+        """
+        if not doc_ids:
+            return ""
+        try:
+            async with self.session_factory() as db:
+                version = (await db.execute(
+                    text(SCOPE_VERSION_SQL), {"doc_ids": [str(doc_id) for doc_id in doc_ids]}
+                )).scalar()
+            return version.isoformat() if version is not None else ""
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Answer cache scope version failed: {e}")
+            return None
+
+    async def alookup(self, key: AnswerCacheKey) -> Optional[RAGResponse]:
+        try:
+            async with self.session_factory() as db:
+                rows = self._similar_rows((await db.execute(text(LOOKUP_SQL), self._lookup_params(key))).mappings().all())
+                if not rows:
+                    self.misses += 1
+                    return None
+                version_rows = (await db.execute(
+                    text(DOCUMENT_VERSIONS_SQL), {"doc_ids": self._versioned_doc_ids(rows)}
+                )).mappings().all()
+                row, stale_ids = self._pick(rows, self._versions(version_rows))
+                if stale_ids:
+                    await db.execute(text(DELETE_SQL), {"ids": stale_ids})
+                if row is not None:
+                    await db.execute(text(TOUCH_SQL), {"id": str(row["id"])})
+                await db.commit()
+            return self._hit(row, stale_ids)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Answer cache lookup failed: {e}")
+            return None
+
+    async def astore(self, key: AnswerCacheKey, question: str, response: RAGResponse) -> None:
+        if not self.is_cacheable(response):
+            return
+        try:
+            async with self.session_factory() as db:
+                version_rows = (await db.execute(
+                    text(DOCUMENT_VERSIONS_SQL), {"doc_ids": response.used_documents}
+                )).mappings().all()
+                await db.execute(text(INSERT_SQL), self._insert_params(key, question, response, self._versions(version_rows)))
+                await db.execute(text(EVICT_SQL), {
+                    "company_id": str(key.company_id),
+                    "min_created_at": self._min_created_at(),
+                    "max_entries": self.max_entries,
+                })
+                await db.commit()
+            self.stores += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Answer cache store failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "stale": self.stale,
+            "stores": self.stores,
+            "errors": self.errors,
+        }
+
+
+answer_cache = SemanticAnswerCache()
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    return answer_cache if config.ANSWER_CACHE_ENABLED else None
@@ -1,6 +1,7 @@
 
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator
 
 class BaseLLMProvider(ABC):
     """Abstract base class for LLM providers."""
@@ -19,6 +20,35 @@ class BaseLLMProvider(ABC):
         """
         pass
 
+    async def agenerate(self, prompt: str, **kwargs: Any) -> str:
+        """
+        Asynchronously generate text completion from prompt.
+
+        The default implementation runs generate() in a worker thread;
+        providers with an async client should override it to avoid holding a thread per call.
+
+        Args:
+            prompt: Input text prompt
+            **kwargs: Additional provider-specific parameters
+
+        Returns:
+            Generated text completion
+        """
+        return await asyncio.to_thread(self.generate, prompt, **kwargs)
+
+    async def astream(self, prompt: str, **kwargs: Any) -> AsyncIterator[str]:
+        """
+        Asynchronously stream text completion as incremental deltas.
+
+        Args:
+            prompt: Input text prompt
+            **kwargs: Additional provider-specific parameters
+
+        Yields:
+            Consecutive pieces of the generated text
+        """
+        yield await self.agenerate(prompt, **kwargs)
+
     @abstractmethod
     def get_model_info(self) -> Dict[str, Any]:
         """
@@ -0,0 +1,85 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from knowledge_service.app.llm.dto import DocumentContextChunk
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Оценка числа токенов: слова и знаки препинания (без привязки к токенайзеру конкретной LLM).
+    """
+    return len(_TOKEN_RE.findall(text))
+
+
+def overlap_length(previous: str, following: str) -> int:
+    """
+    Длина самого длинного префикса following, совпадающего с концом previous по границам слов.
+    Соседние чанки перекрываются целыми предложениями (см. DocumentIngestor.chunk_overlap_sentences).
+    """
+    limit = min(len(previous), len(following))
+    for end in range(limit, 0, -1):
+        if end < len(following) and not following[end].isspace():
+            continue
+        start = len(previous) - end
+        if start > 0 and not previous[start - 1].isspace():
+            continue
+        if previous.endswith(following[:end]):
+            return end
+    return 0
+
+
+@dataclass
+class ContextSpan:
+    """Непрерывный фрагмент документа, собранный из соседних чанков"""
+    chunk_ids: List[str]
+    chunk_idx_start: int
+    chunk_idx_end: int
+    text: str
+
+    def to_context_chunk(self) -> DocumentContextChunk:
+        return DocumentContextChunk(chunk_id=self.chunk_ids[0], chunk_ids=self.chunk_ids, chunk_text=self.text)
+
+
+@dataclass
+class DocumentContext:
+    spans: List[ContextSpan] = field(default_factory=list)
+    tokens_saved: int = 0
+
+    def to_document_context(self) -> List[DocumentContextChunk]:
+        return [span.to_context_chunk() for span in self.spans]
+
+
+def merge_adjacent_chunks(chunks: List[Dict[str, Any]]) -> DocumentContext:
+    """
+    Склеивает чанки одного документа с последовательными chunk_idx в непрерывные фрагменты,
+    убирая перекрывающийся текст. Соответствие фрагмент -> chunk_ids сохраняется для цитирования.
+    """
+    context = DocumentContext()
+    seen = set()
+    for chunk in sorted(chunks, key=lambda c: c.get("chunk_idx", 0)):
+        chunk_id = str(chunk["chunk_id"])
+        if chunk_id in seen:
+            continue
+        seen.add(chunk_id)
+        text = chunk["chunk_text"] or ""
+        chunk_idx = chunk.get("chunk_idx", 0)
+
+        last = context.spans[-1] if context.spans else None
+        if last is not None and chunk_idx == last.chunk_idx_end + 1:
+            overlap = overlap_length(last.text, text)
+            context.tokens_saved += estimate_tokens(text[:overlap])
+            rest = text[overlap:].strip()
+            if rest:
+                last.text = f"{last.text} {rest}" if last.text else rest
+            last.chunk_ids.append(chunk_id)
+            last.chunk_idx_end = chunk_idx
+        else:
+            context.spans.append(ContextSpan([chunk_id], chunk_idx, chunk_idx, text))
+    return context
+
+
+def assemble_contexts(grouped_chunks: Dict[str, List[Dict[str, Any]]]) -> Dict[str, DocumentContext]:
+    return {doc_id: merge_adjacent_chunks(chunks) for doc_id, chunks in grouped_chunks.items()}
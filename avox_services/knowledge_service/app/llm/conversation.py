@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+from langchain.prompts import PromptTemplate
+
+from knowledge_service.app.core import config
+from knowledge_service.app.core.cache import LRUTTLCache
+from knowledge_service.app.core.redis_client import get_redis
+from knowledge_service.app.llm.base_provider import BaseLLMProvider
+from knowledge_service.app.llm.context import estimate_tokens
+from knowledge_service.app.llm.rag_system_prompt import SUMMARY_PROMPT_TEMPLATE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONVERSATION_ID = "default"
+
+
+def conversation_key(user_id: Any, conversation_id: Optional[str] = None) -> str:
+    return f"{user_id}:{conversation_id or DEFAULT_CONVERSATION_ID}"
+
+
+@dataclass
+class Conversation:
+    """Краткое содержание ранней части диалога и последующие сообщения {role, text}"""
+    summary: str = ""
+    messages: List[Dict[str, str]] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.summary and not self.messages
+
+
+class ConversationStore:
+    """
+    Хранилище диалогов. С Redis — общее для всех реплик: сообщения в списке (RPUSH атомарен),
+    краткое содержание отдельным ключом. Без Redis — память процесса.
+    Свёртка (fold) убирает из начала списка уже пересказанные сообщения под блокировкой диалога.
+    Блокировка в Redis истекает не раньше, чем через fold_timeout + FOLD_LOCK_MARGIN секунд:
+    свёртка, вызов LLM которой ограничен fold_timeout, успевает закончиться до её истечения.
+    """
+
+    REDIS_PREFIX = "kno:conv:"
+    FOLD_LOCK_MARGIN = 30
+
+    def __init__(
+            self,
+            redis_client: Optional[Any] = None,
+            ttl_seconds: int = config.CONVERSATION_TTL,
+            max_size: int = config.CONVERSATION_CACHE_SIZE,
+            fold_timeout: float = config.CONVERSATION_FOLD_TIMEOUT
+    ):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.fold_timeout = fold_timeout
+        self.local: LRUTTLCache[Conversation] = LRUTTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._folding: Set[str] = set()
+
+    def stats(self) -> Dict[str, Any]:
+        if self.redis is not None:
+            return {"backend": "redis"}
+        return {"backend": "memory", **self.local.stats()}
+
+    def _keys(self, key: str) -> Dict[str, str]:
+        return {
+            "messages": f"{self.REDIS_PREFIX}{key}:messages",
+            "summary": f"{self.REDIS_PREFIX}{key}:summary",
+            "lock": f"{self.REDIS_PREFIX}{key}:fold",
+        }
+
+    def get(self, key: str) -> Conversation:
+        if self.redis is not None:
+            keys = self._keys(key)
+            pipe = self.redis.pipeline()
+            pipe.get(keys["summary"])
+            pipe.lrange(keys["messages"], 0, -1)
+            summary, messages = pipe.execute()
+            return Conversation(
+                summary=summary.decode("utf-8") if summary else "",
+                messages=[json.loads(m) for m in messages]
+            )
+        with self._lock:
+            conversation = self.local.get(key)
+            if conversation is None:
+                return Conversation()
+            return Conversation(conversation.summary, list(conversation.messages))
+
+    def append(self, key: str, messages: List[Dict[str, str]]) -> None:
+        if self.redis is not None:
+            keys = self._keys(key)
+            pipe = self.redis.pipeline()
+            pipe.rpush(keys["messages"], *[json.dumps(m, ensure_ascii=False) for m in messages])
+            pipe.expire(keys["messages"], self.ttl_seconds)
+            pipe.expire(keys["summary"], self.ttl_seconds)
+            pipe.execute()
+            return
+        with self._lock:
+            conversation = self.local.get(key) or Conversation()
+            conversation.messages.extend(messages)
+            self.local.set(key, conversation)
+
+    def try_lock_fold(self, key: str) -> bool:
+        if self.redis is not None:
+            lock_ttl = math.ceil(self.fold_timeout) + self.FOLD_LOCK_MARGIN
+            return bool(self.redis.set(self._keys(key)["lock"], "1", nx=True, ex=lock_ttl))
+        with self._lock:
+            if key in self._folding:
+                return False
+            self._folding.add(key)
+            return True
+
+    def unlock_fold(self, key: str) -> None:
+        if self.redis is not None:
+            self.redis.delete(self._keys(key)["lock"])
+            return
+        with self._lock:
+            self._folding.discard(key)
+
+    def fold(self, key: str, count: int, summary: str) -> None:
+        """
+        Заменяет первые count сообщений кратким содержанием. Новые сообщения добавляются в конец и не теряются.
+        """
+        if self.redis is not None:
+            keys = self._keys(key)
+            pipe = self.redis.pipeline()
+            pipe.ltrim(keys["messages"], count, -1)
+            pipe.set(keys["summary"], summary, ex=self.ttl_seconds)
+            pipe.execute()
+            return
+        with self._lock:
+            conversation = self.local.get(key) or Conversation()
+            conversation.messages = conversation.messages[count:]
+            conversation.summary = summary
+            self.local.set(key, conversation)
+
+
+class ConversationMemory:
+    """
+    История диалога с фиксированным бюджетом токенов в промпте.
+    В промпт идут краткое содержание и последние сообщения, помещающиеся в token_budget.
+    Когда сообщений больше history_limit или они не помещаются в бюджет, старейшие
+    summarize_batch сообщений сворачиваются в краткое содержание вызовом LLM в фоне.
+    """
+
+    # Доля бюджета, которую может занять краткое содержание
+    SUMMARY_SHARE = 0.3
+
+    _tasks: Set[asyncio.Task] = set()
+
+    def __init__(
+            self,
+            store: ConversationStore,
+            history_limit: int = 20,
+            summarize_batch: int = 10,
+            token_budget: int = config.CONVERSATION_TOKEN_BUDGET
+    ):
+        self.store = store
+        self.history_limit = history_limit
+        self.summarize_batch = summarize_batch
+        self.token_budget = token_budget
+        self.summary_template = PromptTemplate(input_variables=["request_json"], template=SUMMARY_PROMPT_TEMPLATE.strip())
+
+    def load(self, key: str) -> Conversation:
+        try:
+            return self.store.get(key)
+        except Exception as e:
+            logger.warning(f"Conversation store read failed: {e}")
+            return Conversation()
+
+    def format(self, conversation: Conversation, question: str) -> str:
+        """
+        История для промпта: краткое содержание + самые свежие сообщения в пределах бюджета.
+        Текущий вопрос включается всегда.
+        """
+        current = f"user: {question}"
+        budget = self.token_budget - estimate_tokens(current)
+
+        lines: List[str] = []
+        summary = ""
+        if conversation.summary:
+            summary = f"summary: {conversation.summary}"
+            summary_tokens = estimate_tokens(summary)
+            if summary_tokens > self.token_budget * self.SUMMARY_SHARE:
+                summary = ""
+            else:
+                budget -= summary_tokens
+
+        for message in reversed(conversation.messages):
+            line = f"{message['role']}: {message['text']}"
+            tokens = estimate_tokens(line)
+            if tokens > budget:
+                break
+            lines.append(line)
+            budget -= tokens
+
+        return "\n".join(([summary] if summary else []) + list(reversed(lines)) + [current])
+
+    def _fold_count(self, conversation: Conversation) -> int:
+        """
+        Сколько старейших сообщений свернуть (0 — свёртка не нужна).
+        """
+        messages = conversation.messages
+        total = sum(estimate_tokens(f"{m['role']}: {m['text']}") for m in messages)
+        if len(messages) <= self.history_limit and total <= self.token_budget:
+            return 0
+        # Последний обмен (вопрос + ответ) всегда остаётся дословно
+        return min(max(self.summarize_batch, 1), max(len(messages) - 2, 0))
+
+    def _summary_prompt(self, conversation: Conversation, count: int) -> str:
+        request_json = json.dumps(
+            {"summary": conversation.summary, "messages": conversation.messages[:count]},
+            ensure_ascii=False
+        )
+        return self.summary_template.format(request_json=request_json)
+
+    def _prepare_fold(self, key: str) -> Optional[tuple]:
+        conversation = self.load(key)
+        count = self._fold_count(conversation)
+        if not count or not self.store.try_lock_fold(key):
+            return None
+        return conversation, count
+
+    async def _afold(self, key: str, llm: BaseLLMProvider) -> None:
+        """
+        Свёртка в фоне. Обращения к хранилищу (синхронный Redis) — в потоке, чтобы не блокировать цикл событий;
+        вызов LLM ограничен fold_timeout хранилища, иначе блокировка свёртки может истечь раньше.
+        """
+        prepared = await asyncio.to_thread(self._prepare_fold, key)
+        if prepared is None:
+            return
+        conversation, count = prepared
+        try:
+            summary = (await asyncio.wait_for(
+                llm.agenerate(self._summary_prompt(conversation, count)),
+                timeout=self.store.fold_timeout
+            )).strip()
+            if summary:
+                await asyncio.to_thread(self.store.fold, key, count, summary)
+        except Exception as e:
+            logger.warning(f"Conversation summarization failed: {e!r}")
+        finally:
+            await asyncio.to_thread(self.store.unlock_fold, key)
+
+    def _append(self, key: str, question: str, answer: str) -> bool:
+        try:
+            self.store.append(key, [{"role": "user", "text": question}, {"role": "system", "text": answer}])
+            return True
+        except Exception as e:
+            logger.warning(f"Conversation store write failed: {e}")
+            return False
+
+    async def aremember(self, key: str, question: str, answer: str, llm: BaseLLMProvider) -> None:
+        if await asyncio.to_thread(self._append, key, question, answer):
+            task = asyncio.create_task(self._afold(key, llm))
+            # Ссылка на задачу держится до завершения, иначе её может собрать GC
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+conversation_store = ConversationStore(
+    redis_client=get_redis() if config.CONVERSATION_BACKEND == "redis" else None
+)
+
+
+def get_conversation_store() -> ConversationStore:
+    return conversation_store
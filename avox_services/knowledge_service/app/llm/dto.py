@@ -1,26 +1,14 @@
-from enum import Enum
 from typing import TypedDict, List, Optional
 
-
-# Уровень достоверности факта
-class FactCertainty(str, Enum):
-    HIGH = "high"            # Факт подтверждён с высокой уверенностью
-    MEDIUM = "medium"        # Факт вероятен, но есть небольшие сомнения
-    LOW = "low"              # Факт с низкой достоверностью
-    CONTRADICTS = "contradicts"  # Факт противоречит имеющимся данным
+# Факты — часть контракта RAGResponse, поэтому определены в avox_shared
+from avox_shared.knowledge_service.facts import Fact, FactCertainty
 
 # Чанк документа, который подается на обработку LLM
 class DocumentContextChunk(TypedDict):
-    chunk_id: str            # Уникальный идентификатор чанка
+    chunk_id: str            # Уникальный идентификатор чанка (первого во фрагменте)
+    chunk_ids: List[str]     # Все чанки, склеенные в этот фрагмент (для цитирования)
     chunk_text: str          # Текстовое содержание чанка
 
-# Структура факта
-class Fact(TypedDict):
-    id: Optional[str]        # Уникальный идентификатор факта, может быть None для новых фактов
-    fact: str                # Краткое описание факта
-    certainty: FactCertainty # Уровень достоверности факта
-    reasoning: str           # Краткое объяснение или источник факта
-
 # Контракт запроса к LLM
 class LLMDocumentRequest(TypedDict):
     task: str                                # Инструкция для модели
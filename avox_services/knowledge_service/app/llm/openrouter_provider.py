@@ -1,6 +1,6 @@
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from knowledge_service.app.llm.base_provider import BaseLLMProvider
 
@@ -22,7 +22,13 @@ class OpenRouterProvider(BaseLLMProvider):
             base_url="https://openrouter.ai/api/v1",
             api_key=self.api_key,
         )
+        # Async-клиент для agenerate/astream: ожидание ответа не занимает поток
+        self.async_client = AsyncOpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=self.api_key,
+        )
 
+        self.extra_headers: Dict[str, str] = {}
         # self.extra_headers = {
         #    "HTTP-Referer": config.OPENROUTER_SITE_URL,
         #    "X-Title": config.OPENROUTER_SITE_NAME,
@@ -52,6 +58,60 @@ class OpenRouterProvider(BaseLLMProvider):
         except Exception as e:
             raise RuntimeError(f"OpenRouter completion failed: {str(e)}") from e
 
+    async def agenerate(self, prompt: str, **kwargs: Any) -> str:
+        """
+        Generate text completion using the async OpenAI-compatible client.
+
+        Args:
+            prompt: Input prompt text
+            **kwargs: Additional parameters (e.g., temperature, top_p, etc.)
+
+        Returns:
+            LLM-generated response as string
+        """
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                extra_headers=self.extra_headers,
+                **kwargs
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            raise RuntimeError(f"OpenRouter completion failed: {str(e)}") from e
+
+    async def astream(self, prompt: str, **kwargs: Any) -> AsyncIterator[str]:
+        """
+        Stream text completion using the async client (stream=True), yielding content deltas.
+
+        Args:
+            prompt: Input prompt text
+            **kwargs: Additional parameters (e.g., temperature, top_p, etc.)
+
+        Yields:
+            Content deltas as they arrive
+        """
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                extra_headers=self.extra_headers,
+                stream=True,
+                **kwargs
+            )
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception as e:
+            raise RuntimeError(f"OpenRouter streaming failed: {str(e)}") from e
+
     def get_model_info(self) -> Dict[str, Any]:
         return {
             "provider": "OpenRouter",
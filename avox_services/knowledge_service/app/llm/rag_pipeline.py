@@ -1,30 +1,57 @@
+import asyncio
 import json
 import logging
 import time
 from collections import defaultdict
-from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Iterator, Tuple
 
 import numpy as np
-from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 from numpy import ndarray
-from sentence_transformers import SentenceTransformer
-from sqlalchemy import and_, or_, text
-from sqlalchemy.orm import Session
-
-from avox_shared.knowledge_service.rag import RAGResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from avox_shared.knowledge_service.rag import AnswerStrategy, RAGResponse, RAGSearchResponse, ScoredChunk
+from knowledge_service.app.embeddings import (
+    MicroBatchingEncoder,
+    QueryEmbeddingCache,
+    SharedEmbedder,
+    embedding_registry,
+    query_embedding_cache,
+)
+from knowledge_service.app.llm.answer_cache import AnswerCacheKey, SemanticAnswerCache, scope_key
 from knowledge_service.app.llm.base_provider import BaseLLMProvider
+from knowledge_service.app.llm.context import assemble_contexts
+from knowledge_service.app.llm.conversation import (
+    Conversation,
+    ConversationMemory,
+    conversation_key,
+    conversation_store,
+)
 from knowledge_service.app.llm.dto import *
-from knowledge_service.app.llm.rag_system_prompt import SYSTEM_PROMPT_TEMPLATE
-from knowledge_service.app.models import AccessGrant
+from knowledge_service.app.llm.rag_system_prompt import REDUCE_PROMPT_TEMPLATE, SYSTEM_PROMPT_TEMPLATE
 from knowledge_service.app.models.core.company import User
-from knowledge_service.app.models.core.document import Document
-from knowledge_service.app.models.enums import DocAccessLevel, UserType
+from knowledge_service.app.core import config
+from knowledge_service.app.retrieval import (
+    AccessScope,
+    AccessSet,
+    AccessSetCache,
+    ChunkReranker,
+    ChunkRetriever,
+    DocumentFilter,
+    RetrievalConfig,
+    SearchCursor,
+    access_set_cache,
+    paginate,
+)
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Событие потоковой обработки запроса: (тип, данные)
+RAGEvent = Tuple[str, Any]
+# Внутреннее событие async-стратегий с результатом (facts, answer): async-генератор не может вернуть значение
+RESULT_EVENT = "_result"
+
 def cosine_distance(vec1: ndarray, vec2: ndarray) -> float:
     norm1 = np.linalg.norm(vec1)
     norm2 = np.linalg.norm(vec2)
@@ -35,139 +62,181 @@ def cosine_distance(vec1: ndarray, vec2: ndarray) -> float:
 
 
 class KnowledgeRAGPipeline:
+    """
+    Работает с AsyncSession и BaseLLMProvider.agenerate/astream: запрос не блокирует поток на БД и LLM.
+    """
     HISTORY_LIMIT = 20
     SUMMARIZE_OLD_MESSAGES = 10
     TOP_K = 20
 
-    def __init__(self, db_session: Session, llm_provider: BaseLLMProvider):
+    def __init__(
+            self,
+            db_session: AsyncSession,
+            llm_provider: BaseLLMProvider,
+            embedder: Optional[SharedEmbedder] = None,
+            query_cache: Optional[QueryEmbeddingCache] = None,
+            retrieval_config: Optional[RetrievalConfig] = None,
+            access_cache: Optional[AccessSetCache] = None,
+            reranker: Optional[ChunkReranker] = None,
+            answer_cache: Optional[SemanticAnswerCache] = None,
+            conversation_memory: Optional[ConversationMemory] = None,
+            query_encoder: Optional[MicroBatchingEncoder] = None
+    ):
         self.db = db_session
         self.llm = llm_provider
         self.prompt_template = PromptTemplate(input_variables=["request_json"], template=SYSTEM_PROMPT_TEMPLATE.strip())
-        self.memory: Dict[str, List[Dict[str, str]]] = {}
-        self.embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-
-
-    def _get_accessible_docs(self, user: Optional[User]) -> List[Document]:
-        query = self.db.query(Document)
-
-        public_docs = and_(
-            Document.access_level == DocAccessLevel.PUBLIC,
-            Document.is_approved == True,
-            Document.company_id == (user.company_id if user else None)
+        self.reduce_prompt_template = PromptTemplate(input_variables=["request_json"], template=REDUCE_PROMPT_TEMPLATE.strip())
+        # История общая для реплик (CONVERSATION_BACKEND), в промпт идёт в пределах бюджета токенов
+        self.memory = conversation_memory or ConversationMemory(
+            conversation_store,
+            history_limit=self.HISTORY_LIMIT,
+            summarize_batch=self.SUMMARIZE_OLD_MESSAGES
         )
-        owner_docs = (user is not None) and (Document.owner_id == user.id)
-        internal_docs = and_(
-            user is not None,
-            Document.access_level == DocAccessLevel.INTERNAL,
-            user.user_type == UserType.INTERNAL,
-            Document.company_id == user.company_id
+        # Модель общая на процесс (см. EmbeddingRegistry), пайплайн живёт в рамках запроса
+        self.embedder = embedder or embedding_registry.get_embedder()
+        self.query_cache = query_cache or query_embedding_cache
+        # Очередь, объединяющая одновременные вопросы в одну партию; без неё — encode по одному
+        self.query_encoder = query_encoder
+        self.retrieval_config = retrieval_config or RetrievalConfig()
+        self.retriever = ChunkRetriever(db_session, self.retrieval_config)
+        self.access_cache = access_cache or access_set_cache
+        # Необязательный этап между поиском и LLM: cross-encoder оставляет лучшие документы
+        self.reranker = reranker
+        self.answer_cache = answer_cache
+
+    def _embed_query(self, question: str) -> ndarray:
+        """
+        Эмбеддинг вопроса с кэшированием: повторяющиеся вопросы не прогоняются через модель.
+        """
+        return self.query_cache.get_or_compute(
+            question, self.embedder.model_name, self._encode_question, lowercase=self.embedder.lowercase
         )
-        access_granted_docs = Document.access_grants.any(
-            and_(
-                AccessGrant.user_id == user.id,
-                AccessGrant.is_revoked == False,
-                or_(
-                    AccessGrant.expires_at == None,
-                    AccessGrant.expires_at >= datetime.now()
-                )
-            )
-        ) if user else False
 
-        access_filter = or_(
-            public_docs,
-            owner_docs,
-            internal_docs,
-            access_granted_docs
-        )
-        return query.filter(access_filter).all()
+    def _encode_question(self, question: str) -> ndarray:
+        if self.query_encoder is not None:
+            return self.query_encoder.encode_one(question)
+        return self.embedder.encode([question])[0]
 
-    def _get_similar_chunks(
+    def _document_filter(
+            self,
+            scope: AccessScope,
+            access_set: AccessSet,
+            doc_ids: Optional[List[str]] = None
+    ) -> DocumentFilter:
+        """
+        Небольшой набор доступных документов передаётся в запрос списком id,
+        большой — проверяется SQL-предикатом доступа.
+        Запрошенные doc_ids сужают поиск до доступных из них; недоступные и несуществующие отбрасываются.
+        """
+        if doc_ids:
+            return DocumentFilter.by_ids(access_set.intersect(doc_ids))
+        if len(access_set) <= config.ACCESS_SET_INLINE_LIMIT:
+            return DocumentFilter.by_ids(access_set.ids())
+        return DocumentFilter.by_access(scope)
+
+    async def _aget_similar_chunks(
             self,
             question: str,
             user: Optional[User],
             top_k: int = 20,
             subchunk_top_k: int = 3,
-            score_threshold: float = 0.25
+            score_threshold: float = 0.25,
+            with_texts: bool = True,
+            doc_ids: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
         start_time = time.time()
-        accessible_docs = self._get_accessible_docs(user)
-        doc_ids = [str(doc.id) for doc in accessible_docs]
-        if not doc_ids:
+        scope = AccessScope.from_user(user)
+        if scope is None:
             return []
 
-        query_vector_np = self.embedder.encode([question])[0]
-        query_vector = query_vector_np.tolist()
-
-        sql = """
-        WITH best_subchunks AS (
-            SELECT DISTINCT ON (dc.id)
-                dc.id AS chunk_id,
-                dc.document_id,
-                dc.chunk_text,
-                dc.chunk_idx,
-                (emb.vector <=> CAST(:query_vector AS vector)) AS best_distance
-            FROM document_chunks dc
-            JOIN chunk_embeddings_384 emb ON emb.chunk_id = dc.id
-            WHERE dc.document_id = ANY(CAST(:doc_ids AS uuid[]))
-              AND emb.status = 'COMPLETED'
-            ORDER BY dc.id, best_distance ASC
-        ),
-        top_subchunks AS (
-            SELECT
-                dc.id AS chunk_id,
-                (emb.vector <=> CAST(:query_vector AS vector)) AS dist,
-                ROW_NUMBER() OVER (PARTITION BY dc.id ORDER BY (emb.vector <=> CAST(:query_vector AS vector))) AS subchunk_rank
-            FROM document_chunks dc
-            JOIN chunk_embeddings_384 emb ON emb.chunk_id = dc.id
-            WHERE dc.document_id = ANY(CAST(:doc_ids AS uuid[]))
-              AND emb.status = 'COMPLETED'
+        access_set = await self.access_cache.aget(self.db, scope)
+        document_filter = self._document_filter(scope, access_set, doc_ids)
+        if document_filter.is_empty:
+            return []
+
+        # Кодирование вопроса — CPU-работа, выносим из event loop
+        query_vector = (await asyncio.to_thread(self._embed_query, question)).tolist()
+
+        chunks = await self.retriever.asearch(
+            query_vector,
+            document_filter,
+            top_k=top_k,
+            subchunk_top_k=subchunk_top_k,
+            score_threshold=score_threshold,
+            query_text=question,
+            with_texts=with_texts
         )
-        SELECT
-            b.chunk_id,
-            b.document_id,
-            b.chunk_idx,
-            b.chunk_text,
-            b.best_distance,
-            AVG(t.dist) FILTER (WHERE t.subchunk_rank <= :subchunk_top_k) AS avg_distance,
-            SUM((t.subchunk_rank <= :subchunk_top_k)::int) AS match_count
-        FROM best_subchunks b
-        JOIN top_subchunks t ON t.chunk_id = b.chunk_id
-        GROUP BY b.chunk_id, b.document_id, b.chunk_text, b.chunk_idx, b.best_distance
-        ORDER BY b.best_distance ASC
-        LIMIT :top_k;
-        """
-        result = self.db.execute(
-            text(sql),
-            {"query_vector": query_vector, "doc_ids": doc_ids, "top_k": top_k, "subchunk_top_k": subchunk_top_k}
-        ).mappings().all()
-
-        chunks = []
-        for row in result:
-            best_distance = float(row["best_distance"])
-            avg_distance = float(row["avg_distance"]) if row["avg_distance"] is not None else best_distance
-            match_count = int(row["match_count"])
-
-            norm_best = 1 - best_distance
-            norm_avg = 1 - avg_distance
-            norm_match = match_count / subchunk_top_k
-            score = 0.6 * norm_best + 0.3 * norm_avg + 0.1 * norm_match
-
-            if score >= score_threshold:
-                chunks.append({
-                    "chunk_id": row["chunk_id"],
-                    "document_id": row["document_id"],
-                    "chunk_idx": row["chunk_idx"],
-                    "chunk_text": row["chunk_text"],
-                    "best_distance": best_distance,
-                    "avg_distance": avg_distance,
-                    "match_count": match_count,
-                    "score": score
-                })
 
         elapsed = time.time() - start_time
         logger.debug(f"Retrieved {len(chunks)} chunks in {elapsed:.3f}s for user {user.id if user else 'anon'}")
         return chunks
 
+    def _make_cache_key(
+            self,
+            scope: AccessScope,
+            access_set: AccessSet,
+            query_vector: ndarray,
+            strategy: AnswerStrategy,
+            doc_ids: Optional[List[str]],
+            content_version: str = ""
+    ) -> AnswerCacheKey:
+        return AnswerCacheKey(
+            company_id=scope.company_id,
+            scope_key=scope_key(access_set.fingerprint, doc_ids, content_version),
+            strategy=strategy,
+            embedding_model=self.embedder.model_name,
+            query_vector=tuple(float(x) for x in query_vector)
+        )
+
+    def _cache_scope(self, user: User, conversation: Conversation) -> Optional[AccessScope]:
+        """
+        Кэш ответов используется только для первого вопроса: ответ с историей диалога зависит от неё.
+        """
+        if self.answer_cache is None or not conversation.is_empty:
+            return None
+        scope = AccessScope.from_user(user)
+        return scope if scope is not None and scope.company_id is not None else None
+
+    async def _aanswer_cache_key(
+            self,
+            user: User,
+            question: str,
+            doc_ids: Optional[List[str]],
+            strategy: AnswerStrategy,
+            conversation: Conversation
+    ) -> Optional[AnswerCacheKey]:
+        scope = self._cache_scope(user, conversation)
+        if scope is None:
+            return None
+        access_set = await self.access_cache.aget(self.db, scope)
+        content_version = await self.answer_cache.acontent_version(
+            access_set.intersect(doc_ids) if doc_ids else access_set.ids()
+        )
+        if content_version is None:
+            return None
+        query_vector = await asyncio.to_thread(self._embed_query, question)
+        return self._make_cache_key(scope, access_set, query_vector, strategy, doc_ids, content_version)
+
+    @staticmethod
+    def _cached_events(response: RAGResponse, start_time: float) -> Iterator[RAGEvent]:
+        response.processing_time_ms = int((time.time() - start_time) * 1000)
+        response.stage_timings_ms = {"total": response.processing_time_ms}
+        yield "sources", {
+            "documents": response.used_documents,
+            "chunks": [{"chunk_id": chunk_id} for chunk_id in response.used_doc_chunks],
+            "cached": True,
+        }
+        yield "answer", {"document_id": None, "text": response.final_result}
+        yield "done", response
+
+    def _rerank(self, question: str, chunk_dicts: List[Dict[str, Any]], timings: Dict[str, int]) -> List[Dict[str, Any]]:
+        if self.reranker is None or not chunk_dicts:
+            return chunk_dicts
+        stage_start = time.time()
+        chunk_dicts = self.reranker.rerank(question, chunk_dicts)
+        timings["rerank"] = int((time.time() - stage_start) * 1000)
+        return chunk_dicts
+
     def _parse_response(self, response: str) -> LLMDocumentResponse:
         """
         Извлекает JSON-ответ из LLM и конвертирует в LLMDocumentResponse.
@@ -201,159 +270,498 @@ class KnowledgeRAGPipeline:
             )
         except Exception as e:
             logger.error(f"Failed to parse LLM JSON response: {str(e)}")
-            return LLMDocumentResponse(answer="", reasoning="", new_facts=[], updated_facts=[], can_answer=False)
+            return self._empty_document_response()
 
-    def _process_document(
+    def _document_prompt(
+            self,
+            document_context: List[DocumentContextChunk],
+            question: str,
+            previous_facts: List[Fact],
+            previous_answer: str,
+            dialog_history: str
+    ) -> str:
+        """
+        Формирует запрос к LLM: контекст документа, предыдущие факты и история диалога.
+        """
+        # Формируем DTO запроса
+        request_dto: LLMDocumentRequest = {
+            "task": "Analyze document for relevant information",
+            "question": question,
+            "document_context": document_context,
+            "previous_facts": previous_facts,
+            "previous_answer": previous_answer,
+            "dialog_history": dialog_history
+        }
+
+        request_json = json.dumps(request_dto, ensure_ascii=False)
+        return self.prompt_template.format(request_json=request_json)
+
+    @staticmethod
+    def _empty_document_response() -> LLMDocumentResponse:
+        return LLMDocumentResponse(answer="", reasoning="", new_facts=[], updated_facts=[], can_answer=False)
+
+    async def _aprocess_document(
             self,
-            chunks: List[dict],
+            document_context: List[DocumentContextChunk],
             question: str,
             previous_facts: List[Fact],
             previous_answer: str,
             dialog_history: str
     ) -> LLMDocumentResponse:
         """
-        Формирует запрос к LLM, передаёт контекст, предыдущие факты и историю диалога.
-        Возвращает LLMDocumentResponse.
+        Обрабатывает документ (склеенные фрагменты, см. merge_adjacent_chunks) одним вызовом LLM.
         """
         try:
-            if not chunks:
-                return LLMDocumentResponse(answer="", reasoning="", new_facts=[], updated_facts=[], can_answer=False)
+            if not document_context:
+                return self._empty_document_response()
+            prompt = self._document_prompt(document_context, question, previous_facts, previous_answer, dialog_history)
+            return self._parse_response(await self.llm.agenerate(prompt))
 
-            # Подготовка контекста
-            document_id = chunks[0]["document_id"]
-            document_context = [
-                {"chunk_id": c["chunk_id"], "chunk_text": c["chunk_text"]} for c in chunks
-            ]
+        except Exception as e:
+            logger.error(f"Document processing failed: {str(e)}")
+            return self._empty_document_response()
+
+    @staticmethod
+    def _group_chunks(chunk_dicts: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        # Группировка по документу с сортировкой чанков внутри документа
+        grouped_chunks: dict[str, list[dict]] = defaultdict(list)
+        for chunk in chunk_dicts:
+            grouped_chunks[str(chunk["document_id"])].append(chunk)
+        for chunks in grouped_chunks.values():
+            chunks.sort(key=lambda ch: ch.get("chunk_idx", 0))
+        return grouped_chunks
+
+    @staticmethod
+    def _merge_facts(facts: Dict[str, Fact], result: LLMDocumentResponse, fact_counter: int) -> int:
+        """
+        Добавляет новые факты и применяет обновления существующих. Возвращает новый счётчик id.
+        """
+        for new_fact in result["new_facts"]:
+            if new_fact["certainty"] == FactCertainty.CONTRADICTS:
+                continue
+
+            fact_counter += 1
+            fact_id = str(fact_counter)
+
+            facts[fact_id] = Fact(
+                id=fact_id,
+                fact=new_fact["fact"],
+                certainty=new_fact["certainty"],
+                reasoning=new_fact.get("reasoning", "")
+            )
 
-            # Формируем DTO запроса
-            request_dto: LLMDocumentRequest = {
-                "task": "Analyze document for relevant information",
-                "question": question,
-                "document_context": document_context,
-                "previous_facts": previous_facts,
-                "previous_answer": previous_answer,
-                "dialog_history": dialog_history
-            }
+        for updated_fact in result["updated_facts"]:
+            fact_id = updated_fact.get("id")
+            if not fact_id or fact_id not in facts:
+                continue
+            if updated_fact["certainty"] == FactCertainty.CONTRADICTS:
+                del facts[fact_id]
+            else:
+                facts[fact_id]["fact"] = updated_fact["fact"] or facts[fact_id]["fact"]
+                facts[fact_id]["certainty"] = updated_fact["certainty"] or facts[fact_id]["certainty"]
+                facts[fact_id]["reasoning"] = updated_fact.get("reasoning") or facts[fact_id]["reasoning"]
+
+        return fact_counter
+
+    @staticmethod
+    def _synthesize_answer(facts: List[Fact], answer: str = "") -> str:
+        if answer:
+            return answer
+        return "\n".join(f["fact"] for f in facts)
+
+    @staticmethod
+    def _facts_delta(document_id: str, before: Dict[str, Fact], after: Dict[str, Fact]) -> Dict[str, Any]:
+        """
+        Что изменилось в наборе фактов после обработки документа.
+        """
+        return {
+            "document_id": document_id,
+            "new_facts": [f for fact_id, f in after.items() if fact_id not in before],
+            "updated_facts": [f for fact_id, f in after.items() if fact_id in before and f != before[fact_id]],
+            "removed_fact_ids": [fact_id for fact_id in before if fact_id not in after],
+        }
+
+    @staticmethod
+    def _sources_event(grouped_chunks: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        return {
+            "documents": list(grouped_chunks.keys()),
+            "chunks": [
+                {
+                    "chunk_id": str(chunk["chunk_id"]),
+                    "document_id": doc_id,
+                    "chunk_idx": chunk.get("chunk_idx"),
+                    "score": chunk.get("score"),
+                    "rerank_score": chunk.get("rerank_score"),
+                }
+                for doc_id, chunks in grouped_chunks.items() for chunk in chunks
+            ],
+        }
+
+    async def _aanswer_sequential(
+            self,
+            document_contexts: Dict[str, List[DocumentContextChunk]],
+            question: str,
+            dialog_history: str,
+            timings: Dict[str, int]
+    ) -> AsyncIterator[RAGEvent]:
+        """
+        Документы обрабатываются по очереди: каждый вызов LLM видит факты и ответ предыдущих.
+        После каждого документа отдаются изменения фактов и текущий промежуточный ответ.
+        Последнее событие — RESULT_EVENT с (facts, answer).
+        """
+        stage_start = time.time()
+        facts: Dict[str, Fact] = {}
+        fact_counter = 0
+        answer = ""
+
+        for doc_id, document_context in document_contexts.items():
+            result: LLMDocumentResponse = await self._aprocess_document(
+                document_context,
+                question,
+                list(facts.values()),
+                previous_answer=answer,
+                dialog_history=dialog_history
+            )
+            before = {fact_id: dict(f) for fact_id, f in facts.items()}
+            fact_counter = self._merge_facts(facts, result, fact_counter)
+            yield "facts", self._facts_delta(doc_id, before, facts)
+
+            if result["answer"] and result["answer"] != answer:
+                yield "answer", {"document_id": doc_id, "text": result["answer"]}
+            answer = result["answer"]
+
+        timings["documents"] = int((time.time() - stage_start) * 1000)
+        yield RESULT_EVENT, (facts, answer)
+
+    @staticmethod
+    def _map_facts_event(document_id: str, result: LLMDocumentResponse) -> Dict[str, Any]:
+        return {
+            "document_id": document_id,
+            "new_facts": [f for f in result["new_facts"] if f["certainty"] != FactCertainty.CONTRADICTS],
+            "updated_facts": [],
+            "removed_fact_ids": [],
+        }
+
+    @staticmethod
+    def _fallback_answer(results: List[LLMDocumentResponse]) -> str:
+        # Reduce не удался — берём самый подробный частичный ответ
+        return max((r["answer"] for r in results), key=len, default="")
+
+    async def _aanswer_map_reduce(
+            self,
+            document_contexts: Dict[str, List[DocumentContextChunk]],
+            question: str,
+            dialog_history: str,
+            timings: Dict[str, int]
+    ) -> AsyncIterator[RAGEvent]:
+        """
+        Map: факты извлекаются из документов параллельно (не более MAP_REDUCE_CONCURRENCY вызовов LLM),
+        события по документам отдаются в порядке готовности.
+        Reduce: факты объединяются, ответ синтезируется одним потоковым вызовом LLM.
+        """
+        stage_start = time.time()
+        doc_ids = list(document_contexts.keys())
+        results: List[Optional[LLMDocumentResponse]] = [None] * len(doc_ids)
+        semaphore = asyncio.Semaphore(max(1, config.MAP_REDUCE_CONCURRENCY))
+
+        async def map_document(index: int, document_context: List[DocumentContextChunk]) -> int:
+            async with semaphore:
+                results[index] = await self._aprocess_document(document_context, question, [], "", dialog_history)
+            return index
+
+        tasks = [
+            asyncio.create_task(map_document(i, document_context))
+            for i, document_context in enumerate(document_contexts.values())
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index = await next_done
+                yield "facts", self._map_facts_event(doc_ids[index], results[index])
+        finally:
+            # Клиент отключился — незавершённые вызовы LLM не нужны
+            for task in tasks:
+                task.cancel()
+        timings["map"] = int((time.time() - stage_start) * 1000)
+
+        stage_start = time.time()
+        facts = self._reduce_facts(results)
+        answer = ""
+        async for event, payload in self._areduce_answer(question, list(facts.values()), dialog_history):
+            if event == RESULT_EVENT:
+                answer = payload
+            else:
+                yield event, payload
+        if not answer:
+            answer = self._fallback_answer(results)
+            if answer:
+                yield "answer", {"document_id": None, "text": answer}
+        timings["reduce"] = int((time.time() - stage_start) * 1000)
+        yield RESULT_EVENT, (facts, answer)
+
+    def _reduce_facts(self, results: List[LLMDocumentResponse]) -> Dict[str, Fact]:
+        facts: Dict[str, Fact] = {}
+        seen = set()
+        fact_counter = 0
+        for result in results:
+            for new_fact in result["new_facts"]:
+                key = " ".join(new_fact["fact"].lower().split())
+                if new_fact["certainty"] == FactCertainty.CONTRADICTS or key in seen:
+                    continue
+                seen.add(key)
+                fact_counter += 1
+                facts[str(fact_counter)] = Fact(
+                    id=str(fact_counter),
+                    fact=new_fact["fact"],
+                    certainty=new_fact["certainty"],
+                    reasoning=new_fact.get("reasoning", "")
+                )
+        return facts
 
-            request_json = json.dumps(request_dto, ensure_ascii=False)
+    def _reduce_prompt(self, question: str, facts: List[Fact], dialog_history: str) -> str:
+        request_json = json.dumps(
+            {"question": question, "facts": facts, "dialog_history": dialog_history},
+            ensure_ascii=False
+        )
+        return self.reduce_prompt_template.format(request_json=request_json)
 
-            chain = LLMChain(llm=self.llm, prompt=self.prompt_template)
-            response_text = chain.run({"request_json": request_json})
+    async def _areduce_answer(
+            self,
+            question: str,
+            facts: List[Fact],
+            dialog_history: str
+    ) -> AsyncIterator[RAGEvent]:
+        """
+        Синтез итогового ответа; текст отдаётся по мере генерации событиями answer_delta.
+        """
+        parts: List[str] = []
+        if facts:
+            try:
+                async for delta in self.llm.astream(self._reduce_prompt(question, facts, dialog_history)):
+                    parts.append(delta)
+                    yield "answer_delta", {"text": delta}
+            except Exception as e:
+                logger.error(f"Reduce step failed: {str(e)}")
+        yield RESULT_EVENT, "".join(parts).strip()
+
+    def _load_dialog(self, user: User, conversation_id: Optional[str]) -> Tuple[str, Conversation]:
+        key = conversation_key(user.id, conversation_id)
+        return key, self.memory.load(key)
+
+    async def _afinish_dialog(self, key: str, question: str, answer: str) -> None:
+        """
+        Сохраняет обмен; свёртка старых сообщений (вызов LLM) идёт в фоне и не задерживает ответ.
+        """
+        await self.memory.aremember(key, question, answer, self.llm)
 
-            return self._parse_response(response_text)
+    def _build_response(
+            self,
+            grouped_chunks: Dict[str, List[Dict[str, Any]]],
+            facts: Dict[str, Fact],
+            answer: str,
+            strategy: AnswerStrategy,
+            start_time: float,
+            timings: Dict[str, int],
+            context_tokens_saved: int = 0
+    ) -> RAGResponse:
+        processing_time_ms = int((time.time() - start_time) * 1000)
+        timings["total"] = processing_time_ms
+
+        used_doc_ids = list(grouped_chunks.keys())
+        used_chunk_ids = [str(chunk["chunk_id"]) for chunks in grouped_chunks.values() for chunk in chunks]
+
+        return RAGResponse(
+            final_result=self._synthesize_answer(list(facts.values()), answer),
+            facts=list(facts.values()),
+            reasoning="\n".join(f["reasoning"] for f in facts.values()),
+            used_documents=used_doc_ids,
+            used_doc_chunks=used_chunk_ids,
+            confidence=min(1.0, len(facts) * 0.2),
+            llm_provider=self.llm.__class__.__name__,
+            processing_time_ms=processing_time_ms,
+            strategy=strategy,
+            stage_timings_ms=timings,
+            context_tokens_saved=context_tokens_saved
+        )
 
-        except Exception as e:
-            logger.error(f"Document processing failed: {str(e)}")
-            return LLMDocumentResponse(answer="", reasoning="", new_facts=[], updated_facts=[], can_answer=False)
+    def _assemble_contexts(
+            self,
+            grouped_chunks: Dict[str, List[Dict[str, Any]]]
+    ) -> Tuple[Dict[str, List[DocumentContextChunk]], int]:
+        """
+        Соседние и перекрывающиеся чанки документа склеиваются, чтобы перекрытие не уходило в LLM дважды.
+        """
+        contexts = assemble_contexts(grouped_chunks)
+        tokens_saved = sum(c.tokens_saved for c in contexts.values())
+        if tokens_saved:
+            logger.debug(f"Context assembly saved ~{tokens_saved} tokens")
+        return {doc_id: c.to_document_context() for doc_id, c in contexts.items()}, tokens_saved
 
-    def _format_history(self, history: List[Dict[str, str]]) -> str:
-        return "\n".join([f"{m['role']}: {m['text']}" for m in history])
+    def _error_response(
+            self,
+            error: Exception,
+            strategy: AnswerStrategy,
+            start_time: float,
+            timings: Dict[str, int]
+    ) -> RAGResponse:
+        logger.error(f"Pipeline execution failed: {str(error)}")
+        return RAGResponse(
+            final_result="Error processing request",
+            facts=[],
+            reasoning=str(error),
+            used_documents=[],
+            used_doc_chunks=[],
+            confidence=0.0,
+            llm_provider=self.llm.__class__.__name__,
+            processing_time_ms=int((time.time() - start_time) * 1000),
+            strategy=strategy,
+            stage_timings_ms=timings
+        )
 
-    def iterative_answer(self, user: User, question: str, doc_ids: Optional[List[str]] = None) -> RAGResponse:
+    async def aiterative_answer_stream(
+            self,
+            user: User,
+            question: str,
+            doc_ids: Optional[List[str]] = None,
+            strategy: Optional[AnswerStrategy] = None,
+            conversation_id: Optional[str] = None
+    ) -> AsyncIterator[RAGEvent]:
+        """
+        Поток событий обработки запроса:
+        sources -> facts (по документу) -> answer / answer_delta -> done (итоговый RAGResponse).
+        При ошибке перед done отдаётся событие error.
+        """
         start_time = time.time()
-        logger.info(f"Starting RAG processing for user {user.id}, question: {question}")
+        strategy = AnswerStrategy(strategy or config.RAG_ANSWER_STRATEGY)
+        logger.info(f"Starting RAG processing for user {user.id} ({strategy.value}), question: {question}")
+        timings: Dict[str, int] = {}
 
         try:
-            # Получаем релевантные чанки
-            chunk_dicts = self._get_similar_chunks(question, user, score_threshold=0.3)
-
-            # Группировка по документу
-            grouped_chunks: dict[str, list[dict]] = defaultdict(list)
-            for chunk in chunk_dicts:
-                grouped_chunks[chunk["document_id"]].append(chunk)
-
-            # Сортировка чанков внутри документа
-            for chunks in grouped_chunks.values():
-                chunks.sort(key=lambda ch: ch.get("chunk_idx", 0))
-
-            # Инициализация глобального списка фактов, ответа и истории
-            facts: Dict[str, Fact] = {}
-            fact_counter = 0
-            answer = ""
-            user_id = str(user.id)
-            history = self.memory.get(user_id, [])
-            history.append({"role": "user", "text": question})
-            dialog_history = self._format_history(history)
-
-            for doc_id, chunks in grouped_chunks.items():
-                # Формируем previous_facts для LLM
-                previous_facts_list = [
-                    {
-                        "id": fact_id,
-                        "fact": fact.text,
-                        "certainty": fact.certainty,
-                        "reasoning": fact.reasoning
-                    }
-                    for fact_id, fact in facts.items()
-                ]
-
-                # Обработка документа
-                result: LLMDocumentResponse = self._process_document(
-                    chunks,
-                    question,
-                    previous_facts_list,
-                    previous_answer=answer,
-                    dialog_history=dialog_history
-                )
-
-                # Обновляем previous_answer
-                answer = result.answer
-
-                # Добавляем новые факты и обновляем существующие
-                for new_fact in result.new_facts:
-                    if new_fact["certainty"] == "contradicts":
-                        continue
-
-                    fact_counter += 1
-                    fact_id = str(fact_counter)
-
-                    facts[fact_id] = Fact(
-                        id=fact_id,
-                        fact=new_fact["fact"],
-                        certainty=new_fact["certainty"],
-                        reasoning=new_fact.get("reasoning", "")
-                    )
-
-                for updated_fact in result.updated_facts:
-                    fact_id = updated_fact.id
-                    if not fact_id or fact_id not in facts:
-                        continue
-                    if updated_fact.certainty == FactCertainty.CONTRADICTS:
-                        del facts[fact_id]
-                    else:
-                        facts[fact_id].fact = updated_fact.text or facts[fact_id].fact
-                        facts[fact_id].certainty = updated_fact.certainty or facts[fact_id].certainty
-                        facts[fact_id].reasoning = updated_fact.reasoning or facts[fact_id].reasoning
-
-            # Обновляем историю
-            history.append({"role": "system", "text": answer})
-            self.memory[user_id] = history
-            processing_time_ms = int((time.time() - start_time) * 1000)
-
-            used_doc_ids = list(grouped_chunks.keys())
-            used_chunk_ids = [str(chunk["chunk_id"]) for chunks in grouped_chunks.values() for chunk in chunks]
-
-            return RAGResponse(
-                final_result=self._synthesize_answer(list(facts.values())),
-                facts=list(facts.values()),
-                reasoning="\n".join(f.reasoning for f in facts.values()),
-                used_documents=used_doc_ids,
-                used_doc_chunks=used_chunk_ids,
-                confidence=min(1.0, len(facts) * 0.2),
-                llm_provider=self.llm.__class__.__name__,
-                processing_time_ms=processing_time_ms
+            dialog_key, conversation = await asyncio.to_thread(self._load_dialog, user, conversation_id)
+            cache_key = await self._aanswer_cache_key(user, question, doc_ids, strategy, conversation)
+            if cache_key is not None:
+                cached = await self.answer_cache.alookup(cache_key)
+                if cached is not None:
+                    cached.conversation_id = conversation_id
+                    await self._afinish_dialog(dialog_key, question, cached.final_result)
+                    for event in self._cached_events(cached, start_time):
+                        yield event
+                    return
+
+            stage_start = time.time()
+            chunk_dicts = await self._aget_similar_chunks(question, user, score_threshold=0.3, doc_ids=doc_ids)
+            timings["retrieval"] = int((time.time() - stage_start) * 1000)
+            # Cross-encoder — CPU-работа, выносим из event loop
+            chunk_dicts = await asyncio.to_thread(self._rerank, question, chunk_dicts, timings)
+            grouped_chunks = self._group_chunks(chunk_dicts)
+            yield "sources", self._sources_event(grouped_chunks)
+            document_contexts, context_tokens_saved = self._assemble_contexts(grouped_chunks)
+
+            dialog_history = self.memory.format(conversation, question)
+
+            if strategy == AnswerStrategy.MAP_REDUCE:
+                events = self._aanswer_map_reduce(document_contexts, question, dialog_history, timings)
+            else:
+                events = self._aanswer_sequential(document_contexts, question, dialog_history, timings)
+
+            facts, answer = {}, ""
+            async for event, payload in events:
+                if event == RESULT_EVENT:
+                    facts, answer = payload
+                else:
+                    yield event, payload
+
+            await self._afinish_dialog(dialog_key, question, answer)
+            response = self._build_response(
+                grouped_chunks, facts, answer, strategy, start_time, timings, context_tokens_saved
             )
+            if cache_key is not None:
+                await self.answer_cache.astore(cache_key, question, response)
+            response.conversation_id = conversation_id
+            yield "done", response
 
         except Exception as e:
-            logger.error(f"Pipeline execution failed: {str(e)}")
-            return RAGResponse(
-                final_result="Error processing request",
-                facts=[],
-                reasoning=str(e),
-                used_documents=[],
-                used_doc_chunks=[],
-                confidence=0.0,
-                llm_provider=self.llm.__class__.__name__,
-                processing_time_ms=int((time.time() - start_time) * 1000)
-            )
+            yield "error", {"detail": str(e)}
+            yield "done", self._error_response(e, strategy, start_time, timings)
+
+    async def aiterative_answer(
+            self,
+            user: User,
+            question: str,
+            doc_ids: Optional[List[str]] = None,
+            strategy: Optional[AnswerStrategy] = None,
+            conversation_id: Optional[str] = None
+    ) -> RAGResponse:
+        response: Optional[RAGResponse] = None
+        async for event, payload in self.aiterative_answer_stream(user, question, doc_ids, strategy, conversation_id):
+            if event == "done":
+                response = payload
+        return response
+
+    def _search_page_size(
+            self,
+            question: str,
+            limit: int,
+            cursor: Optional[str],
+            doc_ids: Optional[List[str]]
+    ) -> Tuple[Optional[SearchCursor], int]:
+        """
+        Разбирает курсор и считает размер страницы: limit, урезанный так, чтобы не уйти глубже SEARCH_MAX_RESULTS.
+        """
+        decoded = SearchCursor.decode(cursor, question, doc_ids) if cursor else None
+        returned = decoded.returned if decoded else 0
+        return decoded, max(min(returned + limit, config.SEARCH_MAX_RESULTS) - returned, 0)
+
+    @staticmethod
+    def _search_response(
+            page: List[Dict[str, Any]],
+            next_cursor: Optional[str],
+            cursor: Optional[SearchCursor],
+            include_text: bool,
+            start_time: float
+    ) -> RAGSearchResponse:
+        if (cursor.returned if cursor else 0) + len(page) >= config.SEARCH_MAX_RESULTS:
+            next_cursor = None
+        return RAGSearchResponse(
+            results=[
+                ScoredChunk(
+                    chunk_id=str(c["chunk_id"]),
+                    document_id=str(c["document_id"]),
+                    chunk_idx=c["chunk_idx"],
+                    score=c["score"],
+                    rrf_score=c.get("rrf_score"),
+                    chunk_text=c["chunk_text"] if include_text else None
+                )
+                for c in page
+            ],
+            next_cursor=next_cursor,
+            processing_time_ms=int((time.time() - start_time) * 1000)
+        )
 
+    async def asearch(
+            self,
+            user: User,
+            question: str,
+            limit: int = 20,
+            cursor: Optional[str] = None,
+            include_text: bool = False,
+            doc_ids: Optional[List[str]] = None
+    ) -> RAGSearchResponse:
+        """
+        Только поиск, без LLM: ранжированные чанки страницами по limit.
+        Каждая страница заново считает окно выдачи глубиной «уже отданные + страница + 1» (есть ли следующая)
+        и отбрасывает отданное по курсору: стоимость растёт с номером страницы, поэтому глубина ограничена
+        SEARCH_MAX_RESULTS. Тексты читаются только для отдаваемой страницы.
+        Некорректный курсор — InvalidCursor (ValueError).
+        """
+        start_time = time.time()
+        decoded, page_size = self._search_page_size(question, limit, cursor, doc_ids)
+        page, next_cursor = [], None
+        if page_size:
+            depth = (decoded.returned if decoded else 0) + page_size + 1
+            chunks = await self._aget_similar_chunks(
+                question, user, top_k=depth, score_threshold=0.3, with_texts=False, doc_ids=doc_ids
+            )
+            page, next_cursor = paginate(chunks, question, page_size, decoded, doc_ids)
+            if include_text:
+                await self.retriever.aattach_texts(page)
+        return self._search_response(page, next_cursor, decoded, include_text, start_time)
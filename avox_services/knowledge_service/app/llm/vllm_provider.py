@@ -28,6 +28,12 @@ class VLLMProvider(BaseLLMProvider):
         """
         return f"[vLLM STUB] Response to: {prompt}"
 
+    async def agenerate(self, prompt: str, **kwargs: Any) -> str:
+        """
+        Stub async generation: no I/O, so no worker thread is needed.
+        """
+        return self.generate(prompt, **kwargs)
+
     def get_model_info(self) -> Dict[str, Any]:
         """
         Get stub model information.
@@ -1,13 +1,33 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from knowledge_service.app.api.routes import router
 from knowledge_service.app.core import config
+from knowledge_service.app.db.session import async_engine
+from knowledge_service.app.embeddings import embedding_registry, get_query_encoder
+from knowledge_service.app.retrieval import get_chunk_reranker
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Модели эмбеддингов загружаются один раз на процесс, а не на каждый запрос
+    if config.EMBEDDING_PRELOAD:
+        embedding_registry.preload(config.EMBEDDING_MODEL_NAME)
+        get_chunk_reranker()
+    yield
+    query_encoder = get_query_encoder()
+    if query_encoder is not None:
+        query_encoder.close()
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title=config.PROJECT_NAME,
     version=config.PROJECT_VERSION,
     docs_url="/swagger",
-    redoc_url=None
+    redoc_url=None,
+    lifespan=lifespan
 )
 
 app.include_router(router)
@@ -2,6 +2,8 @@ from knowledge_service.app.models.access.access_grant import AccessGrant
 from knowledge_service.app.models.base import Base, TimestampMixin
 from knowledge_service.app.models.core.company import Company, User
 from knowledge_service.app.models.core.document import Document, DocumentChunk, ChunkEmbedding384
+from knowledge_service.app.models.core.ingest_job import IngestJob
+from knowledge_service.app.models.cache.answer_cache import AnswerCacheEntry
 
 __all__ = [
     'Base',
@@ -11,5 +13,7 @@ __all__ = [
     'Document',
     'DocumentChunk',
     'ChunkEmbedding384',
-    'AccessGrant'
+    'IngestJob',
+    'AccessGrant',
+    'AnswerCacheEntry'
 ]
\ No newline at end of file
@@ -1,6 +1,6 @@
 import uuid
 
-from sqlalchemy import Column, Boolean, ForeignKey, Enum, DateTime
+from sqlalchemy import Column, Boolean, ForeignKey, Enum, DateTime, Index, text
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from sqlalchemy.orm import relationship
 
@@ -20,4 +20,9 @@ class AccessGrant(Base, TimestampMixin):
 
     # Связи
     document = relationship("Document", back_populates="access_grants")
-    user = relationship("User", back_populates="access_grants")
\ No newline at end of file
+    user = relationship("User", back_populates="access_grants")
+
+    __table_args__ = (
+        # Поиск действующих грантов пользователя в предикате доступа RAG
+        Index('ix_access_grant_user_document', 'user_id', 'document_id', postgresql_where=text('is_revoked = false')),
+    )
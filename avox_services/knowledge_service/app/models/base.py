@@ -16,7 +16,7 @@ class TimestampMixin:
     updated_at = Column(
         DateTime(timezone=True),
         default=lambda: datetime.now(timezone.utc),
-        onupdate=datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
         nullable=False,
         comment="Время последнего обновления"
     )
\ No newline at end of file
@@ -0,0 +1,37 @@
+import uuid
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.dialects.postgresql import JSONB, UUID as PG_UUID
+
+from knowledge_service.app.models.base import Base, TimestampMixin
+
+
+class AnswerCacheEntry(Base, TimestampMixin):
+    """
+    Сохранённый ответ RAG для семантического кэша (см. SemanticAnswerCache).
+    """
+    __tablename__ = 'answer_cache_entries'
+
+    id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4,
+                comment="Уникальный идентификатор записи кэша")
+    company_id = Column(PG_UUID(as_uuid=True), ForeignKey('companies.id', ondelete="CASCADE"), nullable=False,
+                comment="Компания, в рамках которой действует запись")
+    scope_key = Column(String(64), nullable=False,
+                comment="Отпечаток набора доступных документов (и ограничения doc_ids)")
+    strategy = Column(String(32), nullable=False, comment="Стратегия ответа: sequential, map_reduce")
+    embedding_model = Column(String(length=255), nullable=False, comment="Модель эмбеддинга вопроса")
+    question_text = Column(Text, nullable=False, comment="Исходный вопрос")
+    question_vector = Column(Vector(384), nullable=False, comment="Эмбеддинг вопроса (cosine)")
+    response = Column(JSONB, nullable=False, comment="Сериализованный RAGResponse")
+    document_versions = Column(JSONB, nullable=False,
+                comment="Версии использованных документов: {document_id: updated_at}")
+    hit_count = Column(Integer, nullable=False, default=0, comment="Количество попаданий")
+    last_hit_at = Column(DateTime(timezone=True), nullable=True, comment="Время последнего попадания")
+
+    __table_args__ = (
+        # Поиск идёт внутри (компания, набор доступа) — размер раздела ограничен ANSWER_CACHE_MAX_ENTRIES,
+        # поэтому расстояние считается точно, без векторного индекса
+        Index('ix_answer_cache_scope', 'company_id', 'scope_key', 'strategy'),
+        Index('ix_answer_cache_created_at', 'created_at'),
+    )
@@ -2,13 +2,14 @@ import uuid
 from datetime import datetime
 from typing import Optional
 
-from pgvector.sqlalchemy import Vector
-from sqlalchemy import or_, Column, Enum, ForeignKey, Text, String, Boolean, Integer, Index, DateTime
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import or_, text, Column, Computed, Enum, ForeignKey, Text, String, Boolean, Integer, Index, DateTime
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID as PG_UUID
 from sqlalchemy.orm import relationship, validates
 
+from knowledge_service.app.core import config
 from knowledge_service.app.models import Base, AccessGrant, User, TimestampMixin
-from knowledge_service.app.models.enums import DocAccessLevel, SourceType, UserType, EmbeddingStatus
+from knowledge_service.app.models.enums import DocAccessLevel, DocAccessRole, SourceType, UserType, EmbeddingStatus
 
 
 class Document(Base, TimestampMixin):
@@ -27,6 +28,8 @@ class Document(Base, TimestampMixin):
     is_hot = Column(Boolean, default=False, index=True, comment="Является ли актуальным")
     is_approved = Column(Boolean, default=False, index=True, comment="Одобрен ли документ")
     last_accessed_at = Column(DateTime, nullable=True, comment="Время последнего доступа")
+    version = Column(Integer, nullable=False, default=1, server_default="1",
+                comment="Версия содержимого; растёт при каждом обновлении текста")
 
     # Связи
     chunks = relationship(
@@ -46,6 +49,11 @@ class Document(Base, TimestampMixin):
     company = relationship("Company", back_populates="documents")
     owner = relationship("User", back_populates="created_documents")
 
+    __table_args__ = (
+        # Ветки PUBLIC/INTERNAL предиката доступа RAG
+        Index('ix_document_company_access', 'company_id', 'access_level', 'is_approved'),
+    )
+
     @validates('access_level')
     def validate_access_level(self, key, value):
         if value == DocAccessLevel.PUBLIC and not self.is_approved:
@@ -78,6 +86,30 @@ class Document(Base, TimestampMixin):
             )
         ).first() is not None
 
+    def can_edit(self, user: Optional[User]) -> bool:
+        """Право менять текст документа: владелец, сотрудник компании (INTERNAL/PUBLIC) или грант EDITOR"""
+        if user is None or user.company_id != self.company_id:
+            return False
+
+        if user.id == self.owner_id:
+            return True
+
+        if self.access_level in (DocAccessLevel.INTERNAL, DocAccessLevel.PUBLIC) and user.user_type == UserType.INTERNAL:
+            return True
+
+        return self.access_grants.filter(
+            AccessGrant.user_id == user.id,
+            AccessGrant.access_role == DocAccessRole.EDITOR,
+            AccessGrant.is_revoked == False,
+            or_(
+                AccessGrant.expires_at == None,
+                AccessGrant.expires_at >= datetime.now()
+            )
+        ).first() is not None
+
+# Генерируемая колонка заполняется самой БД при вставке/изменении chunk_text
+CHUNK_TSV_EXPRESSION = "to_tsvector('russian', chunk_text) || to_tsvector('simple', chunk_text)"
+
 class DocumentChunk(Base, TimestampMixin):
     __tablename__ = 'document_chunks'
 
@@ -90,13 +122,17 @@ class DocumentChunk(Base, TimestampMixin):
     chunk_idx = Column(Integer, nullable=False, comment="Позиция части в документе")
     chunk_scope = Column(String(64), nullable=True, comment="Единица разбиения чанка: symbols, words, sentence")
     overlap = Column(Integer, nullable=False, default=0, comment="Количество перекрывающихся единиц (слов, предложений и т.п.) между чанками")
+    content_hash = Column(String(64), nullable=True, comment="sha256 нормализованного текста — сравнение версий документа")
+    chunk_tsv = Column(TSVECTOR, Computed(CHUNK_TSV_EXPRESSION, persisted=True),
+                comment="Полнотекстовый индекс текста: russian (словоформы) + simple (коды, номера, имена как есть)")
     # Связи
     document = relationship("Document", back_populates="chunks")
     embeddings = relationship("ChunkEmbedding384", back_populates="chunk", cascade="all, delete-orphan")
 
     __table_args__ = (
-        Index('ix_chunk_document_idx', 'document_id', 'chunk_idx', unique=True)
-    ),
+        Index('ix_chunk_document_idx', 'document_id', 'chunk_idx', unique=True),
+        Index('ix_chunk_tsv', 'chunk_tsv', postgresql_using='gin'),
+    )
 
     @property
     def document_metadata (self):
@@ -106,28 +142,81 @@ class DocumentChunk(Base, TimestampMixin):
             'position': self.chunk_idx
         }
 
+def vector_index(index_type: str = config.VECTOR_INDEX_TYPE) -> Index:
+    """Векторный индекс эмбеддингов: hnsw (по умолчанию) или ivfflat"""
+    if index_type == "hnsw":
+        return Index(
+            'ix_chunk_vector_hnsw',
+            'vector',
+            postgresql_using='hnsw',
+            postgresql_ops={'vector': 'vector_cosine_ops'},
+            postgresql_with={"m": config.HNSW_M, "ef_construction": config.HNSW_EF_CONSTRUCTION}
+        )
+    return Index(
+        'ix_chunk_vector_cosine',
+        'vector',
+        postgresql_using='ivfflat',
+        postgresql_ops={'vector': 'vector_cosine_ops'},
+        postgresql_with={"lists": config.IVFFLAT_LISTS}
+    )
+
+# Компактные копии вектора для первого этапа поиска (VECTOR_STORAGE): считаются СУБД при вставке.
+# В схеме есть только колонка настроенного режима; сменить режим — app/cli/vector_storage.py
+VECTOR_HALF_EXPRESSION = "CAST(vector AS halfvec(384))"
+VECTOR_BIT_EXPRESSION = "CAST(binary_quantize(vector) AS bit(384))"
+
+
+def quantized_vector_index(storage: str) -> Index:
+    """HNSW-индекс по компактной колонке: halfvec (cosine) или bit (hamming)"""
+    column, ops = ('vector_half', 'halfvec_cosine_ops') if storage == "halfvec" else ('vector_bit', 'bit_hamming_ops')
+    return Index(
+        f'ix_chunk_{column}_hnsw',
+        column,
+        postgresql_using='hnsw',
+        postgresql_ops={column: ops},
+        postgresql_with={"m": config.HNSW_M, "ef_construction": config.HNSW_EF_CONSTRUCTION}
+    )
+
+
+def search_vector_index(storage: str = config.VECTOR_STORAGE) -> Index:
+    """
+    Индекс первого этапа поиска для режима хранения: при halfvec / binary индекс по полному вектору
+    не строится — дорескоринг и точный перебор по нему индекс не используют.
+    """
+    if storage in ("halfvec", "binary"):
+        return quantized_vector_index(storage)
+    return vector_index()
+
 class ChunkEmbedding384(Base, TimestampMixin):
     __tablename__ = 'chunk_embeddings_384'
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, comment="Уникальный идентификатор эмбеддинга")
     chunk_id = Column(PG_UUID(as_uuid=True), ForeignKey('document_chunks.id', ondelete="CASCADE"), nullable=False, comment="Фрагмент, к которому относится эмбеддинг")
-    vector = Column(Vector(384), nullable=False, comment="Эмбеддинг вектора (use cosine; ivfflat(lists=100))")
+    vector = Column(Vector(384), nullable=True, comment="Эмбеддинг вектора (use cosine; hnsw или ivfflat); NULL, пока статус PENDING")
+    if config.VECTOR_STORAGE == "halfvec":
+        vector_half = Column(HALFVEC(384), Computed(VECTOR_HALF_EXPRESSION, persisted=True),
+                    comment="Вектор в half precision для компактного индекса (halfvec_cosine_ops)")
+    elif config.VECTOR_STORAGE == "binary":
+        vector_bit = Column(BIT(384), Computed(VECTOR_BIT_EXPRESSION, persisted=True),
+                    comment="Бинарно-квантованный вектор для индекса по расстоянию Хэмминга")
     embedding_scope = Column(String(64), nullable=False, default="chunk", comment="Область эмбеддинга: chunk, subchunk и др.")
     subchunk_idx = Column(Integer, nullable=False, default=0, comment="Порядковый номер подчанка внутри фрагмента")
     embedding_model = Column(String(length=255), nullable=False, index=True, comment="Название модели эмбеддинга")
+    content_hash = Column(String(64), nullable=True, comment="sha256 нормализованного текста подчанка — ключ повторного использования вектора")
     overlap = Column(Integer, nullable=False, default=0, comment="Количество перекрывающихся единиц (слов, токенов и т.п.) между подчанками")
     status = Column(Enum(EmbeddingStatus), nullable=False, default=EmbeddingStatus.PENDING, comment="Статус эмбеддинга: pending, processing, completed, completed")
     attempts = Column(Integer, default=0, nullable=False, comment="Количество попыток обработки")
     error_message = Column(Text, nullable=True, comment="Сообщение об ошибке при обработке эмбеддинга")
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True, comment="Не раньше этого времени — повтор после ошибки")
 
     # Связи
     chunk = relationship("DocumentChunk", back_populates="embeddings")
 
     __table_args__ = (
-        Index(
-            'ix_chunk_vector_cosine',
-            'vector',
-            postgresql_using='ivfflat',
-            postgresql_ops={'vector': 'vector_cosine_ops'},
-            postgresql_with={"lists": 100}
-        ),
+        search_vector_index(),
+        Index('ix_chunk_embedding_chunk_id', 'chunk_id'),
+        # Очередь фонового расчёта: обработчики выбирают только PENDING-строки
+        Index('ix_chunk_embedding_pending', 'created_at', postgresql_where=text("status = 'PENDING'")),
+        # Хранилище векторов по содержимому: тот же текст той же моделью не кодируется повторно
+        Index('ix_chunk_embedding_content_hash', 'embedding_model', 'content_hash',
+              postgresql_where=text("status = 'COMPLETED'")),
     )
\ No newline at end of file
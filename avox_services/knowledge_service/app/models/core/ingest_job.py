@@ -0,0 +1,38 @@
+import uuid
+
+from sqlalchemy import Column, DateTime, Enum, ForeignKey, Index, Integer, Text
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+from knowledge_service.app.models.base import Base, TimestampMixin
+from knowledge_service.app.models.enums import IngestJobStatus
+
+
+class IngestJob(Base, TimestampMixin):
+    """
+    Фоновый инжест документа: документ и чанки уже записаны, эмбеддинги в статусе PENDING.
+    Прогресс считается по статусам эмбеддингов документа (см. services.ingest_jobs).
+    """
+    __tablename__ = 'ingest_jobs'
+
+    id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4,
+                comment="Уникальный идентификатор задания")
+    company_id = Column(PG_UUID(as_uuid=True), ForeignKey('companies.id', ondelete="CASCADE"), nullable=False,
+                comment="Компания, в рамках которой выполняется инжест")
+    owner_id = Column(PG_UUID(as_uuid=True), ForeignKey('users.id', ondelete="SET NULL"), nullable=True,
+                comment="Пользователь, загрузивший документ")
+    document_id = Column(PG_UUID(as_uuid=True), ForeignKey('documents.id', ondelete="CASCADE"), nullable=False,
+                comment="Инжестируемый документ")
+    status = Column(Enum(IngestJobStatus), nullable=False, default=IngestJobStatus.QUEUED,
+                comment="Статус задания: queued, running, completed, failed")
+    total_chunks = Column(Integer, nullable=False, default=0, comment="Чанков в документе")
+    total_subchunks = Column(Integer, nullable=False, default=0, comment="Подчанков (эмбеддингов) к расчёту")
+    reused_subchunks = Column(Integer, nullable=False, default=0, server_default="0",
+                comment="Подчанков, векторы которых взяты из хранилища по хэшу содержимого")
+    error_message = Column(Text, nullable=True, comment="Ошибка, остановившая задание")
+    started_at = Column(DateTime(timezone=True), nullable=True, comment="Начало расчёта эмбеддингов")
+    finished_at = Column(DateTime(timezone=True), nullable=True, comment="Окончание задания")
+
+    __table_args__ = (
+        Index('ix_ingest_job_document_id', 'document_id'),
+        Index('ix_ingest_job_company_id', 'company_id', 'created_at'),
+    )
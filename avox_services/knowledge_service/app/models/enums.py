@@ -1,17 +1,20 @@
 from enum import Enum as PyEnum
 
+
 class AuthProvider(PyEnum):
     INTERNAL = 'internal'
     VK = 'vk'
     YANDEX = 'yandex'
     GOOGLE = 'google'
 
+
 class UserType(PyEnum):  # Тип пользователя (внешний/внутренний)
     UNKNOWN = 'unknown'
     INTERNAL = 'internal'  # Сотрудник
     EXTERNAL = 'external'  # Клиент
     SYSTEM = 'system'      # Технический аккаунт
 
+
 class UserRole(PyEnum):
     BASE = 'base'             # Базовые права
     MANAGER = 'manager'       # Управление контентом
@@ -19,12 +22,14 @@ class UserRole(PyEnum):
     ADMIN = 'admin'           # Полные права
     API = 'api'               # Доступ только к API
 
+
 class DocAccessRole(PyEnum):  # Уровни доступа
     UNKNOWN = 'unknown'
     READER = 'reader'           # Чтение документа
     CONTRIBUTOR = 'contributor' # Может предлагать правки
     EDITOR = 'editor'           # Редактирование
 
+
 class SourceType(PyEnum):
     TEXT_INPUT = 'text_input'
     FILE = 'file'
@@ -32,19 +37,29 @@ class SourceType(PyEnum):
     WEB_SCRAPING = 'web_scraping'
     CONFLUENCE = 'Confluence'
 
+
 class DocumentStatus(PyEnum):
     DRAFT = 'draft'
     PUBLISHED = 'published'
     ARCHIVED = 'archived'
     DELETED = 'deleted'
 
+
 class DocAccessLevel(PyEnum):
     RESTRICTED = 'restricted'   # Персональный доступ (через AccessGrant)
     INTERNAL = 'internal'       # Только для сотрудников компании
     PUBLIC = 'public'           # Виден всем (но создавать могут только админы/доверенные редакторы)
 
+
 class EmbeddingStatus(PyEnum):
     PENDING = 'pending'
     PROCESSING = 'processing'
     COMPLETED = 'completed'
-    FAILED = 'failed'
\ No newline at end of file
+    FAILED = 'failed'
+
+
+class IngestJobStatus(PyEnum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
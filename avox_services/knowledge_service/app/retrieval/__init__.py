@@ -0,0 +1,36 @@
+from knowledge_service.app.db.access_versions import (
+    access_versions,
+    mark_access_changed,
+    register_access_invalidation,
+)
+from knowledge_service.app.retrieval.access import AccessScope, DocumentFilter
+from knowledge_service.app.retrieval.access_cache import (
+    AccessSet,
+    AccessSetCache,
+    access_set_cache,
+    get_access_set_cache,
+)
+from knowledge_service.app.retrieval.config import RetrievalConfig
+from knowledge_service.app.retrieval.engine import ChunkRetriever, score_chunk
+from knowledge_service.app.retrieval.pagination import InvalidCursor, SearchCursor, paginate
+from knowledge_service.app.retrieval.rerank import ChunkReranker, get_chunk_reranker
+
+__all__ = [
+    'AccessScope',
+    'AccessSet',
+    'AccessSetCache',
+    'DocumentFilter',
+    'access_set_cache',
+    'access_versions',
+    'get_access_set_cache',
+    'mark_access_changed',
+    'register_access_invalidation',
+    'ChunkReranker',
+    'ChunkRetriever',
+    'get_chunk_reranker',
+    'InvalidCursor',
+    'SearchCursor',
+    'paginate',
+    'RetrievalConfig',
+    'score_chunk'
+]
@@ -0,0 +1,93 @@
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Optional
+
+from knowledge_service.app.core import config
+from knowledge_service.app.models.core.company import User
+from knowledge_service.app.models.enums import UserType
+
+# Предикат доступа (PUBLIC / владелец / INTERNAL / AccessGrant) в виде CTE для векторного запроса.
+# Каждая ветка UNION покрывается своим индексом, поэтому список документов не строится в Python.
+ACCESSIBLE_DOCUMENTS_CTE = """
+accessible_docs AS (
+    SELECT d.id
+    FROM documents d
+    WHERE d.company_id = CAST(:company_id AS uuid)
+      AND d.access_level = 'PUBLIC'
+      AND d.is_approved = true
+    UNION
+    SELECT d.id
+    FROM documents d
+    WHERE CAST(:is_internal AS boolean)
+      AND d.company_id = CAST(:company_id AS uuid)
+      AND d.access_level = 'INTERNAL'
+    UNION
+    SELECT d.id
+    FROM documents d
+    WHERE d.owner_id = CAST(:user_id AS uuid)
+    UNION
+    SELECT g.document_id
+    FROM access_grants g
+    WHERE g.user_id = CAST(:user_id AS uuid)
+      AND g.is_revoked = false
+      AND (g.expires_at IS NULL OR g.expires_at >= LOCALTIMESTAMP)
+)
+"""
+
+
+@dataclass(frozen=True)
+class AccessScope:
+    """
+    Контекст доступа пользователя для SQL-предиката (см. Document.get_effective_access).
+    """
+    user_id: uuid.UUID
+    company_id: Optional[uuid.UUID]
+    is_internal: bool
+
+    @classmethod
+    def from_user(cls, user: Optional[User]) -> Optional["AccessScope"]:
+        if user is None:
+            return None
+        return cls(
+            user_id=user.id,
+            company_id=user.company_id,
+            is_internal=user.user_type == UserType.INTERNAL
+        )
+
+    def params(self) -> Dict[str, Any]:
+        return {
+            "user_id": str(self.user_id),
+            "company_id": str(self.company_id) if self.company_id else None,
+            "is_internal": self.is_internal,
+        }
+
+
+@dataclass(frozen=True)
+class DocumentFilter:
+    """
+    Условие на dc.document_id для запросов поиска и нужные ему CTE/параметры.
+    exact_scan — документов мало: расстояние считается по всем их подчанкам, без ANN-индекса.
+    """
+    condition: str
+    ctes: str = ""
+    params: Dict[str, Any] = field(default_factory=dict)
+    is_empty: bool = False
+    exact_scan: bool = False
+
+    @classmethod
+    def by_access(cls, scope: AccessScope) -> "DocumentFilter":
+        return cls(
+            condition="dc.document_id IN (SELECT id FROM accessible_docs)",
+            ctes=ACCESSIBLE_DOCUMENTS_CTE + ",",
+            params=scope.params()
+        )
+
+    @classmethod
+    def by_ids(cls, doc_ids: Iterable[Any]) -> "DocumentFilter":
+        ids = [str(doc_id) for doc_id in doc_ids]
+        return cls(
+            condition="dc.document_id = ANY(CAST(:doc_ids AS uuid[]))",
+            params={"doc_ids": ids},
+            is_empty=not ids,
+            exact_scan=len(ids) <= config.EXACT_SCAN_MAX_DOCUMENTS
+        )
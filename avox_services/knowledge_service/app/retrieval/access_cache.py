@@ -0,0 +1,149 @@
+import hashlib
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from knowledge_service.app.core import config
+from knowledge_service.app.core.cache import LRUTTLCache
+from knowledge_service.app.db.access_versions import AccessVersionStore, access_versions
+from knowledge_service.app.retrieval.access import ACCESSIBLE_DOCUMENTS_CTE, AccessScope
+
+ACCESS_SET_SQL = """
+WITH """ + ACCESSIBLE_DOCUMENTS_CTE + """
+SELECT id FROM accessible_docs ORDER BY id
+"""
+
+# Ближайшее истечение гранта: после него набор документов пользователя устаревает
+NEXT_GRANT_EXPIRY_SQL = """
+SELECT MIN(g.expires_at) AS valid_until
+FROM access_grants g
+WHERE g.user_id = CAST(:user_id AS uuid)
+  AND g.is_revoked = false
+  AND g.expires_at >= LOCALTIMESTAMP
+"""
+
+UUID_SIZE = 16
+
+
+class AccessSet:
+    """
+    Компактный набор доступных документов: отсортированные 16-байтовые UUID в одном bytes.
+    """
+
+    __slots__ = ("_data", "version", "valid_until", "_fingerprint")
+
+    def __init__(self, doc_ids: Iterable[uuid.UUID], version: Tuple[int, int], valid_until: Optional[datetime] = None):
+        self._data = b"".join(sorted(doc_id.bytes for doc_id in doc_ids))
+        self.version = version
+        self.valid_until = valid_until
+        self._fingerprint: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._data) // UUID_SIZE
+
+    def __contains__(self, doc_id: Any) -> bool:
+        key = (doc_id if isinstance(doc_id, uuid.UUID) else uuid.UUID(str(doc_id))).bytes
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            item = self._data[mid * UUID_SIZE:(mid + 1) * UUID_SIZE]
+            if item < key:
+                lo = mid + 1
+            elif item > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def ids(self) -> List[uuid.UUID]:
+        return [uuid.UUID(bytes=self._data[i:i + UUID_SIZE]) for i in range(0, len(self._data), UUID_SIZE)]
+
+    def intersect(self, doc_ids: Iterable[Any]) -> List[uuid.UUID]:
+        result = []
+        for doc_id in doc_ids:
+            try:
+                parsed = doc_id if isinstance(doc_id, uuid.UUID) else uuid.UUID(str(doc_id))
+            except ValueError:
+                continue
+            if parsed in self:
+                result.append(parsed)
+        return result
+
+    @property
+    def fingerprint(self) -> str:
+        """Отпечаток содержимого: одинаков у пользователей с одинаковым набором документов"""
+        if self._fingerprint is None:
+            self._fingerprint = hashlib.sha256(self._data).hexdigest()
+        return self._fingerprint
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._data)
+
+    def is_expired(self, now: Optional[datetime] = None) -> bool:
+        return self.valid_until is not None and (now or datetime.now()) >= self.valid_until
+
+
+class AccessSetCache:
+    """
+    Кэш эффективного набора доступных документов пользователя.
+    Запись валидна, пока совпадают версии (компания, пользователь) и не истёк ближайший грант.
+    Ключ включает компанию и тип пользователя: их смена в обход ORM не отдаёт чужой набор.
+    """
+
+    def __init__(
+            self,
+            versions: AccessVersionStore,
+            max_size: int = config.ACCESS_SET_CACHE_SIZE,
+            ttl_seconds: int = config.ACCESS_SET_CACHE_TTL
+    ):
+        self.versions = versions
+        self.entries: LRUTTLCache[AccessSet] = LRUTTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.stale = 0
+
+    @staticmethod
+    def _key(scope: AccessScope) -> str:
+        return f"{scope.user_id}:{scope.company_id}:{int(scope.is_internal)}"
+
+    def _cached(self, key: str, version: Tuple[int, int]) -> Optional[AccessSet]:
+        cached = self.entries.get(key)
+        if cached is not None:
+            if cached.version == version and not cached.is_expired():
+                return cached
+            self.stale += 1
+        return None
+
+    async def aget(self, db: AsyncSession, scope: AccessScope) -> AccessSet:
+        version = self.versions.get(scope)
+        key = self._key(scope)
+        cached = self._cached(key, version)
+        if cached is not None:
+            return cached
+
+        params = scope.params()
+        doc_ids = (await db.execute(text(ACCESS_SET_SQL), params)).scalars().all()
+        valid_until = (await db.execute(text(NEXT_GRANT_EXPIRY_SQL), {"user_id": params["user_id"]})).scalar()
+
+        access_set = AccessSet(doc_ids, version=version, valid_until=valid_until)
+        self.entries.set(key, access_set)
+        return access_set
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self.entries.values()
+        stats = self.entries.stats()
+        stats.update({
+            "stale": self.stale,
+            "documents": sum(len(e) for e in entries),
+            "memory_bytes": sum(e.nbytes for e in entries),
+        })
+        return stats
+
+
+access_set_cache = AccessSetCache(access_versions)
+
+
+def get_access_set_cache() -> AccessSetCache:
+    return access_set_cache
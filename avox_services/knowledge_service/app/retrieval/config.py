@@ -0,0 +1,77 @@
+import uuid
+from dataclasses import dataclass, fields, replace
+from typing import List, Optional, Union
+
+from knowledge_service.app.core import config
+
+ITERATIVE_SCAN_MODES = ("off", "relaxed_order", "strict_order")
+RETRIEVAL_MODES = ("vector", "hybrid")
+VECTOR_STORAGES = ("full", "halfvec", "binary")
+# Верхняя граница hnsw.ef_search в pgvector
+HNSW_MAX_EF_SEARCH = 1000
+
+
+@dataclass(frozen=True)
+class RetrievalConfig:
+    """
+    Параметры поиска по векторному индексу для одного запроса.
+    Позволяют менять баланс recall/latency по компаниям (см. RETRIEVAL_TENANT_OVERRIDES).
+    """
+    index_type: str = config.VECTOR_INDEX_TYPE
+    ef_search: Optional[int] = config.HNSW_EF_SEARCH
+    ivfflat_probes: Optional[int] = config.IVFFLAT_PROBES
+    iterative_scan: Optional[str] = config.HNSW_ITERATIVE_SCAN
+    mode: str = config.RETRIEVAL_MODE
+    rrf_k: int = config.RRF_K
+    fts_candidates: int = config.FTS_CANDIDATES
+    vector_storage: str = config.VECTOR_STORAGE
+    rescore_factor: int = config.VECTOR_RESCORE_FACTOR
+
+    @property
+    def is_hybrid(self) -> bool:
+        return self.mode == "hybrid"
+
+    @property
+    def is_quantized(self) -> bool:
+        return self.vector_storage in VECTOR_STORAGES[1:]
+
+    @property
+    def is_iterative(self) -> bool:
+        return self.iterative_scan in ITERATIVE_SCAN_MODES[1:]
+
+    @classmethod
+    def for_company(cls, company_id: Optional[Union[uuid.UUID, str]]) -> "RetrievalConfig":
+        overrides = config.RETRIEVAL_TENANT_OVERRIDES.get(str(company_id), {}) if company_id else {}
+        known = {f.name for f in fields(cls)}
+        # В схеме есть только компактная колонка режима VECTOR_STORAGE: другой компактный режим компании недоступен
+        if overrides.get("vector_storage") not in (None, "full", config.VECTOR_STORAGE):
+            known = known - {"vector_storage"}
+        return replace(cls(), **{k: v for k, v in overrides.items() if k in known})
+
+    def effective_candidate_limit(self, candidate_limit: int) -> int:
+        """
+        HNSW возвращает не больше ef_search строк: при явно заданном ef_search кандидатов берётся не больше него.
+        Итеративное сканирование продолжает обход индекса, пока LIMIT не набран, — ограничения нет.
+        """
+        if (self.index_type == "hnsw" or self.is_quantized) and self.ef_search and not self.is_iterative:
+            return min(candidate_limit, self.ef_search)
+        return candidate_limit
+
+    def session_settings(self, candidate_limit: int) -> List[str]:
+        """
+        SET LOCAL-команды для текущей транзакции перед векторным поиском.
+        """
+        statements = []
+        # Компактные индексы (vector_half / vector_bit) всегда HNSW
+        if self.index_type == "hnsw" or self.is_quantized:
+            ef_search = self.ef_search or candidate_limit
+            statements.append(f"SET LOCAL hnsw.ef_search = {min(int(ef_search), HNSW_MAX_EF_SEARCH)}")
+            if self.iterative_scan in ITERATIVE_SCAN_MODES:
+                statements.append(f"SET LOCAL hnsw.iterative_scan = {self.iterative_scan}")
+        elif self.index_type == "ivfflat":
+            if self.ivfflat_probes:
+                statements.append(f"SET LOCAL ivfflat.probes = {int(self.ivfflat_probes)}")
+            # IVFFlat поддерживает только relaxed_order
+            if self.iterative_scan in ITERATIVE_SCAN_MODES[:2]:
+                statements.append(f"SET LOCAL ivfflat.iterative_scan = {self.iterative_scan}")
+        return statements
@@ -0,0 +1,392 @@
+import logging
+import re
+import time
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from knowledge_service.app.retrieval.access import DocumentFilter
+from knowledge_service.app.retrieval.config import RetrievalConfig
+
+logger = logging.getLogger(__name__)
+
+# Веса итогового скора чанка: лучший подчанк, среднее по top-k подчанкам, доля совпавших подчанков
+BEST_WEIGHT = 0.6
+AVG_WEIGHT = 0.3
+MATCH_WEIGHT = 0.1
+
+
+def score_chunk(best_distance: float, avg_distance: float, match_count: int, subchunk_top_k: int) -> float:
+    norm_best = 1 - best_distance
+    norm_avg = 1 - avg_distance
+    norm_match = match_count / subchunk_top_k
+    return BEST_WEIGHT * norm_best + AVG_WEIGHT * norm_avg + MATCH_WEIGHT * norm_match
+
+
+# 1) ANN top-N по подчанкам: ORDER BY vector <=> q LIMIT n использует векторный индекс;
+# 2) агрегация best/avg/match_count только по кандидатам;
+# 3) тексты чанков подтягиваются отдельно и только для финальных top_k.
+# Доступ проверяется прямо в запросе: полусоединением с accessible_docs или по кэшированному набору id.
+ANN_CANDIDATES_CTE = """
+candidates AS (
+    SELECT
+        emb.chunk_id,
+        emb.vector <=> CAST(:query_vector AS vector) AS dist
+    FROM chunk_embeddings_384 emb
+    JOIN document_chunks dc ON dc.id = emb.chunk_id
+    WHERE {document_filter}
+      AND emb.status = 'COMPLETED'
+    ORDER BY emb.vector <=> CAST(:query_vector AS vector)
+    LIMIT :candidate_limit
+),"""
+
+# Расстояние по компактному представлению (генерируемые колонки vector_half / vector_bit со своими индексами)
+APPROX_DISTANCES = {
+    "halfvec": "emb.vector_half <=> CAST(CAST(:query_vector AS vector) AS halfvec(384))",
+    "binary": "emb.vector_bit <~> binary_quantize(CAST(:query_vector AS vector))",
+}
+
+# Квантованный поиск: первый этап — индекс по halfvec / bit (меньше в разы, помещается в shared_buffers),
+# затем approx_limit кандидатов пересчитываются по полному вектору, дальше — как обычно
+QUANTIZED_CANDIDATES_CTE = """
+approx AS (
+    SELECT emb.id
+    FROM chunk_embeddings_384 emb
+    JOIN document_chunks dc ON dc.id = emb.chunk_id
+    WHERE {document_filter}
+      AND emb.status = 'COMPLETED'
+    ORDER BY {approx_distance}
+    LIMIT :approx_limit
+),
+candidates AS (
+    SELECT
+        emb.chunk_id,
+        emb.vector <=> CAST(:query_vector AS vector) AS dist
+    FROM approx a
+    JOIN chunk_embeddings_384 emb ON emb.id = a.id
+    ORDER BY dist
+    LIMIT :candidate_limit
+),"""
+
+
+# Точный перебор для узкой области (несколько документов): MATERIALIZED не даёт планировщику
+# заменить сортировку обходом глобального ANN-индекса с фильтром — тот отбросил бы почти все строки.
+# Стоимость зависит только от числа подчанков выбранных документов, а не от размера корпуса.
+EXACT_CANDIDATES_CTE = """
+scoped AS MATERIALIZED (
+    SELECT
+        emb.chunk_id,
+        emb.vector <=> CAST(:query_vector AS vector) AS dist
+    FROM document_chunks dc
+    JOIN chunk_embeddings_384 emb ON emb.chunk_id = dc.id
+    WHERE {document_filter}
+      AND emb.status = 'COMPLETED'
+),
+candidates AS (
+    SELECT chunk_id, dist
+    FROM scoped
+    ORDER BY dist
+    LIMIT :candidate_limit
+),"""
+
+
+def candidates_cte(vector_storage: str, document_filter: str, exact_scan: bool = False) -> str:
+    if exact_scan:
+        return EXACT_CANDIDATES_CTE.format(document_filter=document_filter)
+    if vector_storage in APPROX_DISTANCES:
+        return QUANTIZED_CANDIDATES_CTE.format(
+            document_filter=document_filter, approx_distance=APPROX_DISTANCES[vector_storage]
+        )
+    return ANN_CANDIDATES_CTE.format(document_filter=document_filter)
+
+
+CANDIDATES_SQL = """
+WITH {ctes}
+{candidates}
+ranked AS (
+    SELECT
+        chunk_id,
+        dist,
+        ROW_NUMBER() OVER (PARTITION BY chunk_id ORDER BY dist) AS subchunk_rank
+    FROM candidates
+)
+SELECT
+    r.chunk_id,
+    dc.document_id,
+    dc.chunk_idx,
+    MIN(r.dist) AS best_distance,
+    AVG(r.dist) FILTER (WHERE r.subchunk_rank <= :subchunk_top_k) AS avg_distance,
+    COUNT(*) FILTER (WHERE r.subchunk_rank <= :subchunk_top_k) AS match_count
+FROM ranked r
+JOIN document_chunks dc ON dc.id = r.chunk_id
+GROUP BY r.chunk_id, dc.document_id, dc.chunk_idx
+ORDER BY best_distance ASC
+LIMIT :top_k
+"""
+
+# Гибридный поиск: те же ANN-кандидаты + полнотекстовые кандидаты по chunk_tsv (GIN),
+# объединённые reciprocal rank fusion: score = 1/(k + ann_rank) + 1/(k + fts_rank).
+# Обе ветки выполняются в одном запросе, поэтому второй roundtrip к БД не нужен.
+# Вопрос превращается в OR-запрос: plainto_tsquery даёт AND всех слов, что для вопроса слишком строго.
+# Чанки, эмбеддинги которых ещё считаются (фоновый инжест), полнотекстовая ветка тоже пропускает.
+HYBRID_SQL = """
+WITH {ctes}
+{candidates}
+ranked AS (
+    SELECT
+        chunk_id,
+        dist,
+        ROW_NUMBER() OVER (PARTITION BY chunk_id ORDER BY dist) AS subchunk_rank
+    FROM candidates
+),
+ann AS (
+    SELECT
+        chunk_id,
+        MIN(dist) AS best_distance,
+        AVG(dist) FILTER (WHERE subchunk_rank <= :subchunk_top_k) AS avg_distance,
+        COUNT(*) FILTER (WHERE subchunk_rank <= :subchunk_top_k) AS match_count,
+        ROW_NUMBER() OVER (ORDER BY MIN(dist)) AS ann_rank
+    FROM ranked
+    GROUP BY chunk_id
+),
+fts_query AS (
+    SELECT
+        CAST(replace(CAST(plainto_tsquery('russian', :fts_text) AS text), '&', '|') AS tsquery)
+        || CAST(replace(CAST(plainto_tsquery('simple', :fts_terms) AS text), '&', '|') AS tsquery) AS q
+),
+fts AS (
+    SELECT
+        dc.id AS chunk_id,
+        ROW_NUMBER() OVER (ORDER BY ts_rank_cd(dc.chunk_tsv, fq.q) DESC) AS fts_rank
+    FROM document_chunks dc, fts_query fq
+    WHERE {document_filter}
+      AND dc.chunk_tsv @@ fq.q
+      AND NOT EXISTS (
+          SELECT 1 FROM chunk_embeddings_384 e
+          WHERE e.chunk_id = dc.id AND e.status <> 'COMPLETED'
+      )
+    ORDER BY ts_rank_cd(dc.chunk_tsv, fq.q) DESC
+    LIMIT :fts_limit
+)
+SELECT
+    dc.id AS chunk_id,
+    dc.document_id,
+    dc.chunk_idx,
+    a.best_distance,
+    a.avg_distance,
+    a.match_count,
+    a.ann_rank,
+    f.fts_rank,
+    COALESCE(1.0 / (:rrf_k + a.ann_rank), 0) + COALESCE(1.0 / (:rrf_k + f.fts_rank), 0) AS rrf_score
+FROM ann a
+FULL OUTER JOIN fts f ON f.chunk_id = a.chunk_id
+JOIN document_chunks dc ON dc.id = COALESCE(a.chunk_id, f.chunk_id)
+ORDER BY rrf_score DESC
+LIMIT :top_k
+"""
+
+# Токены, которые ищутся без стемминга (конфигурация simple): коды, номера, аббревиатуры
+CODE_TERM_RE = re.compile(r"[\w\-/.]*\d[\w\-/.]*|\b[A-ZА-ЯЁ]{2,}\w*")
+
+
+def code_terms(question: str) -> str:
+    """
+    Коды продуктов, номера договоров, аббревиатуры из вопроса — для точного совпадения.
+    """
+    return " ".join(CODE_TERM_RE.findall(question))
+
+
+CHUNK_TEXTS_SQL = """
+SELECT dc.id AS chunk_id, dc.chunk_text
+FROM document_chunks dc
+WHERE dc.id = ANY(CAST(:chunk_ids AS uuid[]))
+"""
+
+
+class ChunkRetriever:
+    """
+    Поиск релевантных чанков по вектору запроса.
+    Ранжирование совпадает с прежним CTE (0.6 / 0.3 / 0.1), но расстояние считается один раз
+    и только для кандидатов из векторного индекса.
+    В режиме hybrid (RetrievalConfig.mode) к ANN-кандидатам добавляется полнотекстовый поиск, порядок — по RRF.
+    При vector_storage halfvec / binary кандидаты ищутся по компактному индексу и пересчитываются по полному вектору.
+    Запросы выполняются через AsyncSession (asearch).
+    """
+
+    # Во сколько раз кандидатов-подчанков берётся больше, чем нужно чанков
+    CANDIDATE_MULTIPLIER = 4
+    MIN_CANDIDATES = 100
+
+    def __init__(self, db: AsyncSession, config: Optional[RetrievalConfig] = None):
+        self.db = db
+        self.config = config or RetrievalConfig()
+
+    def candidate_limit(self, top_k: int, subchunk_top_k: int) -> int:
+        limit = max(top_k * subchunk_top_k * self.CANDIDATE_MULTIPLIER, self.MIN_CANDIDATES)
+        return self.config.effective_candidate_limit(limit)
+
+    def _candidates_query(
+            self,
+            query_vector: Sequence[float],
+            document_filter: DocumentFilter,
+            top_k: int,
+            subchunk_top_k: int,
+            query_text: Optional[str] = None
+    ) -> Tuple[List[str], str, Dict[str, Any]]:
+        if document_filter.exact_scan:
+            return self._exact_query(query_vector, document_filter, top_k, subchunk_top_k, query_text)
+
+        candidate_limit = self.candidate_limit(top_k, subchunk_top_k)
+        index_limit = candidate_limit
+        params = {}
+        if self.config.is_quantized:
+            # Индекс отдаёт approx_limit кандидатов, полный вектор оставляет из них candidate_limit
+            index_limit = self.config.effective_candidate_limit(candidate_limit * self.config.rescore_factor)
+            candidate_limit = min(candidate_limit, index_limit)
+            params["approx_limit"] = index_limit
+        params.update({
+            "query_vector": list(query_vector),
+            "candidate_limit": candidate_limit,
+            "top_k": top_k,
+            "subchunk_top_k": subchunk_top_k,
+            **document_filter.params,
+        })
+        sql = self._render(document_filter, params, top_k, query_text)
+        return self.config.session_settings(index_limit), sql, params
+
+    def _exact_query(
+            self,
+            query_vector: Sequence[float],
+            document_filter: DocumentFilter,
+            top_k: int,
+            subchunk_top_k: int,
+            query_text: Optional[str] = None
+    ) -> Tuple[List[str], str, Dict[str, Any]]:
+        """
+        Точный перебор подчанков нескольких документов: индекс не используется, SET LOCAL не нужен,
+        кандидатов можно брать без ограничения ef_search.
+        """
+        params = {
+            "query_vector": list(query_vector),
+            "candidate_limit": max(top_k * subchunk_top_k * self.CANDIDATE_MULTIPLIER, self.MIN_CANDIDATES),
+            "top_k": top_k,
+            "subchunk_top_k": subchunk_top_k,
+            **document_filter.params,
+        }
+        return [], self._render(document_filter, params, top_k, query_text), params
+
+    def _render(
+            self,
+            document_filter: DocumentFilter,
+            params: Dict[str, Any],
+            top_k: int,
+            query_text: Optional[str]
+    ) -> str:
+        if self.is_hybrid(query_text):
+            template = HYBRID_SQL
+            params.update({
+                "fts_text": query_text,
+                "fts_terms": code_terms(query_text),
+                "fts_limit": max(self.config.fts_candidates, top_k),
+                "rrf_k": self.config.rrf_k,
+            })
+        else:
+            template = CANDIDATES_SQL
+        return template.format(
+            ctes=document_filter.ctes,
+            candidates=candidates_cte(
+                self.config.vector_storage, document_filter.condition, document_filter.exact_scan
+            ),
+            document_filter=document_filter.condition
+        )
+
+    def is_hybrid(self, query_text: Optional[str]) -> bool:
+        return self.config.is_hybrid and bool(query_text and query_text.strip())
+
+    async def asearch(
+            self,
+            query_vector: Sequence[float],
+            document_filter: DocumentFilter,
+            top_k: int = 20,
+            subchunk_top_k: int = 3,
+            score_threshold: float = 0.25,
+            query_text: Optional[str] = None,
+            with_texts: bool = True
+    ) -> List[Dict[str, Any]]:
+        start_time = time.time()
+        if document_filter.is_empty:
+            return []
+
+        settings, sql, params = self._candidates_query(
+            query_vector, document_filter, top_k, subchunk_top_k, query_text
+        )
+        for statement in settings:
+            await self.db.execute(text(statement))
+        rows = (await self.db.execute(text(sql), params)).mappings().all()
+
+        chunks = self._score_rows(rows, subchunk_top_k, score_threshold, hybrid=self.is_hybrid(query_text))
+        if with_texts:
+            await self.aattach_texts(chunks)
+
+        logger.debug(f"ChunkRetriever: {len(chunks)} chunks in {time.time() - start_time:.3f}s")
+        return chunks
+
+    def _score_rows(
+            self,
+            rows: Sequence[Mapping[str, Any]],
+            subchunk_top_k: int,
+            score_threshold: float,
+            hybrid: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Порог score_threshold применяется к векторному скору; в hybrid-режиме
+        чанки, найденные полнотекстовым поиском, проходят и без векторного совпадения.
+        """
+        chunks = []
+        for row in rows:
+            lexical_match = hybrid and row["fts_rank"] is not None
+            if row["best_distance"] is None:
+                best_distance = avg_distance = 1.0
+                match_count = 0
+            else:
+                best_distance = float(row["best_distance"])
+                avg_distance = float(row["avg_distance"]) if row["avg_distance"] is not None else best_distance
+                match_count = int(row["match_count"])
+            score = score_chunk(best_distance, avg_distance, match_count, subchunk_top_k)
+
+            if score >= score_threshold or lexical_match:
+                chunk = {
+                    "chunk_id": row["chunk_id"],
+                    "document_id": row["document_id"],
+                    "chunk_idx": row["chunk_idx"],
+                    "chunk_text": None,
+                    "best_distance": best_distance,
+                    "avg_distance": avg_distance,
+                    "match_count": match_count,
+                    "score": score
+                }
+                if hybrid:
+                    chunk.update({
+                        "ann_rank": row["ann_rank"],
+                        "fts_rank": row["fts_rank"],
+                        "rrf_score": float(row["rrf_score"]),
+                    })
+                chunks.append(chunk)
+        return chunks
+
+    async def aattach_texts(self, chunks: List[Dict[str, Any]]) -> None:
+        """Проставляет chunk["chunk_text"] одним запросом (например, только для отдаваемой страницы)"""
+        if not chunks:
+            return
+        text_rows = (await self.db.execute(
+            text(CHUNK_TEXTS_SQL),
+            {"chunk_ids": [str(c["chunk_id"]) for c in chunks]}
+        )).mappings().all()
+        self._apply_texts(chunks, text_rows)
+
+    @staticmethod
+    def _apply_texts(chunks: List[Dict[str, Any]], rows: Sequence[Mapping[str, Any]]) -> None:
+        texts = {str(row["chunk_id"]): row["chunk_text"] for row in rows}
+        for chunk in chunks:
+            chunk["chunk_text"] = texts.get(str(chunk["chunk_id"]), "")
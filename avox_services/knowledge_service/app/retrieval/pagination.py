@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from knowledge_service.app.embeddings.query_cache import normalize_question
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def question_digest(question: str, doc_ids: Optional[List[str]] = None) -> str:
+    """Курсор действителен только для того же вопроса и того же ограничения doc_ids"""
+    restriction = ",".join(sorted(str(doc_id) for doc_id in doc_ids or []))
+    return hashlib.sha256(f"{normalize_question(question)}|{restriction}".encode("utf-8")).hexdigest()[:16]
+
+
+def rank_value(chunk: Dict[str, Any]) -> float:
+    """
+    Ключ ранжирования — тот же, что ORDER BY в запросе поиска (RRF в гибридном режиме, иначе близость
+    лучшего подчанка): тогда выдача глубины N — префикс полной выдачи и страницы по курсору точны.
+    """
+    return chunk["rrf_score"] if "rrf_score" in chunk else 1 - chunk["best_distance"]
+
+
+@dataclass(frozen=True)
+class SearchCursor:
+    """
+    Позиция в выдаче поиска: ключ (rank, chunk_id) последнего отданного чанка и сколько уже отдано.
+    Выдача на каждой странице считается заново окном глубины returned + limit + 1 (векторный индекс
+    не продолжает обход с места остановки); из окна берутся чанки строго после ключа,
+    поэтому страницы не пересекаются, даже если между запросами выдача сдвинулась.
+    """
+    question: str
+    rank: float
+    chunk_id: str
+    returned: int
+
+    def encode(self) -> str:
+        payload = {"q": self.question, "r": self.rank, "c": self.chunk_id, "n": self.returned}
+        return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+    @classmethod
+    def decode(cls, cursor: str, question: str, doc_ids: Optional[List[str]] = None) -> "SearchCursor":
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            decoded = cls(str(payload["q"]), float(payload["r"]), str(payload["c"]), int(payload["n"]))
+        except (ValueError, KeyError, TypeError) as e:
+            raise InvalidCursor("Malformed cursor") from e
+        if decoded.question != question_digest(question, doc_ids):
+            raise InvalidCursor("Cursor belongs to a different question")
+        return decoded
+
+
+def sort_key(chunk: Dict[str, Any]) -> Tuple[float, str]:
+    return -rank_value(chunk), str(chunk["chunk_id"])
+
+
+def paginate(
+        chunks: List[Dict[str, Any]],
+        question: str,
+        limit: int,
+        cursor: Optional[SearchCursor] = None,
+        doc_ids: Optional[List[str]] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Страница выдачи после cursor и курсор следующей страницы (None — выдача закончилась).
+    chunks — выдача глубиной не меньше cursor.returned + limit + 1.
+    """
+    ordered = sorted(chunks, key=sort_key)
+    if cursor is not None:
+        after = (-cursor.rank, cursor.chunk_id)
+        ordered = [c for c in ordered if sort_key(c) > after]
+
+    page = ordered[:limit]
+    if len(ordered) <= limit or not page:
+        return page, None
+
+    returned = (cursor.returned if cursor else 0) + len(page)
+    last = page[-1]
+    next_cursor = SearchCursor(question_digest(question, doc_ids), rank_value(last), str(last["chunk_id"]), returned)
+    return page, next_cursor.encode()
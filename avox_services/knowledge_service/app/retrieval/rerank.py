@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from knowledge_service.app.core import config
+from knowledge_service.app.core.cache import LRUTTLCache
+from knowledge_service.app.embeddings import SharedCrossEncoder, embedding_registry
+from knowledge_service.app.embeddings.query_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+
+def rerank_cache_key(question: str, chunk_id: Any, lowercase: bool = False) -> str:
+    digest = hashlib.sha256(normalize_question(question, lowercase).encode("utf-8")).hexdigest()
+    return f"{digest}:{chunk_id}"
+
+
+class ChunkReranker:
+    """
+    Переранжирование найденных чанков cross-encoder'ом и отбор лучших документов.
+    Пары (вопрос, чанк) считаются одним батчем, оценки кэшируются по (хэш вопроса, chunk_id).
+    """
+
+    def __init__(
+            self,
+            cross_encoder: SharedCrossEncoder,
+            top_documents: int = config.RERANK_TOP_DOCUMENTS,
+            batch_size: int = config.RERANK_BATCH_SIZE,
+            max_size: int = config.RERANK_CACHE_SIZE,
+            ttl_seconds: int = config.RERANK_CACHE_TTL
+    ):
+        self.cross_encoder = cross_encoder
+        self.top_documents = top_documents
+        self.batch_size = batch_size
+        self.scores: LRUTTLCache[float] = LRUTTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.pairs_scored = 0
+        self.documents_dropped = 0
+
+    def score(self, question: str, chunks: List[Dict[str, Any]]) -> None:
+        """
+        Проставляет chunk["rerank_score"]; в модель идут только пары, которых нет в кэше.
+        """
+        missing = []
+        for chunk in chunks:
+            key = rerank_cache_key(question, chunk["chunk_id"], self.cross_encoder.lowercase)
+            cached = self.scores.get(key)
+            if cached is None:
+                missing.append((key, chunk))
+            else:
+                chunk["rerank_score"] = cached
+
+        if not missing:
+            return
+
+        start_time = time.time()
+        pairs = [(question, chunk["chunk_text"] or "") for _, chunk in missing]
+        predicted = self.cross_encoder.predict(pairs, batch_size=self.batch_size)
+        for (key, chunk), value in zip(missing, predicted):
+            chunk["rerank_score"] = float(value)
+            self.scores.set(key, float(value))
+        self.pairs_scored += len(missing)
+        logger.debug(f"ChunkReranker: scored {len(missing)} pairs in {time.time() - start_time:.3f}s")
+
+    def rerank(self, question: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Оставляет чанки top_documents документов с лучшим rerank_score (по лучшему чанку документа),
+        лучшие документы и чанки — первыми.
+        """
+        if not chunks:
+            return chunks
+        self.score(question, chunks)
+
+        document_scores: Dict[str, float] = defaultdict(lambda: float("-inf"))
+        for chunk in chunks:
+            doc_id = str(chunk["document_id"])
+            document_scores[doc_id] = max(document_scores[doc_id], chunk["rerank_score"])
+
+        ranked_documents = sorted(document_scores, key=document_scores.get, reverse=True)
+        kept = set(ranked_documents[:self.top_documents])
+        self.documents_dropped += len(ranked_documents) - len(kept)
+
+        result = [chunk for chunk in chunks if str(chunk["document_id"]) in kept]
+        result.sort(key=lambda c: (-document_scores[str(c["document_id"])], -c["rerank_score"]))
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.scores.stats()
+        stats.update({
+            "model": self.cross_encoder.model_name,
+            "pairs_scored": self.pairs_scored,
+            "documents_dropped": self.documents_dropped,
+        })
+        return stats
+
+
+_chunk_reranker: Optional[ChunkReranker] = None
+_reranker_lock = threading.Lock()
+
+
+def get_chunk_reranker() -> Optional[ChunkReranker]:
+    """
+    Общий на процесс reranker; None, если RERANK_ENABLED выключен.
+    """
+    global _chunk_reranker
+    if not config.RERANK_ENABLED:
+        return None
+    if _chunk_reranker is None:
+        with _reranker_lock:
+            if _chunk_reranker is None:
+                _chunk_reranker = ChunkReranker(embedding_registry.get_cross_encoder(config.RERANK_MODEL_NAME))
+    return _chunk_reranker
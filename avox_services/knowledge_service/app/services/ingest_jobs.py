@@ -0,0 +1,164 @@
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from avox_shared.knowledge_service.document import IngestJobResponse
+from knowledge_service.app.db.session import SessionLocal
+from knowledge_service.app.models.core.ingest_job import IngestJob
+from knowledge_service.app.models.enums import IngestJobStatus
+from knowledge_service.app.services.ingestion import DocumentIngestor
+
+logger = logging.getLogger(__name__)
+
+# Прогресс считается по статусам эмбеддингов документа, поэтому виден независимо от того, кто их считает
+JOB_PROGRESS_SQL = """
+SELECT
+    COUNT(*) AS chunks_total,
+    COUNT(*) FILTER (WHERE s.total = s.completed) AS chunks_embedded,
+    COALESCE(SUM(s.total), 0) AS subchunks_total,
+    COALESCE(SUM(s.completed), 0) AS subchunks_embedded,
+    COALESCE(SUM(s.failed), 0) AS subchunks_failed
+FROM (
+    SELECT
+        dc.id,
+        COUNT(emb.id) AS total,
+        COUNT(emb.id) FILTER (WHERE emb.status = 'COMPLETED') AS completed,
+        COUNT(emb.id) FILTER (WHERE emb.status = 'FAILED') AS failed
+    FROM document_chunks dc
+    LEFT JOIN chunk_embeddings_384 emb ON emb.chunk_id = dc.id
+    WHERE dc.document_id = CAST(:document_id AS uuid)
+    GROUP BY dc.id
+) s
+"""
+
+# Статус заданий выводится из эмбеддингов их документов: пока есть PENDING — RUNNING,
+# затем COMPLETED или FAILED (если часть подчанков так и не посчиталась).
+# Завершение задания обновляет updated_at документа: меняется версия содержимого раздела кэша ответов
+# (answer_cache.scope_key), записи, посчитанные пока у новых чанков не было векторов, больше не находятся
+SYNC_JOBS_SQL = """
+WITH synced AS (
+    UPDATE ingest_jobs j
+    SET status = CAST(CASE
+            WHEN s.pending > 0 THEN 'RUNNING'
+            WHEN s.failed > 0 THEN 'FAILED'
+            ELSE 'COMPLETED'
+        END AS ingestjobstatus),
+        started_at = COALESCE(j.started_at, now()),
+        finished_at = CASE WHEN s.pending > 0 THEN NULL ELSE now() END,
+        error_message = CASE WHEN s.pending = 0 AND s.failed > 0 THEN s.failed || ' subchunks failed: ' || s.last_error END,
+        updated_at = now()
+    FROM (
+        SELECT
+            dc.document_id,
+            COUNT(*) FILTER (WHERE emb.status IN ('PENDING', 'PROCESSING')) AS pending,
+            COUNT(*) FILTER (WHERE emb.status = 'FAILED') AS failed,
+            MAX(emb.error_message) AS last_error
+        FROM document_chunks dc
+        JOIN chunk_embeddings_384 emb ON emb.chunk_id = dc.id
+        WHERE dc.document_id = ANY(CAST(:document_ids AS uuid[]))
+        GROUP BY dc.document_id
+    ) s
+    WHERE j.document_id = s.document_id
+      AND j.status IN ('QUEUED', 'RUNNING')
+    RETURNING j.document_id, j.status
+)
+UPDATE documents d
+SET updated_at = now()
+FROM synced
+WHERE d.id = synced.document_id
+  AND synced.status <> 'RUNNING'
+"""
+
+FINISHED_JOB_STATUSES = (IngestJobStatus.COMPLETED, IngestJobStatus.FAILED)
+
+
+def get_ingest_job(db: Session, job_id: uuid.UUID, company_id: uuid.UUID) -> Optional[IngestJob]:
+    """Задание видно только в рамках своей компании"""
+    job = db.get(IngestJob, job_id)
+    if job is None or job.company_id != company_id:
+        return None
+    return job
+
+
+def sync_ingest_jobs(db: Session, document_ids: Sequence[uuid.UUID]) -> None:
+    """Обновляет статусы незавершённых заданий по документам (commit — на вызывающем)"""
+    if document_ids:
+        db.execute(text(SYNC_JOBS_SQL), {"document_ids": [str(doc_id) for doc_id in document_ids]})
+
+
+def job_progress(db: Session, job: IngestJob) -> IngestJobResponse:
+    row = db.execute(text(JOB_PROGRESS_SQL), {"document_id": str(job.document_id)}).mappings().one()
+    subchunks_total = int(row["subchunks_total"])
+    embedded = int(row["subchunks_embedded"])
+    failed = int(row["subchunks_failed"])
+    remaining = subchunks_total - embedded - failed
+
+    # ETA — по средней скорости с начала расчёта
+    eta_seconds = None
+    if job.started_at and embedded and remaining > 0 and job.status not in FINISHED_JOB_STATUSES:
+        elapsed = (datetime.now(timezone.utc) - job.started_at).total_seconds()
+        eta_seconds = round(remaining * elapsed / embedded, 1)
+
+    return IngestJobResponse(
+        job_id=job.id,
+        document_id=job.document_id,
+        status=job.status.value,
+        chunks_total=int(row["chunks_total"]),
+        chunks_embedded=int(row["chunks_embedded"]),
+        subchunks_total=subchunks_total,
+        subchunks_embedded=embedded,
+        subchunks_failed=failed,
+        subchunks_reused=job.reused_subchunks or 0,
+        dedup_ratio=round((job.reused_subchunks or 0) / subchunks_total, 4) if subchunks_total else 0.0,
+        progress=round((embedded + failed) / subchunks_total, 4) if subchunks_total else 1.0,
+        eta_seconds=eta_seconds,
+        error=job.error_message,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+
+def run_ingest_job(job_id: uuid.UUID) -> None:
+    """
+    Фоновая задача (BackgroundTasks): считает PENDING-эмбеддинги документа партиями.
+    Каждая партия коммитится отдельно — прогресс виден в /rag/ingest-jobs/{id} по ходу работы.
+    Задача не ждёт в потоке запроса: строки на повторе или захваченные другим обработчиком
+    досчитывает воркер (или следующий вызов /ingest-documents), задание пока остаётся RUNNING.
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(IngestJob, job_id)
+        if job is None or job.status in FINISHED_JOB_STATUSES:
+            return
+        job.status = IngestJobStatus.RUNNING
+        job.started_at = datetime.now(timezone.utc)
+        db.commit()
+
+        ingestor = DocumentIngestor(db)
+        try:
+            while ingestor.embed_pending(document_id=job.document_id).claimed:
+                pass
+            sync_ingest_jobs(db, [job.document_id])
+        except Exception as e:
+            logger.exception(f"Ingest job {job_id} failed")
+            db.rollback()
+            job.status = IngestJobStatus.FAILED
+            job.error_message = str(e)
+            job.finished_at = datetime.now(timezone.utc)
+        db.commit()
+
+        # Заодно — дошедшие до next_attempt_at строки других документов (без воркера их больше некому взять)
+        try:
+            while (batch := ingestor.embed_pending()).claimed:
+                sync_ingest_jobs(db, batch.document_ids)
+                db.commit()
+        except Exception:
+            logger.exception("Pending embeddings pickup failed")
+            db.rollback()
+    finally:
+        db.close()
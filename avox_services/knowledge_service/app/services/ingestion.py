@@ -1,31 +1,209 @@
+import hashlib
+import logging
+import time
+import unicodedata
 import uuid
-from typing import List
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
 
-import nltk
+import numpy as np
 from nltk.tokenize import sent_tokenize
-from sentence_transformers import SentenceTransformer
+from pgvector import Vector
+from sqlalchemy import insert, text
 from sqlalchemy.orm import Session
-from transformers import AutoTokenizer
 
-from avox_shared.knowledge_service.document import DocumentIngestResponse
+from avox_shared.knowledge_service.document import (
+    DocumentBulkIngestResponse,
+    DocumentIngestRequest,
+    DocumentIngestResponse,
+    DocumentUpdateRequest,
+    DocumentUpdateResponse,
+    IngestStats,
+)
+from knowledge_service.app.core import config
+from knowledge_service.app.embeddings import EmbeddingRegistry, embedding_registry
+from knowledge_service.app.models.core.company import User
 from knowledge_service.app.models.core.document import Document, DocumentChunk, ChunkEmbedding384
-from knowledge_service.app.models.enums import DocAccessLevel, SourceType, EmbeddingStatus
+from knowledge_service.app.models.core.ingest_job import IngestJob
+from knowledge_service.app.models.enums import DocAccessLevel, SourceType, EmbeddingStatus, IngestJobStatus
 
+logger = logging.getLogger(__name__)
+
+INGEST_WRITE_METHODS = ("insert", "copy")
+
+# Генерируемую колонку режима хранения (vector_half / vector_bit) СУБД считает сама, в COPY она не передаётся
+EMBEDDINGS_COPY_SQL = """
+COPY chunk_embeddings_384 (
+    id, chunk_id, vector, embedding_scope, subchunk_idx, embedding_model,
+    content_hash, overlap, status, attempts, created_at, updated_at
+) FROM STDIN
+"""
+
+# Партия PENDING-эмбеддингов вместе с текстом чанка: текст подчанка восстанавливается тем же разбиением.
+# SKIP LOCKED — параллельные обработчики (в том числе на разных хостах) берут непересекающиеся партии;
+# строки, ждущие повтора после ошибки, не берутся до next_attempt_at
+CLAIM_PENDING_SQL = """
+SELECT emb.id, emb.chunk_id, emb.subchunk_idx, dc.document_id, dc.chunk_text
+FROM chunk_embeddings_384 emb
+JOIN document_chunks dc ON dc.id = emb.chunk_id
+WHERE emb.status = 'PENDING'
+  AND (emb.next_attempt_at IS NULL OR emb.next_attempt_at <= now())
+  AND (CAST(:document_id AS uuid) IS NULL OR dc.document_id = CAST(:document_id AS uuid))
+ORDER BY emb.created_at, emb.chunk_id, emb.subchunk_idx
+LIMIT :limit
+FOR UPDATE OF emb SKIP LOCKED
+"""
+
+# Через сколько секунд станет доступна ближайшая PENDING-строка (0 — уже доступна, NULL — ожидающих нет)
+NEXT_PENDING_DELAY_SQL = """
+SELECT GREATEST(EXTRACT(EPOCH FROM MIN(COALESCE(emb.next_attempt_at, now())) - now()), 0) AS delay
+FROM chunk_embeddings_384 emb
+JOIN document_chunks dc ON dc.id = emb.chunk_id
+WHERE emb.status = 'PENDING'
+  AND (CAST(:document_id AS uuid) IS NULL OR dc.document_id = CAST(:document_id AS uuid))
+"""
+
+COMPLETE_EMBEDDINGS_SQL = """
+UPDATE chunk_embeddings_384 AS emb
+SET vector = CAST(v.vector AS vector),
+    content_hash = v.content_hash,
+    status = 'COMPLETED',
+    attempts = emb.attempts + 1,
+    error_message = NULL,
+    updated_at = now()
+FROM unnest(CAST(:ids AS uuid[]), CAST(:vectors AS text[]), CAST(:hashes AS text[])) AS v(id, vector, content_hash)
+WHERE emb.id = v.id
+"""
+
+FAIL_EMBEDDINGS_SQL = """
+UPDATE chunk_embeddings_384
+SET status = 'FAILED',
+    attempts = attempts + 1,
+    error_message = :error,
+    updated_at = now()
+WHERE id = ANY(CAST(:ids AS uuid[]))
+"""
+
+# Повтор с экспоненциальной задержкой; после max_attempts попыток строка остаётся FAILED
+RETRY_EMBEDDINGS_SQL = """
+UPDATE chunk_embeddings_384
+SET attempts = attempts + 1,
+    error_message = :error,
+    status = CASE WHEN attempts + 1 >= :max_attempts THEN CAST('FAILED' AS embeddingstatus) ELSE status END,
+    next_attempt_at = now() + make_interval(secs => LEAST(:backoff * power(2, attempts), :backoff_max)),
+    updated_at = now()
+WHERE id = ANY(CAST(:ids AS uuid[]))
+RETURNING CAST(status AS text) AS status
+"""
+
+# Хранилище векторов по содержимому: готовый вектор того же текста той же модели из любого документа
+STORED_VECTORS_SQL = """
+SELECT DISTINCT ON (content_hash) content_hash, CAST(vector AS text) AS vector
+FROM chunk_embeddings_384
+WHERE status = 'COMPLETED'
+  AND embedding_model = :model
+  AND content_hash = ANY(CAST(:hashes AS text[]))
+"""
+
+# pg_notify в транзакции инжеста: уведомление уходит обработчикам только после commit
+NOTIFY_PENDING_SQL = "SELECT pg_notify(:channel, :payload)"
+
+# Обновление документа: хэши сохранённых чанков (текст — только у строк, записанных до появления content_hash)
+STORED_CHUNKS_SQL = """
+SELECT id, chunk_idx, content_hash, CASE WHEN content_hash IS NULL THEN chunk_text END AS chunk_text
+FROM document_chunks
+WHERE document_id = CAST(:document_id AS uuid)
+ORDER BY chunk_idx
+"""
+
+# Эмбеддинги удаляются каскадом
+DELETE_CHUNKS_SQL = "DELETE FROM document_chunks WHERE id = ANY(CAST(:ids AS uuid[]))"
+
+# Перенумерация в два шага из-за уникального (document_id, chunk_idx): сдвинутые чанки сначала
+# получают временный отрицательный номер -1 - новый, после вставки новых чанков номер восстанавливается
+MOVE_CHUNKS_SQL = """
+UPDATE document_chunks AS dc
+SET chunk_idx = CASE WHEN dc.chunk_idx = v.chunk_idx THEN dc.chunk_idx ELSE -1 - v.chunk_idx END,
+    content_hash = v.content_hash,
+    updated_at = now()
+FROM unnest(CAST(:ids AS uuid[]), CAST(:chunk_idxs AS integer[]), CAST(:hashes AS text[])) AS v(id, chunk_idx, content_hash)
+WHERE dc.id = v.id
+"""
+
+RESTORE_CHUNK_IDX_SQL = """
+UPDATE document_chunks
+SET chunk_idx = -1 - chunk_idx
+WHERE document_id = CAST(:document_id AS uuid) AND chunk_idx < 0
+"""
+
+
+class DocumentVersionConflict(ValueError):
+    pass
 
-class DocumentIngestor:
-    def __init__(self, db: Session):
 
-        try:
-            nltk.data.find("tokenizers/punkt")
-            nltk.data.find("tokenizers/punkt_tab")
-        except LookupError:
-            nltk.download("punkt")
-            nltk.download("punkt_tab")
+class DocumentEditForbidden(PermissionError):
+    pass
+
+
+def normalize_text(text: str) -> str:
+    """NFKC и схлопнутые пробелы: такие различия токенайзер всё равно не видит"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class Subchunk(NamedTuple):
+    chunk_id: uuid.UUID
+    subchunk_idx: int
+    text: str
+    content_hash: str
+
+
+@dataclass
+class ResolvedVectors:
+    """Векторы подчанков и сколько из них не пришлось считать моделью"""
+    vectors: List[np.ndarray]
+    encoded: int = 0
+    reused: int = 0
+    encode_ms: float = 0.0
+    model_ms_saved: float = 0.0
+
+
+@dataclass
+class PreparedDocument:
+    """
+    Документ, разбитый на чанки и подчанки до обращения к модели и БД.
+    Идентификаторы генерируются на клиенте, чтобы писать строки пачкой без flush после каждой.
+    """
+    document: Document
+    chunks: List[Dict[str, Any]] = field(default_factory=list)
+    subchunks: List[Subchunk] = field(default_factory=list)
+
+
+@dataclass
+class PendingBatch:
+    """Итог обработки одной партии PENDING-эмбеддингов"""
+    claimed: int = 0
+    completed: int = 0
+    retried: int = 0
+    failed: int = 0
+    reused: int = 0
+    document_ids: List[uuid.UUID] = field(default_factory=list)
+
+
+class DocumentIngestor:
+    def __init__(self, db: Session, registry: EmbeddingRegistry = embedding_registry):
+        registry.ensure_nltk()
 
         self.db = db
-        self.model_name = "sentence-transformers/all-MiniLM-L6-v2"
-        self.model = SentenceTransformer(self.model_name)
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        # Модель и токенайзер общие на процесс — инжестор лишь обёртка над сессией
+        self.model = registry.get_embedder()
+        self.model_name = self.model.model_name
+        self.tokenizer = registry.get_tokenizer(self.model_name)
 
         self.max_embedding_tokens = 256
         self.subchunk_overlap_tokens = 32
@@ -33,6 +211,15 @@ class DocumentIngestor:
         self.chunk_size_sentences = 5
         self.chunk_overlap_sentences = 2
 
+        self.encode_batch_size = config.INGEST_ENCODE_BATCH_SIZE
+        self.max_attempts = config.EMBEDDING_MAX_ATTEMPTS
+        self.retry_backoff = config.EMBEDDING_RETRY_BACKOFF
+        self.retry_backoff_max = config.EMBEDDING_RETRY_BACKOFF_MAX
+        self.write_method = config.INGEST_WRITE_METHOD if config.INGEST_WRITE_METHOD in INGEST_WRITE_METHODS else "insert"
+        self.dedup_enabled = config.INGEST_DEDUP_ENABLED
+        # Среднее время модели на подчанок — для оценки сэкономленного дедупликацией времени
+        self.encode_ms_per_subchunk = 0.0
+
     def _split_text_into_subchunks(self, text: str) -> List[str]:
         encoding = self.tokenizer(
             text,
@@ -69,6 +256,207 @@ class DocumentIngestor:
             i += chunk_size - overlap
         return chunks
 
+    @staticmethod
+    def _new_document(
+        title: str,
+        source_type: SourceType,
+        access_level: DocAccessLevel,
+        company_id: uuid.UUID,
+        owner_id: uuid.UUID,
+    ) -> Document:
+        return Document(
+            id=uuid.uuid4(),
+            title=title,
+            company_id=company_id,
+            owner_id=owner_id,
+            source_type=source_type,
+            access_level=access_level,
+            is_approved=(access_level == DocAccessLevel.RESTRICTED),
+        )
+
+    def _chunk_rows(self, document_id: uuid.UUID, chunk_texts: Sequence[str], start_idx: int = 0) -> tuple:
+        """Строки document_chunks и подчанки для последовательности чанков"""
+        chunk_rows, subchunks = [], []
+        for chunk_idx, chunk_text in enumerate(chunk_texts, start=start_idx):
+            chunk_id = uuid.uuid4()
+            chunk_rows.append({
+                "id": chunk_id,
+                "document_id": document_id,
+                "chunk_text": chunk_text,
+                "chunk_idx": chunk_idx,
+                "chunk_scope": "sentence",
+                "content_hash": text_hash(chunk_text),
+                "is_hot": False,
+            })
+            for subchunk_idx, subchunk_text in enumerate(self._split_text_into_subchunks(chunk_text)):
+                subchunks.append(Subchunk(chunk_id, subchunk_idx, subchunk_text, text_hash(subchunk_text)))
+        return chunk_rows, subchunks
+
+    def _prepare(self, req: DocumentIngestRequest, company_id: uuid.UUID, owner_id: uuid.UUID) -> PreparedDocument:
+        """Разбивает весь документ на чанки и подчанки; в БД пока ничего не пишется"""
+        doc = self._new_document(req.title, req.source_type, req.access_level, company_id, owner_id)
+        chunk_rows, subchunks = self._chunk_rows(doc.id, self._chunk_texts(req.text))
+        return PreparedDocument(document=doc, chunks=chunk_rows, subchunks=subchunks)
+
+    def _chunk_texts(self, document_text: str) -> List[str]:
+        chunks_sentences = self._split_into_chunks_with_overlap(
+            sent_tokenize(document_text),
+            chunk_size=self.chunk_size_sentences,
+            overlap=self.chunk_overlap_sentences
+        )
+        return [" ".join(sents) for sents in chunks_sentences]
+
+    def _encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Один проход модели по всем подчанкам; размер партии — INGEST_ENCODE_BATCH_SIZE"""
+        if not texts:
+            return np.empty((0, 384), dtype=np.float32)
+        return self.model.encode(list(texts), batch_size=self.encode_batch_size, convert_to_numpy=True)
+
+    def _stored_vectors(self, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Готовые векторы по хэшам содержимого (для текущей модели)"""
+        unique = list(set(hashes))
+        if not self.dedup_enabled or not unique:
+            return {}
+        rows = self.db.execute(text(STORED_VECTORS_SQL), {"model": self.model_name, "hashes": unique}).all()
+        return {row[0]: Vector.from_text(row[1]).to_numpy() for row in rows}
+
+    def _resolve_vectors(self, texts: Sequence[str], hashes: Sequence[str]) -> ResolvedVectors:
+        """
+        Векторы подчанков: известные по хэшу берутся из БД, одинаковые тексты кодируются один раз,
+        через модель идут только новые.
+        """
+        known = self._stored_vectors(hashes)
+        unseen: Dict[str, str] = {}
+        for subchunk_text, content_hash in zip(texts, hashes):
+            if content_hash not in known and content_hash not in unseen:
+                unseen[content_hash] = subchunk_text
+
+        encode_start = time.perf_counter()
+        encoded = self._encode(list(unseen.values()))
+        encode_ms = (time.perf_counter() - encode_start) * 1000
+        if unseen:
+            self.encode_ms_per_subchunk = encode_ms / len(unseen)
+        known.update(zip(unseen.keys(), encoded))
+
+        reused = len(texts) - len(unseen)
+        return ResolvedVectors(
+            vectors=[known[content_hash] for content_hash in hashes],
+            encoded=len(unseen),
+            reused=reused,
+            encode_ms=encode_ms,
+            model_ms_saved=reused * self.encode_ms_per_subchunk,
+        )
+
+    def _embedding_rows(
+        self,
+        subchunks: Sequence[Subchunk],
+        vectors: Optional[Sequence[Optional[np.ndarray]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Строки chunk_embeddings_384; подчанок без вектора — PENDING, для фонового расчёта"""
+        now = datetime.now(timezone.utc)
+        if vectors is None:
+            vectors = [None] * len(subchunks)
+        return [
+            {
+                "id": uuid.uuid4(),
+                "chunk_id": subchunk.chunk_id,
+                "vector": vector,
+                "embedding_scope": "sentence",
+                "subchunk_idx": subchunk.subchunk_idx,
+                "embedding_model": self.model_name,
+                "content_hash": subchunk.content_hash,
+                "overlap": self.subchunk_overlap_tokens,
+                "status": EmbeddingStatus.PENDING if vector is None else EmbeddingStatus.COMPLETED,
+                "attempts": 0,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for subchunk, vector in zip(subchunks, vectors)
+        ]
+
+    def _copy_embeddings(self, rows: List[Dict[str, Any]]) -> bool:
+        """
+        COPY эмбеддингов через соединение psycopg 3 текущей транзакции (текстовый формат: vector и enum
+        передаются строками, без регистрации типов на соединении). False — драйвер не умеет COPY.
+        """
+        cursor = self.db.connection().connection.driver_connection.cursor()
+        if not hasattr(cursor, "copy"):
+            return False
+        with cursor.copy(EMBEDDINGS_COPY_SQL) as copy:
+            for row in rows:
+                vector = Vector(row["vector"]).to_text() if row["vector"] is not None else None
+                copy.write_row((
+                    row["id"], row["chunk_id"], vector, row["embedding_scope"],
+                    row["subchunk_idx"], row["embedding_model"], row["content_hash"], row["overlap"], row["status"].name,
+                    row["attempts"], row["created_at"], row["updated_at"],
+                ))
+        return True
+
+    def _write_rows(self, chunk_rows: List[Dict[str, Any]], embedding_rows: List[Dict[str, Any]]) -> None:
+        """Чанки и эмбеддинги многострочными INSERT (эмбеддинги — COPY при INGEST_WRITE_METHOD=copy)"""
+        if chunk_rows:
+            self.db.execute(insert(DocumentChunk), chunk_rows)
+
+        if embedding_rows:
+            if not (self.write_method == "copy" and self._copy_embeddings(embedding_rows)):
+                self.db.execute(insert(ChunkEmbedding384), embedding_rows)
+
+    def _write(self, prepared: List[PreparedDocument], embedding_rows: List[Dict[str, Any]]) -> None:
+        """Документы, чанки и эмбеддинги в текущую транзакцию (commit — на вызывающем)"""
+        self.db.add_all([p.document for p in prepared])
+        self.db.flush()
+        self._write_rows([row for p in prepared for row in p.chunks], embedding_rows)
+
+    def ingest_many(
+        self,
+        documents: Sequence[DocumentIngestRequest],
+        company_id: uuid.UUID,
+        owner_id: uuid.UUID,
+    ) -> DocumentBulkIngestResponse:
+        """
+        Пакетный инжест: разбиение всех документов, один проход модели по всем подчанкам
+        и запись одной транзакцией.
+        """
+        start = time.perf_counter()
+        prepared = [self._prepare(req, company_id, owner_id) for req in documents]
+        subchunks = [subchunk for p in prepared for subchunk in p.subchunks]
+
+        resolved = self._resolve_vectors([sc.text for sc in subchunks], [sc.content_hash for sc in subchunks])
+
+        write_start = time.perf_counter()
+        self._write(prepared, self._embedding_rows(subchunks, resolved.vectors))
+        self.db.commit()
+        write_ms = (time.perf_counter() - write_start) * 1000
+
+        total_s = max(time.perf_counter() - start, 1e-9)
+        stats = IngestStats(
+            documents=len(prepared),
+            chunks=sum(len(p.chunks) for p in prepared),
+            subchunks=len(subchunks),
+            subchunks_encoded=resolved.encoded,
+            subchunks_reused=resolved.reused,
+            dedup_ratio=round(resolved.reused / len(subchunks), 4) if subchunks else 0.0,
+            model_ms_saved=round(resolved.model_ms_saved, 1),
+            encode_ms=round(resolved.encode_ms, 1),
+            write_ms=round(write_ms, 1),
+            total_ms=round(total_s * 1000, 1),
+            docs_per_sec=round(len(prepared) / total_s, 2),
+            subchunks_per_sec=round(len(subchunks) / total_s, 1),
+        )
+        logger.info(
+            "Ingested %d docs (%d chunks, %d subchunks) in %.0f ms: %.2f docs/s, %.1f subchunks/s "
+            "(encode %.0f ms, write %.0f ms; dedup %.0f%%, ~%.0f ms of model time saved)",
+            stats.documents, stats.chunks, stats.subchunks, stats.total_ms,
+            stats.docs_per_sec, stats.subchunks_per_sec, stats.encode_ms, stats.write_ms,
+            stats.dedup_ratio * 100, stats.model_ms_saved
+        )
+
+        results = [
+            DocumentIngestResponse(document_id=p.document.id, title=p.document.title, status="success")
+            for p in prepared
+        ]
+        return DocumentBulkIngestResponse(results=results, stats=stats)
+
     def ingest(
         self,
         text: str,
@@ -78,61 +466,268 @@ class DocumentIngestor:
         source_type: SourceType,
         access_level: DocAccessLevel,
     ) -> DocumentIngestResponse:
+        req = DocumentIngestRequest(text=text, title=title, source_type=source_type, access_level=access_level)
+        bulk = self.ingest_many([req], company_id=company_id, owner_id=owner_id)
+        return bulk.results[0].model_copy(update={"stats": bulk.stats})
 
-        sentences = sent_tokenize(text)
+    def _create_job(self, document_id: uuid.UUID, company_id: uuid.UUID, owner_id: uuid.UUID,
+                    total_chunks: int, total_subchunks: int, reused_subchunks: int = 0) -> IngestJob:
+        """IngestJob и NOTIFY обработчикам — в текущей транзакции"""
+        job = IngestJob(
+            id=uuid.uuid4(),
+            company_id=company_id,
+            owner_id=owner_id,
+            document_id=document_id,
+            status=IngestJobStatus.QUEUED,
+            total_chunks=total_chunks,
+            total_subchunks=total_subchunks,
+            reused_subchunks=reused_subchunks,
+        )
+        if reused_subchunks >= total_subchunks:
+            # Пустой документ или все векторы уже известны: считать нечего
+            job.status = IngestJobStatus.COMPLETED
+            job.finished_at = datetime.now(timezone.utc)
+        self.db.add(job)
+        self.db.execute(text(NOTIFY_PENDING_SQL), {
+            "channel": config.EMBEDDING_NOTIFY_CHANNEL,
+            "payload": str(document_id),
+        })
+        return job
 
-        chunks_sentences = self._split_into_chunks_with_overlap(
-            sentences,
-            chunk_size=self.chunk_size_sentences,
-            overlap=self.chunk_overlap_sentences
+    def enqueue(self, req: DocumentIngestRequest, company_id: uuid.UUID, owner_id: uuid.UUID) -> IngestJob:
+        """
+        Записывает документ и чанки сразу, эмбеддинги — в статусе PENDING без вектора, и создаёт IngestJob.
+        Модель не вызывается: векторы считает фоновый обработчик (см. embed_pending).
+        """
+        prepared = self._prepare(req, company_id, owner_id)
+        vectors = self._known_vectors(prepared.subchunks)
+        self._write([prepared], self._embedding_rows(prepared.subchunks, vectors))
+        job = self._create_job(
+            prepared.document.id, company_id, owner_id, len(prepared.chunks), len(prepared.subchunks),
+            reused_subchunks=sum(vector is not None for vector in vectors)
         )
+        self.db.commit()
+        return job
+
+    def _known_vectors(self, subchunks: Sequence[Subchunk]) -> List[Optional[np.ndarray]]:
+        """Векторы из хранилища по хэшу; None — подчанок новый и уйдёт в фоновый расчёт"""
+        known = self._stored_vectors(sc.content_hash for sc in subchunks)
+        return [known.get(sc.content_hash) for sc in subchunks]
 
-        doc = Document(
+    def update(
+        self,
+        document_id: uuid.UUID,
+        req: DocumentUpdateRequest,
+        user: User,
+    ) -> Optional[DocumentUpdateResponse]:
+        """
+        Новая версия документа. Последовательность чанков сравнивается с сохранённой по хэшам содержимого:
+        неизменённые чанки остаются вместе с эмбеддингами, изменённые диапазоны удаляются и вставляются
+        заново (эмбеддинги — PENDING, как в enqueue), chunk_idx перенумеровывается на месте.
+        None — документа нет в компании пользователя; без права редактирования — DocumentEditForbidden.
+        """
+        # Блокировка строки документа: параллельные обновления одного документа выполняются по очереди
+        doc = self.db.get(Document, document_id, with_for_update=True)
+        if doc is None or doc.company_id != user.company_id:
+            self.db.rollback()
+            return None
+        if not doc.can_edit(user):
+            self.db.rollback()
+            raise DocumentEditForbidden("Not allowed to edit this document")
+        if req.version is not None and req.version != doc.version:
+            current = doc.version
+            self.db.rollback()
+            raise DocumentVersionConflict(f"Document version is {current}, expected {req.version}")
+
+        new_texts = self._chunk_texts(req.text)
+        new_hashes = [text_hash(chunk_text) for chunk_text in new_texts]
+        stored = self.db.execute(text(STORED_CHUNKS_SQL), {"document_id": str(doc.id)}).mappings().all()
+        old_hashes = [row["content_hash"] or text_hash(row["chunk_text"]) for row in stored]
+
+        moved: List[tuple] = []
+        deleted: List[str] = []
+        chunk_rows: List[dict] = []
+        subchunks: List[Subchunk] = []
+        matcher = SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                moved.extend(
+                    (str(row["id"]), new_idx, new_hashes[new_idx])
+                    for row, new_idx in zip(stored[i1:i2], range(j1, j2))
+                    if row["chunk_idx"] != new_idx or row["content_hash"] is None
+                )
+                continue
+            deleted.extend(str(row["id"]) for row in stored[i1:i2])
+            rows, range_subchunks = self._chunk_rows(doc.id, new_texts[j1:j2], start_idx=j1)
+            chunk_rows.extend(rows)
+            subchunks.extend(range_subchunks)
+
+        title = req.title or doc.title
+        result = DocumentUpdateResponse(
+            document_id=doc.id,
             title=title,
-            company_id=company_id,
-            owner_id=owner_id,
-            source_type=source_type,
-            access_level=access_level,
-            is_approved=(access_level == DocAccessLevel.RESTRICTED),
+            version=doc.version,
+            status="unchanged",
+            chunks_kept=len(stored) - len(deleted),
+            chunks_inserted=len(chunk_rows),
+            chunks_deleted=len(deleted),
         )
+        if not deleted and not chunk_rows and title == doc.title:
+            self.db.rollback()
+            return result
+
+        if deleted:
+            self.db.execute(text(DELETE_CHUNKS_SQL), {"ids": deleted})
+        if moved:
+            ids, chunk_idxs, hashes = zip(*moved)
+            self.db.execute(text(MOVE_CHUNKS_SQL), {
+                "ids": list(ids), "chunk_idxs": list(chunk_idxs), "hashes": list(hashes)
+            })
+        vectors = self._known_vectors(subchunks)
+        self._write_rows(chunk_rows, self._embedding_rows(subchunks, vectors))
+        if moved:
+            self.db.execute(text(RESTORE_CHUNK_IDX_SQL), {"document_id": str(doc.id)})
+
+        job = None
+        if subchunks:
+            job = self._create_job(
+                doc.id, doc.company_id, user.id, len(chunk_rows), len(subchunks),
+                reused_subchunks=sum(vector is not None for vector in vectors)
+            )
+        # Новый updated_at документа заодно инвалидирует записи кэша ответов по нему
+        doc.title = title
+        doc.version += 1
+        self.db.commit()
 
+        logger.info(
+            f"Document {doc.id} updated to v{doc.version}: {result.chunks_kept} chunks kept, "
+            f"{len(chunk_rows)} inserted, {len(deleted)} deleted, {len(subchunks)} subchunks to embed"
+        )
+        return result.model_copy(update={
+            "version": doc.version,
+            "status": "accepted" if job and job.status != IngestJobStatus.COMPLETED else "updated",
+            "job_id": job.id if job else None,
+            "subchunks_total": len(subchunks),
+            "subchunks_reused": job.reused_subchunks if job else 0,
+        })
+
+    def open_stream(
+        self,
+        title: str,
+        source_type: SourceType,
+        access_level: DocAccessLevel,
+        company_id: uuid.UUID,
+        owner_id: uuid.UUID,
+    ) -> "DocumentStreamWriter":
+        """Начинает инжест документа, текст которого приходит по частям (см. services.streaming)"""
+        doc = self._new_document(title, source_type, access_level, company_id, owner_id)
         self.db.add(doc)
         self.db.flush()
+        return DocumentStreamWriter(self, doc, company_id, owner_id)
 
-        for chunk_idx, chunk_sents in enumerate(chunks_sentences):
-            chunk_text = " ".join(chunk_sents)
+    def _subchunk_texts(self, rows: Sequence[Any]) -> List[Optional[str]]:
+        """Текст подчанка по (чанк, subchunk_idx): чанк разбивается заново тем же токенайзером"""
+        splits: Dict[Any, List[str]] = {}
+        texts = []
+        for row in rows:
+            if row["chunk_id"] not in splits:
+                splits[row["chunk_id"]] = self._split_text_into_subchunks(row["chunk_text"])
+            subchunks = splits[row["chunk_id"]]
+            texts.append(subchunks[row["subchunk_idx"]] if row["subchunk_idx"] < len(subchunks) else None)
+        return texts
 
-            chunk = DocumentChunk(
-                document_id=doc.id,
-                chunk_text=chunk_text,
-                chunk_idx=chunk_idx,
-                chunk_scope = "sentence",
-                is_hot=False,
-            )
-            self.db.add(chunk)
-            self.db.flush()
-
-            subchunks = self._split_text_into_subchunks(chunk_text)
-
-            # Кодируем все subchunks одной партией — оптимально
-            embeddings = self.model.encode(subchunks, convert_to_numpy=True)
-
-            for subchunk_idx, (subchunk_text, embedding_vector) in enumerate(zip(subchunks, embeddings)):
-                embedding = ChunkEmbedding384(
-                    chunk_id=chunk.id,
-                    vector=embedding_vector.tolist(),
-                    embedding_model=self.model_name,
-                    embedding_scope="sentence",
-                    subchunk_idx=subchunk_idx,
-                    overlap = self.subchunk_overlap_tokens,
-                    status=EmbeddingStatus.COMPLETED
-                )
-                self.db.add(embedding)
+    def embed_pending(self, document_id: Optional[uuid.UUID] = None, limit: Optional[int] = None) -> PendingBatch:
+        """
+        Считает векторы одной партии PENDING-эмбеддингов (всех или одного документа) и записывает их
+        одним UPDATE. Ошибка модели не прерывает обработку: партия уходит на повтор с задержкой.
+        claimed == 0 — доступных строк не осталось.
+        """
+        rows = self.db.execute(text(CLAIM_PENDING_SQL), {
+            "document_id": str(document_id) if document_id else None,
+            "limit": limit or self.encode_batch_size,
+        }).mappings().all()
+        batch = PendingBatch(
+            claimed=len(rows),
+            document_ids=list(dict.fromkeys(row["document_id"] for row in rows))
+        )
+        if not rows:
+            self.db.commit()
+            return batch
+
+        texts = self._subchunk_texts(rows)
+        missing = [str(row["id"]) for row, subchunk in zip(rows, texts) if subchunk is None]
+        ready = [(str(row["id"]), subchunk) for row, subchunk in zip(rows, texts) if subchunk is not None]
+
+        if missing:
+            # Разбиение чанка не даёт такого подчанка — повтор не поможет
+            self.db.execute(text(FAIL_EMBEDDINGS_SQL), {"ids": missing, "error": "subchunk not found in chunk text"})
+            batch.failed += len(missing)
+        if ready:
+            hashes = [text_hash(subchunk) for _, subchunk in ready]
+            try:
+                resolved = self._resolve_vectors([subchunk for _, subchunk in ready], hashes)
+            except Exception as e:
+                logger.warning(f"Embedding batch of {len(ready)} failed, scheduling retry: {e}")
+                statuses = self.db.execute(text(RETRY_EMBEDDINGS_SQL), {
+                    "ids": [embedding_id for embedding_id, _ in ready],
+                    "error": str(e),
+                    "max_attempts": self.max_attempts,
+                    "backoff": self.retry_backoff,
+                    "backoff_max": self.retry_backoff_max,
+                }).scalars().all()
+                batch.failed += statuses.count("FAILED")
+                batch.retried += len(statuses) - statuses.count("FAILED")
+            else:
+                self.db.execute(text(COMPLETE_EMBEDDINGS_SQL), {
+                    "ids": [embedding_id for embedding_id, _ in ready],
+                    "vectors": [Vector(vector).to_text() for vector in resolved.vectors],
+                    "hashes": hashes,
+                })
+                batch.completed = len(ready)
+                batch.reused = resolved.reused
 
         self.db.commit()
+        return batch
 
-        return DocumentIngestResponse(
-                document_id=doc.id,
-                title=doc.title,
-                status="success"
-            )
+    def next_pending_delay(self, document_id: Optional[uuid.UUID] = None) -> Optional[float]:
+        """Секунды до ближайшей доступной PENDING-строки; None — ожидающих строк нет"""
+        delay = self.db.execute(text(NEXT_PENDING_DELAY_SQL), {
+            "document_id": str(document_id) if document_id else None,
+        }).scalar()
+        self.db.commit()
+        return float(delay) if delay is not None else None
+
+
+class DocumentStreamWriter:
+    """
+    Запись документа, текст которого приходит потоком: готовые чанки пишутся партиями
+    (эмбеддинги PENDING, как в enqueue), весь документ — одна транзакция. В памяти держится только партия.
+    """
+
+    def __init__(self, ingestor: DocumentIngestor, document: Document, company_id: uuid.UUID, owner_id: uuid.UUID):
+        self.ingestor = ingestor
+        self.document = document
+        self.company_id = company_id
+        self.owner_id = owner_id
+        self.chunks = 0
+        self.subchunks = 0
+        self.reused = 0
+
+    def add_chunks(self, chunk_texts: Sequence[str]) -> None:
+        chunk_rows, subchunks = self.ingestor._chunk_rows(self.document.id, chunk_texts, start_idx=self.chunks)
+        vectors = self.ingestor._known_vectors(subchunks)
+        self.ingestor._write_rows(chunk_rows, self.ingestor._embedding_rows(subchunks, vectors))
+        self.chunks += len(chunk_rows)
+        self.subchunks += len(subchunks)
+        self.reused += sum(vector is not None for vector in vectors)
+
+    def finish(self) -> IngestJob:
+        job = self.ingestor._create_job(
+            self.document.id, self.company_id, self.owner_id, self.chunks, self.subchunks,
+            reused_subchunks=self.reused
+        )
+        self.ingestor.db.commit()
+        return job
+
+    def abort(self) -> None:
+        self.ingestor.db.rollback()
@@ -0,0 +1,136 @@
+import asyncio
+import codecs
+import uuid
+from typing import AsyncIterator, Iterable, List, Optional
+
+from nltk.tokenize.punkt import PunktTokenizer
+
+from knowledge_service.app.core import config
+from knowledge_service.app.models.core.ingest_job import IngestJob
+from knowledge_service.app.models.enums import DocAccessLevel, SourceType
+from knowledge_service.app.services.ingestion import DocumentIngestor
+
+# Текст без единой границы предложения дольше этого режется принудительно — буфер не растёт без предела
+MAX_PENDING_CHARS = 65536
+
+
+def charset_from_content_type(content_type: Optional[str], default: str = "utf-8") -> str:
+    """Кодировка из заголовка Content-Type (text/plain; charset=cp1251)"""
+    for param in (content_type or "").split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "charset" and value:
+            return value.strip('"')
+    return default
+
+
+class IncrementalSentenceSplitter:
+    """
+    sent_tokenize по мере поступления текста: последнее (возможно, недописанное) предложение
+    остаётся в буфере до следующей порции, остальные отдаются сразу.
+    """
+
+    def __init__(self, tokenizer: Optional[PunktTokenizer] = None, max_pending_chars: int = MAX_PENDING_CHARS):
+        self._tokenizer = tokenizer or PunktTokenizer("english")
+        self._buffer = ""
+        self.max_pending_chars = max_pending_chars
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        spans = list(self._tokenizer.span_tokenize(self._buffer))
+        if len(spans) > 1:
+            sentences = [self._buffer[start:end] for start, end in spans[:-1]]
+            self._buffer = self._buffer[spans[-1][0]:]
+            return sentences
+        if len(self._buffer) > self.max_pending_chars:
+            cut = self._buffer.rfind(" ", 0, self.max_pending_chars)
+            cut = cut if cut > 0 else self.max_pending_chars
+            sentence, self._buffer = self._buffer[:cut].strip(), self._buffer[cut:]
+            return [sentence] if sentence else []
+        return []
+
+    def finish(self) -> List[str]:
+        sentences = self._tokenizer.tokenize(self._buffer) if self._buffer.strip() else []
+        self._buffer = ""
+        return sentences
+
+
+class SentenceChunker:
+    """
+    Скользящее окно по предложениям — те же чанки, что DocumentIngestor._split_into_chunks_with_overlap,
+    но без списка всех предложений документа.
+    """
+
+    def __init__(self, chunk_size: int, overlap: int):
+        self.chunk_size = chunk_size
+        self.step = chunk_size - overlap
+        self._window: List[str] = []
+
+    def add(self, sentences: Iterable[str]) -> List[str]:
+        chunks = []
+        for sentence in sentences:
+            self._window.append(sentence)
+            if len(self._window) == self.chunk_size:
+                chunks.append(" ".join(self._window))
+                self._window = self._window[self.step:]
+        return chunks
+
+    def finish(self) -> List[str]:
+        chunks = []
+        while self._window:
+            chunks.append(" ".join(self._window))
+            self._window = self._window[self.step:]
+        return chunks
+
+
+async def aiter_chunk_texts(
+        byte_chunks: AsyncIterator[bytes],
+        chunk_size: int,
+        overlap: int,
+        encoding: str = "utf-8",
+        splitter: Optional[IncrementalSentenceSplitter] = None
+) -> AsyncIterator[str]:
+    """Тексты чанков из потока байтов; многобайтовые символы на стыке порций декодируются корректно"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    splitter = splitter or IncrementalSentenceSplitter()
+    chunker = SentenceChunker(chunk_size, overlap)
+
+    async for data in byte_chunks:
+        for chunk_text in chunker.add(splitter.feed(decoder.decode(data))):
+            yield chunk_text
+
+    tail = splitter.feed(decoder.decode(b"", final=True)) + splitter.finish()
+    for chunk_text in chunker.add(tail) + chunker.finish():
+        yield chunk_text
+
+
+async def ingest_stream(
+        ingestor: DocumentIngestor,
+        byte_chunks: AsyncIterator[bytes],
+        title: str,
+        source_type: SourceType,
+        access_level: DocAccessLevel,
+        company_id: uuid.UUID,
+        owner_id: uuid.UUID,
+        encoding: str = "utf-8",
+        batch_chunks: int = config.INGEST_STREAM_BATCH_CHUNKS
+) -> IngestJob:
+    """
+    Потоковый инжест: тело запроса режется на предложения и чанки по мере поступления,
+    чанки пишутся партиями (синхронная сессия — в отдельном потоке). Эмбеддинги считаются в фоне.
+    """
+    writer = await asyncio.to_thread(ingestor.open_stream, title, source_type, access_level, company_id, owner_id)
+    try:
+        batch: List[str] = []
+        async for chunk_text in aiter_chunk_texts(
+                byte_chunks, ingestor.chunk_size_sentences, ingestor.chunk_overlap_sentences, encoding
+        ):
+            batch.append(chunk_text)
+            if len(batch) >= batch_chunks:
+                await asyncio.to_thread(writer.add_chunks, batch)
+                batch = []
+        if batch:
+            await asyncio.to_thread(writer.add_chunks, batch)
+        return await asyncio.to_thread(writer.finish)
+    except BaseException:
+        await asyncio.to_thread(writer.abort)
+        raise
@@ -0,0 +1,57 @@
+"""add_hnsw_vector_index
+
+Revision ID: 3b7d2e91c4a5
+Revises: 6e93533354e2
+Create Date: 2025-08-02 12:41:18.204517
+
+"""
+import os
+from typing import Sequence, Union
+
+import pgvector.sqlalchemy
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7d2e91c4a5'
+down_revision: Union[str, Sequence[str], None] = '6e93533354e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Параметры индекса берутся из тех же переменных окружения, что и в app/core/config.py
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if VECTOR_INDEX_TYPE != "hnsw":
+        # ivfflat был построен на пустой таблице — перестраиваем по текущим данным
+        op.drop_index('ix_chunk_vector_cosine', table_name='chunk_embeddings_384', schema='kno')
+        op.create_index('ix_chunk_vector_cosine', 'chunk_embeddings_384', ['vector'], unique=False, schema='kno', postgresql_using='ivfflat', postgresql_ops={'vector': 'vector_cosine_ops'}, postgresql_with={'lists': IVFFLAT_LISTS})
+        return
+
+    op.create_index('ix_chunk_vector_hnsw', 'chunk_embeddings_384', ['vector'], unique=False, schema='kno', postgresql_using='hnsw', postgresql_ops={'vector': 'vector_cosine_ops'}, postgresql_with={'m': HNSW_M, 'ef_construction': HNSW_EF_CONSTRUCTION})
+    op.drop_index('ix_chunk_vector_cosine', table_name='chunk_embeddings_384', schema='kno')
+    op.alter_column('chunk_embeddings_384', 'vector',
+               existing_type=pgvector.sqlalchemy.vector.VECTOR(dim=384),
+               comment='Эмбеддинг вектора (use cosine; hnsw или ivfflat)',
+               existing_comment='Эмбеддинг вектора (use cosine; ivfflat(lists=100))',
+               existing_nullable=False,
+               schema='kno')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if VECTOR_INDEX_TYPE != "hnsw":
+        return
+
+    op.alter_column('chunk_embeddings_384', 'vector',
+               existing_type=pgvector.sqlalchemy.vector.VECTOR(dim=384),
+               comment='Эмбеддинг вектора (use cosine; ivfflat(lists=100))',
+               existing_comment='Эмбеддинг вектора (use cosine; hnsw или ivfflat)',
+               existing_nullable=False,
+               schema='kno')
+    op.create_index('ix_chunk_vector_cosine', 'chunk_embeddings_384', ['vector'], unique=False, schema='kno', postgresql_using='ivfflat', postgresql_ops={'vector': 'vector_cosine_ops'}, postgresql_with={'lists': 100})
+    op.drop_index('ix_chunk_vector_hnsw', table_name='chunk_embeddings_384', schema='kno', postgresql_using='hnsw', postgresql_ops={'vector': 'vector_cosine_ops'})
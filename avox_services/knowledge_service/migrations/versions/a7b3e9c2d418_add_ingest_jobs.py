@@ -0,0 +1,64 @@
+"""add_ingest_jobs
+
+Revision ID: a7b3e9c2d418
+Revises: f3c81d5e7a20
+Create Date: 2025-08-10 10:42:17.215904
+
+"""
+from typing import Sequence, Union
+
+import pgvector.sqlalchemy
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7b3e9c2d418'
+down_revision: Union[str, Sequence[str], None] = 'f3c81d5e7a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ingest_jobs',
+    sa.Column('id', sa.UUID(), nullable=False, comment='Уникальный идентификатор задания'),
+    sa.Column('company_id', sa.UUID(), nullable=False, comment='Компания, в рамках которой выполняется инжест'),
+    sa.Column('owner_id', sa.UUID(), nullable=True, comment='Пользователь, загрузивший документ'),
+    sa.Column('document_id', sa.UUID(), nullable=False, comment='Инжестируемый документ'),
+    sa.Column('status', sa.Enum('QUEUED', 'RUNNING', 'COMPLETED', 'FAILED', name='ingestjobstatus'), nullable=False, comment='Статус задания: queued, running, completed, failed'),
+    sa.Column('total_chunks', sa.Integer(), nullable=False, comment='Чанков в документе'),
+    sa.Column('total_subchunks', sa.Integer(), nullable=False, comment='Подчанков (эмбеддингов) к расчёту'),
+    sa.Column('error_message', sa.Text(), nullable=True, comment='Ошибка, остановившая задание'),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True, comment='Начало расчёта эмбеддингов'),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True, comment='Окончание задания'),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, comment='Время создания'),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, comment='Время последнего обновления'),
+    sa.ForeignKeyConstraint(['company_id'], ['kno.companies.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['owner_id'], ['kno.users.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['document_id'], ['kno.documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    schema='kno'
+    )
+    op.create_index('ix_ingest_job_document_id', 'ingest_jobs', ['document_id'], unique=False, schema='kno')
+    op.create_index('ix_ingest_job_company_id', 'ingest_jobs', ['company_id', 'created_at'], unique=False, schema='kno')
+
+    # PENDING-эмбеддинги записываются без вектора; генерируемые vector_half / vector_bit для них тоже NULL
+    op.alter_column('chunk_embeddings_384', 'vector',
+               existing_type=pgvector.sqlalchemy.vector.VECTOR(dim=384),
+               nullable=True,
+               comment='Эмбеддинг вектора (use cosine; hnsw или ivfflat); NULL, пока статус PENDING',
+               schema='kno')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM kno.chunk_embeddings_384 WHERE vector IS NULL")
+    op.alter_column('chunk_embeddings_384', 'vector',
+               existing_type=pgvector.sqlalchemy.vector.VECTOR(dim=384),
+               nullable=False,
+               comment='Эмбеддинг вектора (use cosine; hnsw или ivfflat)',
+               schema='kno')
+    op.drop_index('ix_ingest_job_company_id', table_name='ingest_jobs', schema='kno')
+    op.drop_index('ix_ingest_job_document_id', table_name='ingest_jobs', schema='kno')
+    op.drop_table('ingest_jobs', schema='kno')
+    sa.Enum(name='ingestjobstatus').drop(op.get_bind(), checkfirst=True)
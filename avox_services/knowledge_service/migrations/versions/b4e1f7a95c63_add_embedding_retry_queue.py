@@ -0,0 +1,29 @@
+"""add_embedding_retry_queue
+
+Revision ID: b4e1f7a95c63
+Revises: a7b3e9c2d418
+Create Date: 2025-08-11 09:27:51.604318
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e1f7a95c63'
+down_revision: Union[str, Sequence[str], None] = 'a7b3e9c2d418'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chunk_embeddings_384', sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True, comment='Не раньше этого времени — повтор после ошибки'), schema='kno')
+    op.create_index('ix_chunk_embedding_pending', 'chunk_embeddings_384', ['created_at'], unique=False, schema='kno', postgresql_where=sa.text("status = 'PENDING'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chunk_embedding_pending', table_name='chunk_embeddings_384', schema='kno', postgresql_where=sa.text("status = 'PENDING'"))
+    op.drop_column('chunk_embeddings_384', 'next_attempt_at', schema='kno')
@@ -0,0 +1,31 @@
+"""add_access_filter_indexes
+
+Revision ID: c5e8a1f04d27
+Revises: 3b7d2e91c4a5
+Create Date: 2025-08-03 10:12:47.551093
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e8a1f04d27'
+down_revision: Union[str, Sequence[str], None] = '3b7d2e91c4a5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_document_company_access', 'documents', ['company_id', 'access_level', 'is_approved'], unique=False, schema='kno')
+    op.create_index('ix_access_grant_user_document', 'access_grants', ['user_id', 'document_id'], unique=False, schema='kno', postgresql_where=sa.text('is_revoked = false'))
+    op.create_index('ix_chunk_embedding_chunk_id', 'chunk_embeddings_384', ['chunk_id'], unique=False, schema='kno')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chunk_embedding_chunk_id', table_name='chunk_embeddings_384', schema='kno')
+    op.drop_index('ix_access_grant_user_document', table_name='access_grants', schema='kno', postgresql_where=sa.text('is_revoked = false'))
+    op.drop_index('ix_document_company_access', table_name='documents', schema='kno')
@@ -0,0 +1,31 @@
+"""add_embedding_content_hash
+
+Revision ID: c9d2a4e6b871
+Revises: b4e1f7a95c63
+Create Date: 2025-08-14 15:02:38.217940
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9d2a4e6b871'
+down_revision: Union[str, Sequence[str], None] = 'b4e1f7a95c63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chunk_embeddings_384', sa.Column('content_hash', sa.String(length=64), nullable=True, comment='sha256 нормализованного текста подчанка — ключ повторного использования вектора'), schema='kno')
+    op.create_index('ix_chunk_embedding_content_hash', 'chunk_embeddings_384', ['embedding_model', 'content_hash'], unique=False, schema='kno', postgresql_where=sa.text("status = 'COMPLETED'"))
+    op.add_column('ingest_jobs', sa.Column('reused_subchunks', sa.Integer(), server_default='0', nullable=False, comment='Подчанков, векторы которых взяты из хранилища по хэшу содержимого'), schema='kno')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('ingest_jobs', 'reused_subchunks', schema='kno')
+    op.drop_index('ix_chunk_embedding_content_hash', table_name='chunk_embeddings_384', schema='kno', postgresql_where=sa.text("status = 'COMPLETED'"))
+    op.drop_column('chunk_embeddings_384', 'content_hash', schema='kno')
@@ -0,0 +1,29 @@
+"""add_document_versioning
+
+Revision ID: d1e5f8b3c047
+Revises: c9d2a4e6b871
+Create Date: 2025-08-18 11:46:09.530172
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1e5f8b3c047'
+down_revision: Union[str, Sequence[str], None] = 'c9d2a4e6b871'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('documents', sa.Column('version', sa.Integer(), server_default='1', nullable=False, comment='Версия содержимого; растёт при каждом обновлении текста'), schema='kno')
+    op.add_column('document_chunks', sa.Column('content_hash', sa.String(length=64), nullable=True, comment='sha256 нормализованного текста — сравнение версий документа'), schema='kno')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('document_chunks', 'content_hash', schema='kno')
+    op.drop_column('documents', 'version', schema='kno')
@@ -0,0 +1,43 @@
+"""add_chunk_fulltext_search
+
+Revision ID: d7f3b2a9e614
+Revises: c5e8a1f04d27
+Create Date: 2025-08-06 14:31:09.218754
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7f3b2a9e614'
+down_revision: Union[str, Sequence[str], None] = 'c5e8a1f04d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHUNK_TSV_EXPRESSION = "to_tsvector('russian', chunk_text) || to_tsvector('simple', chunk_text)"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Генерируемая колонка: существующие чанки заполняются при добавлении, новые — при вставке
+    op.add_column(
+        'document_chunks',
+        sa.Column(
+            'chunk_tsv',
+            postgresql.TSVECTOR(),
+            sa.Computed(CHUNK_TSV_EXPRESSION, persisted=True),
+            nullable=True,
+            comment='Полнотекстовый индекс текста: russian (словоформы) + simple (коды, номера, имена как есть)'
+        ),
+        schema='kno'
+    )
+    op.create_index('ix_chunk_tsv', 'document_chunks', ['chunk_tsv'], unique=False, schema='kno', postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chunk_tsv', table_name='document_chunks', schema='kno', postgresql_using='gin')
+    op.drop_column('document_chunks', 'chunk_tsv', schema='kno')
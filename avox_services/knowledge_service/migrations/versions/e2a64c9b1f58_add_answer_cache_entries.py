@@ -0,0 +1,50 @@
+"""add_answer_cache_entries
+
+Revision ID: e2a64c9b1f58
+Revises: d7f3b2a9e614
+Create Date: 2025-08-08 11:05:42.873310
+
+"""
+from typing import Sequence, Union
+
+import pgvector.sqlalchemy
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a64c9b1f58'
+down_revision: Union[str, Sequence[str], None] = 'd7f3b2a9e614'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('answer_cache_entries',
+    sa.Column('id', sa.UUID(), nullable=False, comment='Уникальный идентификатор записи кэша'),
+    sa.Column('company_id', sa.UUID(), nullable=False, comment='Компания, в рамках которой действует запись'),
+    sa.Column('scope_key', sa.String(length=64), nullable=False, comment='Отпечаток набора доступных документов (и ограничения doc_ids)'),
+    sa.Column('strategy', sa.String(length=32), nullable=False, comment='Стратегия ответа: sequential, map_reduce'),
+    sa.Column('embedding_model', sa.String(length=255), nullable=False, comment='Модель эмбеддинга вопроса'),
+    sa.Column('question_text', sa.Text(), nullable=False, comment='Исходный вопрос'),
+    sa.Column('question_vector', pgvector.sqlalchemy.vector.VECTOR(dim=384), nullable=False, comment='Эмбеддинг вопроса (cosine)'),
+    sa.Column('response', postgresql.JSONB(astext_type=sa.Text()), nullable=False, comment='Сериализованный RAGResponse'),
+    sa.Column('document_versions', postgresql.JSONB(astext_type=sa.Text()), nullable=False, comment='Версии использованных документов: {document_id: updated_at}'),
+    sa.Column('hit_count', sa.Integer(), nullable=False, comment='Количество попаданий'),
+    sa.Column('last_hit_at', sa.DateTime(timezone=True), nullable=True, comment='Время последнего попадания'),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, comment='Время создания'),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, comment='Время последнего обновления'),
+    sa.ForeignKeyConstraint(['company_id'], ['kno.companies.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    schema='kno'
+    )
+    op.create_index('ix_answer_cache_scope', 'answer_cache_entries', ['company_id', 'scope_key', 'strategy'], unique=False, schema='kno')
+    op.create_index('ix_answer_cache_created_at', 'answer_cache_entries', ['created_at'], unique=False, schema='kno')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_answer_cache_created_at', table_name='answer_cache_entries', schema='kno')
+    op.drop_index('ix_answer_cache_scope', table_name='answer_cache_entries', schema='kno')
+    op.drop_table('answer_cache_entries', schema='kno')
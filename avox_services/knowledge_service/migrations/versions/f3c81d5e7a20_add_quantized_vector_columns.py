@@ -0,0 +1,78 @@
+"""add_quantized_vector_columns
+
+Revision ID: f3c81d5e7a20
+Revises: e2a64c9b1f58
+Create Date: 2025-08-09 11:05:42.730164
+
+"""
+import os
+from typing import Sequence, Union
+
+import pgvector.sqlalchemy
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c81d5e7a20'
+down_revision: Union[str, Sequence[str], None] = 'e2a64c9b1f58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Параметры берутся из тех же переменных окружения, что и в app/core/config.py
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full")
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+
+VECTOR_HALF_EXPRESSION = "CAST(vector AS halfvec(384))"
+VECTOR_BIT_EXPRESSION = "CAST(binary_quantize(vector) AS bit(384))"
+
+# Компактная колонка режима: тип, выражение, operator class, комментарий
+QUANTIZED_COLUMNS = {
+    'halfvec': ('vector_half', pgvector.sqlalchemy.HALFVEC(dim=384), VECTOR_HALF_EXPRESSION, 'halfvec_cosine_ops',
+                'Вектор в half precision для компактного индекса (halfvec_cosine_ops)'),
+    'binary': ('vector_bit', pgvector.sqlalchemy.BIT(length=384), VECTOR_BIT_EXPRESSION, 'bit_hamming_ops',
+               'Бинарно-квантованный вектор для индекса по расстоянию Хэмминга'),
+}
+FULL_INDEX = 'ix_chunk_vector_hnsw' if VECTOR_INDEX_TYPE == "hnsw" else 'ix_chunk_vector_cosine'
+
+
+def create_full_index() -> None:
+    if VECTOR_INDEX_TYPE == "hnsw":
+        op.create_index('ix_chunk_vector_hnsw', 'chunk_embeddings_384', ['vector'], unique=False, schema='kno', postgresql_using='hnsw', postgresql_ops={'vector': 'vector_cosine_ops'}, postgresql_with={'m': HNSW_M, 'ef_construction': HNSW_EF_CONSTRUCTION})
+    else:
+        op.create_index('ix_chunk_vector_cosine', 'chunk_embeddings_384', ['vector'], unique=False, schema='kno', postgresql_using='ivfflat', postgresql_ops={'vector': 'vector_cosine_ops'}, postgresql_with={'lists': IVFFLAT_LISTS})
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # При VECTOR_STORAGE=full схема не меняется: колонки и индексы только для настроенного компактного режима
+    if VECTOR_STORAGE not in QUANTIZED_COLUMNS:
+        return
+
+    name, column_type, expression, ops, comment = QUANTIZED_COLUMNS[VECTOR_STORAGE]
+    # Генерируемая колонка: существующие эмбеддинги заполняются при добавлении (перезапись таблицы), новые — при вставке
+    op.add_column(
+        'chunk_embeddings_384',
+        sa.Column(name, column_type, sa.Computed(expression, persisted=True), nullable=True, comment=comment),
+        schema='kno'
+    )
+    op.create_index(f'ix_chunk_{name}_hnsw', 'chunk_embeddings_384', [name], unique=False, schema='kno', postgresql_using='hnsw', postgresql_ops={name: ops}, postgresql_with={'m': HNSW_M, 'ef_construction': HNSW_EF_CONSTRUCTION})
+    # Первый этап идёт по компактному индексу, дорескоринг — по строкам кандидатов: полный индекс не нужен
+    op.drop_index(FULL_INDEX, table_name='chunk_embeddings_384', schema='kno')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Состояние берётся из базы: режим мог быть сменён через app/cli/vector_storage.py
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('chunk_embeddings_384', schema='kno')}
+    indexes = {index['name'] for index in inspector.get_indexes('chunk_embeddings_384', schema='kno')}
+
+    for name, *_ in QUANTIZED_COLUMNS.values():
+        if name in columns:
+            # Индекс по колонке удаляется вместе с ней
+            op.drop_column('chunk_embeddings_384', name, schema='kno')
+    if FULL_INDEX not in indexes:
+        create_full_index()
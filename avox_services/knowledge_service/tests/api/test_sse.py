@@ -0,0 +1,33 @@
+import json
+
+from avox_shared.knowledge_service.rag import AnswerStrategy, RAGResponse
+from knowledge_service.app.api.sse import format_sse
+
+
+def test_format_sse_event_and_json_payload():
+    frame = format_sse("answer_delta", {"text": "Привет"})
+
+    assert frame.startswith("event: answer_delta\ndata: ")
+    assert frame.endswith("\n\n")
+    # ensure_ascii=False: кириллица передаётся как есть
+    assert json.loads(frame.split("data: ", 1)[1]) == {"text": "Привет"}
+
+
+def test_format_sse_serializes_rag_response():
+    response = RAGResponse(
+        final_result="ok",
+        facts=[],
+        reasoning="",
+        used_documents=[],
+        used_doc_chunks=[],
+        confidence=0.0,
+        llm_provider="VLLMProvider",
+        processing_time_ms=1,
+        strategy=AnswerStrategy.MAP_REDUCE,
+    )
+    frame = format_sse("done", response)
+
+    assert frame.startswith("event: done\n")
+    done = json.loads(frame.split("data: ", 1)[1])
+    assert done["final_result"] == "ok"
+    assert done["strategy"] == "map_reduce"
@@ -33,4 +33,25 @@ def mock_db_session():
 
     session.add.side_effect = lambda obj: setattr(obj, 'id', uuid.uuid4())
 
-    return session
\ No newline at end of file
+    return session
+
+
+@pytest.fixture
+def mock_embedding_registry():
+    """
+    Реестр эмбеддингов без загрузки реальных моделей.
+    """
+    registry = MagicMock()
+
+    model = MagicMock()
+    model.model_name = "sentence-transformers/all-MiniLM-L6-v2"
+    registry.get_embedder.return_value = model
+
+    tokenizer = MagicMock()
+    tokenizer.return_value = {
+        'input_ids': [[0] * 256, [1] * 256],
+        'offset_mapping': [[(0, 50), (51, 100)], [(100, 150), (151, 200)]]
+    }
+    registry.get_tokenizer.return_value = tokenizer
+
+    return registry
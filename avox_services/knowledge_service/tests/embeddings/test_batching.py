@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from knowledge_service.app.embeddings.batching import MicroBatchingEncoder
+
+
+class RecordingEmbedder:
+    model_name = "test-model"
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self.release = threading.Event()
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        self.release.wait(timeout=5)
+        if self.fail:
+            raise RuntimeError("model failed")
+        return np.array([[float(len(t)), 1.0] for t in texts])
+
+
+def test_concurrent_requests_share_one_forward_pass():
+    embedder = RecordingEmbedder()
+    encoder = MicroBatchingEncoder(embedder, max_batch_size=8, max_wait_ms=200)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(encoder.encode_one, q) for q in ["a", "bb", "ccc", "bb"]]
+        embedder.release.set()
+        vectors = [f.result(timeout=5) for f in futures]
+    encoder.close()
+
+    assert [v[0] for v in vectors] == [1.0, 2.0, 3.0, 2.0]
+    # Все четыре запроса — одна партия, повторяющийся вопрос кодируется один раз
+    assert len(embedder.calls) == 1 and sorted(embedder.calls[0]) == ["a", "bb", "ccc"]
+    stats = encoder.stats()
+    assert stats["batches"] == 1 and stats["batch_sizes"] == {4: 1} and stats["queue_depth"] == 0
+
+
+def test_batch_is_limited_by_size():
+    embedder = RecordingEmbedder()
+    embedder.release.set()
+    encoder = MicroBatchingEncoder(embedder, max_batch_size=2, max_wait_ms=200)
+
+    futures = [encoder.submit(q) for q in ["a", "b", "c"]]
+    for future in futures:
+        future.result(timeout=5)
+    encoder.close()
+
+    assert [len(c) for c in embedder.calls] == [2, 1]
+
+
+def test_model_error_fails_every_waiting_caller():
+    embedder = RecordingEmbedder(fail=True)
+    embedder.release.set()
+    encoder = MicroBatchingEncoder(embedder, max_batch_size=4, max_wait_ms=1)
+
+    with pytest.raises(RuntimeError):
+        encoder.encode_one("a")
+    encoder.close()
+    assert encoder.stats()["errors"] == 1
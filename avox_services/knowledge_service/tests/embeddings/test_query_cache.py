@@ -0,0 +1,68 @@
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from knowledge_service.app.core.cache import LRUTTLCache
+from knowledge_service.app.embeddings.query_cache import QueryEmbeddingCache, query_cache_key
+
+MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUTTLCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")      # "a" становится свежим
+    cache.set("c", 3)   # вытесняется "b"
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.evictions == 1
+
+
+def test_ttl_expiration():
+    cache = LRUTTLCache(max_size=10, ttl_seconds=5)
+    with patch("knowledge_service.app.core.cache.time.monotonic", return_value=100.0):
+        cache.set("a", 1)
+    with patch("knowledge_service.app.core.cache.time.monotonic", return_value=106.0):
+        assert cache.get("a") is None
+    assert cache.misses == 1
+
+
+def test_question_is_normalized_in_key():
+    assert query_cache_key("  Какой   срок ДОГОВОРА? ", MODEL, lowercase=True) == query_cache_key("какой срок договора?", MODEL, lowercase=True)
+    assert query_cache_key("вопрос", MODEL) != query_cache_key("вопрос", "other-model")
+
+
+def test_case_is_kept_for_cased_models():
+    # Cased модель: регистр меняет эмбеддинг, нормализуются только пробелы и NFKC
+    assert query_cache_key("Apple", MODEL) != query_cache_key("apple", MODEL)
+    assert query_cache_key(" Apple\u00a0pie ", MODEL) == query_cache_key("Apple pie", MODEL)
+
+
+def test_get_or_compute_calls_model_once():
+    cache = QueryEmbeddingCache(max_size=10, ttl_seconds=60)
+    compute = MagicMock(return_value=np.ones(384, dtype=np.float32))
+
+    first = cache.get_or_compute("Вопрос", MODEL, compute, lowercase=True)
+    second = cache.get_or_compute("вопрос ", MODEL, compute, lowercase=True)
+
+    compute.assert_called_once()
+    assert np.array_equal(first, second)
+    assert cache.stats()["hits"] == 1
+
+
+def test_redis_backend_shares_vectors_between_replicas():
+    storage = {}
+    redis_client = MagicMock()
+    redis_client.get.side_effect = storage.get
+    redis_client.set.side_effect = lambda key, value, ex=None: storage.__setitem__(key, value)
+
+    replica_a = QueryEmbeddingCache(max_size=10, ttl_seconds=60, redis_client=redis_client)
+    replica_b = QueryEmbeddingCache(max_size=10, ttl_seconds=60, redis_client=redis_client)
+
+    replica_a.set("вопрос", MODEL, np.full(384, 0.5, dtype=np.float32))
+    vector = replica_b.get("вопрос", MODEL)
+
+    assert vector is not None and vector.shape == (384,)
+    assert replica_b.redis_hits == 1
@@ -0,0 +1,34 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from knowledge_service.app.cli.embedding_benchmark import vector_agreement
+from knowledge_service.app.embeddings.registry import EmbeddingRegistry, load_sentence_transformer
+
+MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def test_onnx_backend_loads_exported_model_under_original_name():
+    with patch("knowledge_service.app.embeddings.registry.SentenceTransformer") as model_cls:
+        embedder = EmbeddingRegistry(backend="onnx").get_embedder(MODEL)
+
+    # Эмбеддинги в БД и ключи кэшей помечаются исходным именем модели
+    assert embedder.model_name == MODEL and embedder.backend == "onnx"
+    assert model_cls.call_args.kwargs["backend"] == "onnx"
+    assert "file_name" in model_cls.call_args.kwargs["model_kwargs"]
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        load_sentence_transformer(MODEL, "tensorrt")
+
+
+def test_vector_agreement_reports_cosine_and_max_diff():
+    reference = np.array([[1.0, 0.0], [0.0, 1.0]])
+    candidate = np.array([[1.0, 0.0], [0.1, 1.0]])
+
+    agreement = vector_agreement(reference, candidate)
+
+    assert agreement["min_cosine"] == pytest.approx(1.0 / np.sqrt(1.01))
+    assert agreement["max_abs_diff"] == pytest.approx(0.1 / np.sqrt(1.01))
@@ -0,0 +1,60 @@
+import asyncio
+import uuid
+
+from avox_shared.knowledge_service.rag import AnswerStrategy
+from knowledge_service.app.llm.answer_cache import AnswerCacheKey, SemanticAnswerCache, scope_key
+
+
+def _row(distance, versions):
+    return {"id": uuid.uuid4(), "response": {}, "document_versions": versions, "distance": distance}
+
+
+def test_scope_key_depends_on_access_and_doc_restriction():
+    assert scope_key("fp") == scope_key("fp", [])
+    assert scope_key("fp", ["b", "a"]) == scope_key("fp", ["a", "b"])
+    assert scope_key("fp") != scope_key("other")
+    assert scope_key("fp") != scope_key("fp", ["a"])
+    # Новый или изменённый документ раздела меняет ключ
+    assert scope_key("fp", None, "2025-08-01T10:00:00+00:00") != scope_key("fp", None, "2025-08-02T10:00:00+00:00")
+
+
+def test_only_similar_questions_are_candidates():
+    cache = SemanticAnswerCache(similarity=0.95)
+    rows = [_row(0.01, {}), _row(0.049, {}), _row(0.2, {})]
+
+    assert cache._similar_rows(rows) == rows[:2]
+
+
+def test_entries_with_changed_documents_are_stale():
+    cache = SemanticAnswerCache()
+    changed = _row(0.01, {"doc-1": "2025-08-01T10:00:00+00:00"})
+    deleted = _row(0.02, {"doc-2": "2025-08-01T10:00:00+00:00"})
+    valid = _row(0.03, {"doc-1": "2025-08-02T10:00:00+00:00"})
+    current = {"doc-1": "2025-08-02T10:00:00+00:00"}
+
+    row, stale_ids = cache._pick([changed, deleted, valid], current)
+
+    assert row is valid
+    assert stale_ids == [str(changed["id"]), str(deleted["id"])]
+
+
+def _key():
+    return AnswerCacheKey(
+        company_id=uuid.uuid4(),
+        scope_key=scope_key("fp"),
+        strategy=AnswerStrategy.MAP_REDUCE,
+        embedding_model="model",
+        query_vector=(0.1,) * 384,
+    )
+
+
+def test_cache_failure_stays_in_its_own_session():
+    def broken_session():
+        raise ConnectionError("db is down")
+
+    cache = SemanticAnswerCache(session_factory=broken_session)
+
+    # Ошибка кэша — промах (None — кэш на этот запрос выключен), а не исключение в запросе
+    assert asyncio.run(cache.alookup(_key())) is None
+    assert asyncio.run(cache.acontent_version([uuid.uuid4()])) is None
+    assert cache.errors == 2
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+
+from knowledge_service.app.llm.base_provider import BaseLLMProvider
+
+
+class EchoProvider(BaseLLMProvider):
+    def __init__(self):
+        self.threads = []
+
+    def generate(self, prompt, **kwargs):
+        self.threads.append(threading.get_ident())
+        return f"echo: {prompt}"
+
+    def get_model_info(self):
+        return {"provider": "echo"}
+
+    def validate_credentials(self):
+        return True
+
+
+def test_agenerate_runs_sync_provider_off_event_loop():
+    provider = EchoProvider()
+
+    async def run():
+        loop_thread = threading.get_ident()
+        results = await asyncio.gather(*(provider.agenerate(str(i)) for i in range(3)))
+        return loop_thread, results
+
+    loop_thread, results = asyncio.run(run())
+
+    assert results == ["echo: 0", "echo: 1", "echo: 2"]
+    # generate() вызывается в рабочих потоках, event loop не блокируется
+    assert loop_thread not in provider.threads
+
+
+def test_astream_yields_generated_text():
+    async def collect():
+        return [delta async for delta in EchoProvider().astream("hi")]
+
+    assert asyncio.run(collect()) == ["echo: hi"]
@@ -0,0 +1,38 @@
+import uuid
+
+from knowledge_service.app.llm.context import estimate_tokens, merge_adjacent_chunks, overlap_length
+
+SENTENCES = [f"Предложение номер {i}." for i in range(8)]
+
+
+def _chunk(idx, sentences):
+    return {"chunk_id": uuid.uuid4(), "document_id": "doc", "chunk_idx": idx, "chunk_text": " ".join(sentences)}
+
+
+def test_overlap_length_respects_word_boundaries():
+    assert overlap_length("один два три", "два три четыре") == len("два три")
+    assert overlap_length("один два", "ва три") == 0
+    assert overlap_length("один", "два") == 0
+
+
+def test_overlapping_chunks_merge_into_one_span():
+    # Как в DocumentIngestor: 5 предложений, перекрытие 2
+    chunks = [_chunk(1, SENTENCES[3:8]), _chunk(0, SENTENCES[0:5])]
+
+    context = merge_adjacent_chunks(chunks)
+
+    assert len(context.spans) == 1
+    span = context.spans[0]
+    assert span.text == " ".join(SENTENCES)
+    assert span.chunk_ids == [str(chunks[1]["chunk_id"]), str(chunks[0]["chunk_id"])]
+    assert context.tokens_saved == estimate_tokens(" ".join(SENTENCES[3:5]))
+
+
+def test_non_adjacent_chunks_stay_separate():
+    chunks = [_chunk(0, SENTENCES[0:5]), _chunk(2, SENTENCES[6:8])]
+
+    context = merge_adjacent_chunks(chunks)
+
+    assert [s.chunk_idx_start for s in context.spans] == [0, 2]
+    assert context.tokens_saved == 0
+    assert context.to_document_context()[1]["chunk_ids"] == [str(chunks[1]["chunk_id"])]
@@ -0,0 +1,86 @@
+import asyncio
+
+from knowledge_service.app.llm.base_provider import BaseLLMProvider
+from knowledge_service.app.llm.conversation import Conversation, ConversationMemory, ConversationStore
+
+
+class SummaryLLM(BaseLLMProvider):
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return "краткое содержание"
+
+    def get_model_info(self):
+        return {"provider": "summary"}
+
+    def validate_credentials(self):
+        return True
+
+
+def _messages(count, text="сообщение"):
+    return [{"role": "user" if i % 2 == 0 else "system", "text": f"{text} {i}"} for i in range(count)]
+
+
+def test_format_keeps_newest_messages_within_budget():
+    memory = ConversationMemory(ConversationStore(), token_budget=12)
+    conversation = Conversation(messages=_messages(6))
+
+    history = memory.format(conversation, "вопрос")
+
+    # По 4 токена на сообщение: после вопроса (3 токена) помещаются только два последних
+    assert history.splitlines() == ["user: сообщение 4", "system: сообщение 5", "user: вопрос"]
+
+
+def test_format_puts_summary_first():
+    memory = ConversationMemory(ConversationStore(), token_budget=100)
+    conversation = Conversation(summary="ранее обсуждали отпуск", messages=_messages(2))
+
+    lines = memory.format(conversation, "вопрос").splitlines()
+
+    assert lines[0] == "summary: ранее обсуждали отпуск"
+    assert lines[-1] == "user: вопрос"
+
+
+def test_old_messages_are_folded_into_summary():
+    store = ConversationStore()
+    memory = ConversationMemory(store, history_limit=4, summarize_batch=2)
+    llm = SummaryLLM()
+    store.append("u:c", _messages(4))
+    store.append("u:c", [{"role": "user", "text": "новый вопрос"}, {"role": "system", "text": "новый ответ"}])
+
+    asyncio.run(memory._afold("u:c", llm))
+
+    conversation = store.get("u:c")
+    assert conversation.summary == "краткое содержание"
+    assert [m["text"] for m in conversation.messages] == ["сообщение 2", "сообщение 3", "новый вопрос", "новый ответ"]
+    assert '"сообщение 0"' in llm.prompts[0] and '"сообщение 2"' not in llm.prompts[0]
+
+
+def test_fold_is_skipped_when_locked():
+    store = ConversationStore()
+    memory = ConversationMemory(store, history_limit=2, summarize_batch=2)
+    store.append("u:c", _messages(4))
+    assert store.try_lock_fold("u:c")
+
+    asyncio.run(memory._afold("u:c", SummaryLLM()))
+
+    assert len(store.get("u:c").messages) == 4
+
+
+class SlowLLM(SummaryLLM):
+    async def agenerate(self, prompt, **kwargs):
+        await asyncio.sleep(1)
+        return "краткое содержание"
+
+
+def test_fold_gives_up_after_timeout_and_releases_lock():
+    store = ConversationStore(fold_timeout=0.01)
+    memory = ConversationMemory(store, history_limit=2, summarize_batch=2)
+    store.append("u:c", _messages(4))
+
+    asyncio.run(memory._afold("u:c", SlowLLM()))
+
+    assert len(store.get("u:c").messages) == 4
+    assert store.try_lock_fold("u:c")
@@ -0,0 +1,89 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from knowledge_service.app.db.access_versions import _collect_access_changes, mark_access_changed
+from knowledge_service.app.models.core.company import User
+from knowledge_service.app.retrieval.access import AccessScope
+from knowledge_service.app.retrieval.access_cache import AccessSet, AccessSetCache, AccessVersionStore
+
+
+def _mock_db(doc_ids, valid_until=None):
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = doc_ids
+    result.scalar.return_value = valid_until
+    db = MagicMock()
+    db.execute = AsyncMock(return_value=result)
+    return db
+
+
+def _scope():
+    return AccessScope(user_id=uuid.uuid4(), company_id=uuid.uuid4(), is_internal=True)
+
+
+def test_access_set_membership_and_intersection():
+    ids = [uuid.uuid4() for _ in range(50)]
+    access_set = AccessSet(ids, version=(0, 0))
+
+    assert len(access_set) == 50
+    assert access_set.nbytes == 50 * 16
+    assert all(doc_id in access_set for doc_id in ids)
+    assert uuid.uuid4() not in access_set
+    assert access_set.intersect([str(ids[3]), str(uuid.uuid4()), "not-a-uuid"]) == [ids[3]]
+
+
+def test_fingerprint_does_not_depend_on_order():
+    ids = [uuid.uuid4() for _ in range(5)]
+    assert AccessSet(ids, (0, 0)).fingerprint == AccessSet(list(reversed(ids)), (1, 1)).fingerprint
+
+
+def test_cache_hits_until_version_bump():
+    versions = AccessVersionStore()
+    cache = AccessSetCache(versions, max_size=10, ttl_seconds=60)
+    scope = _scope()
+    db = _mock_db([uuid.uuid4()])
+
+    first = asyncio.run(cache.aget(db, scope))
+    second = asyncio.run(cache.aget(db, scope))
+    assert first is second
+
+    # Новый грант пользователю — набор перестраивается
+    versions.bump(user_ids=[scope.user_id])
+    third = asyncio.run(cache.aget(db, scope))
+    assert third is not first
+    assert cache.stale == 1
+
+
+def test_cache_rebuilds_after_grant_expiry():
+    cache = AccessSetCache(AccessVersionStore(), max_size=10, ttl_seconds=60)
+    scope = _scope()
+    db = _mock_db([uuid.uuid4()], valid_until=datetime.now() - timedelta(seconds=1))
+
+    first = asyncio.run(cache.aget(db, scope))
+    second = asyncio.run(cache.aget(db, scope))
+    assert first is not second
+
+
+def test_cache_key_includes_company_and_user_type():
+    cache = AccessSetCache(AccessVersionStore(), max_size=10, ttl_seconds=60)
+    scope = _scope()
+    db = _mock_db([uuid.uuid4()])
+
+    first = asyncio.run(cache.aget(db, scope))
+    # Тип пользователя сменён в обход ORM: версия та же, но запись другая
+    demoted = AccessScope(user_id=scope.user_id, company_id=scope.company_id, is_internal=False)
+    assert asyncio.run(cache.aget(db, demoted)) is not first
+    moved = AccessScope(user_id=scope.user_id, company_id=uuid.uuid4(), is_internal=True)
+    assert asyncio.run(cache.aget(db, moved)) is not first
+
+
+def test_user_changes_and_raw_sql_marks_are_collected():
+    user = MagicMock(spec=User, id=uuid.uuid4())
+    session = MagicMock(new=[], dirty=[user], deleted=[], info={})
+    company_id = uuid.uuid4()
+
+    _collect_access_changes(session, None)
+    mark_access_changed(session, company_ids=[company_id])
+
+    assert session.info["access_changes"] == {"companies": {company_id}, "users": {user.id}}
@@ -0,0 +1,126 @@
+import asyncio
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+from knowledge_service.app.core import config
+from knowledge_service.app.retrieval.access import DocumentFilter
+from knowledge_service.app.retrieval.config import RetrievalConfig
+from knowledge_service.app.retrieval.engine import ChunkRetriever, code_terms
+
+
+def _row(best_distance=None, fts_rank=None, ann_rank=None, rrf_score=0.0):
+    return {
+        "chunk_id": uuid.uuid4(),
+        "document_id": uuid.uuid4(),
+        "chunk_idx": 0,
+        "best_distance": best_distance,
+        "avg_distance": best_distance,
+        "match_count": 1 if best_distance is not None else 0,
+        "ann_rank": ann_rank,
+        "fts_rank": fts_rank,
+        "rrf_score": rrf_score,
+    }
+
+
+def _filter(exact_scan=False):
+    return DocumentFilter(
+        condition="dc.document_id = ANY(CAST(:doc_ids AS uuid[]))",
+        params={"doc_ids": [str(uuid.uuid4())]},
+        exact_scan=exact_scan
+    )
+
+
+def test_code_terms_keeps_codes_and_numbers():
+    question = "Какой срок у договора 123/45-А и продукта AB-1234 от ООО Ромашка?"
+    assert code_terms(question).split() == ["123/45-А", "AB-1234", "ООО"]
+    assert code_terms("как оформить отпуск") == ""
+
+
+def test_hybrid_keeps_lexical_matches_below_vector_threshold():
+    retriever = ChunkRetriever(db=None, config=RetrievalConfig(mode="hybrid"))
+    rows = [
+        _row(best_distance=0.1, ann_rank=1, rrf_score=1 / 61),
+        _row(fts_rank=1, rrf_score=1 / 61),                     # найден только по тексту
+        _row(best_distance=0.95, ann_rank=2, rrf_score=1 / 62),  # слабое векторное совпадение
+    ]
+
+    chunks = retriever._score_rows(rows, subchunk_top_k=3, score_threshold=0.3, hybrid=True)
+
+    assert [c["chunk_id"] for c in chunks] == [rows[0]["chunk_id"], rows[1]["chunk_id"]]
+    assert chunks[1]["fts_rank"] == 1 and chunks[1]["match_count"] == 0
+
+
+def test_hybrid_mode_requires_question_text():
+    retriever = ChunkRetriever(db=None, config=RetrievalConfig(mode="hybrid"))
+    assert retriever.is_hybrid("договор AB-1234")
+    assert not retriever.is_hybrid("  ")
+    assert not ChunkRetriever(db=None, config=RetrievalConfig(mode="vector")).is_hybrid("договор")
+
+
+def test_quantized_storage_searches_compact_index_and_rescores():
+    retriever = ChunkRetriever(db=None, config=RetrievalConfig(vector_storage="binary", rescore_factor=4))
+    settings, sql, params = retriever._candidates_query([0.1] * 384, _filter(), top_k=20, subchunk_top_k=3)
+
+    assert "emb.vector_bit <~> binary_quantize" in sql
+    assert "FROM approx a" in sql
+    assert params["candidate_limit"] == 240 and params["approx_limit"] == 960
+    # ef_search выставляется под первый этап, а не под число пересчитываемых кандидатов
+    assert settings[0] == "SET LOCAL hnsw.ef_search = 960"
+
+
+def test_iterative_scan_lifts_ef_search_cap():
+    retriever = ChunkRetriever(db=None, config=RetrievalConfig(index_type="hnsw", ef_search=40, iterative_scan="relaxed_order"))
+
+    settings, _, params = retriever._candidates_query([0.1] * 384, _filter(), top_k=20, subchunk_top_k=3)
+
+    # Фильтр доступа отбрасывает часть строк индекса: обход продолжается, пока не набрано candidate_limit
+    assert params["candidate_limit"] == 240
+    assert settings == ["SET LOCAL hnsw.ef_search = 40", "SET LOCAL hnsw.iterative_scan = relaxed_order"]
+
+    retriever = ChunkRetriever(db=None, config=RetrievalConfig(index_type="hnsw", ef_search=40, iterative_scan="off"))
+    assert retriever.candidate_limit(top_k=20, subchunk_top_k=3) == 40
+
+
+def test_full_storage_keeps_single_stage_query():
+    retriever = ChunkRetriever(db=None, config=RetrievalConfig(vector_storage="full"))
+
+    _, sql, params = retriever._candidates_query([0.1] * 384, _filter(), top_k=20, subchunk_top_k=3)
+
+    assert "approx" not in sql and "approx_limit" not in params
+
+
+def test_tenant_override_limited_to_configured_storage(monkeypatch):
+    company_id = uuid.uuid4()
+    monkeypatch.setattr(config, "VECTOR_STORAGE", "halfvec")
+    monkeypatch.setattr(config, "RETRIEVAL_TENANT_OVERRIDES", {str(company_id): {"vector_storage": "binary", "rrf_k": 10}})
+
+    # Колонки vector_bit в схеме нет: режим компании игнорируется, остальные параметры применяются
+    retrieval_config = RetrievalConfig.for_company(company_id)
+    assert retrieval_config.vector_storage != "binary" and retrieval_config.rrf_k == 10
+
+    monkeypatch.setattr(config, "RETRIEVAL_TENANT_OVERRIDES", {str(company_id): {"vector_storage": "full"}})
+    assert RetrievalConfig.for_company(company_id).vector_storage == "full"
+
+
+def test_small_document_scope_uses_exact_scan():
+    assert DocumentFilter.by_ids([uuid.uuid4(), uuid.uuid4()]).exact_scan
+    retriever = ChunkRetriever(db=None, config=RetrievalConfig(vector_storage="binary", ef_search=40))
+
+    settings, sql, params = retriever._candidates_query([0.1] * 384, _filter(exact_scan=True), top_k=20, subchunk_top_k=3)
+
+    # Ни SET LOCAL, ни компактного индекса: расстояние по всем подчанкам выбранных документов
+    assert settings == []
+    assert "scoped AS MATERIALIZED" in sql and "vector_bit" not in sql
+    assert params["candidate_limit"] == 240
+
+
+def test_texts_are_attached_only_to_given_chunks():
+    page = [{"chunk_id": uuid.uuid4(), "chunk_text": None} for _ in range(2)]
+    result = MagicMock()
+    result.mappings.return_value.all.return_value = [{"chunk_id": page[0]["chunk_id"], "chunk_text": "текст"}]
+    db = MagicMock(execute=AsyncMock(return_value=result))
+
+    asyncio.run(ChunkRetriever(db=db).aattach_texts(page))
+
+    assert db.execute.call_args[0][1] == {"chunk_ids": [str(c["chunk_id"]) for c in page]}
+    assert [c["chunk_text"] for c in page] == ["текст", ""]
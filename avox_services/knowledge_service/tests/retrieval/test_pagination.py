@@ -0,0 +1,51 @@
+import uuid
+
+import pytest
+
+from knowledge_service.app.retrieval.pagination import InvalidCursor, SearchCursor, paginate
+
+QUESTION = "Как оформить отпуск?"
+
+
+def _chunk(best_distance):
+    return {"chunk_id": uuid.uuid4(), "best_distance": best_distance, "score": 1 - best_distance}
+
+
+def test_pages_follow_ranking_without_overlap():
+    chunks = [_chunk(d) for d in (0.3, 0.1, 0.2, 0.1, 0.5)]
+
+    first, cursor = paginate(chunks, QUESTION, limit=2)
+    second, cursor = paginate(chunks, QUESTION, limit=2, cursor=SearchCursor.decode(cursor, QUESTION))
+    third, cursor = paginate(chunks, QUESTION, limit=2, cursor=SearchCursor.decode(cursor, QUESTION))
+
+    pages = [c["best_distance"] for c in first + second + third]
+    assert pages == [0.1, 0.1, 0.2, 0.3, 0.5]
+    assert len({c["chunk_id"] for c in first + second + third}) == 5
+    assert cursor is None
+
+
+def test_cursor_skips_already_returned_chunks_when_results_shift():
+    chunks = [_chunk(d) for d in (0.1, 0.2, 0.3)]
+    _, cursor = paginate(chunks, QUESTION, limit=1)
+
+    # Между запросами появился более релевантный чанк — он не должен попасть на вторую страницу
+    page, _ = paginate(chunks + [_chunk(0.05)], QUESTION, limit=1, cursor=SearchCursor.decode(cursor, QUESTION))
+
+    assert page[0]["best_distance"] == 0.2
+
+
+def test_hybrid_results_are_paged_by_rrf():
+    chunks = [dict(_chunk(0.9), rrf_score=1 / 61), dict(_chunk(0.1), rrf_score=1 / 65)]
+
+    page, _ = paginate(chunks, QUESTION, limit=1)
+
+    assert page[0]["rrf_score"] == 1 / 61
+
+
+def test_cursor_is_bound_to_question():
+    _, cursor = paginate([_chunk(0.1), _chunk(0.2)], QUESTION, limit=1)
+
+    with pytest.raises(InvalidCursor):
+        SearchCursor.decode(cursor, "другой вопрос")
+    with pytest.raises(InvalidCursor):
+        SearchCursor.decode("not-a-cursor", QUESTION)
@@ -0,0 +1,51 @@
+import uuid
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from knowledge_service.app.retrieval.rerank import ChunkReranker
+
+
+def _chunks(doc_ids, texts):
+    return [
+        {"chunk_id": uuid.uuid4(), "document_id": doc_id, "chunk_idx": i, "chunk_text": text}
+        for i, (doc_id, text) in enumerate(zip(doc_ids, texts))
+    ]
+
+
+def _cross_encoder(scores_by_text):
+    cross_encoder = MagicMock()
+    cross_encoder.model_name = "test-cross-encoder"
+    cross_encoder.lowercase = True
+    cross_encoder.predict.side_effect = lambda pairs, batch_size: np.array([scores_by_text[t] for _, t in pairs])
+    return cross_encoder
+
+
+def test_rerank_keeps_top_documents_ordered_by_best_chunk():
+    doc_a, doc_b, doc_c = "a", "b", "c"
+    chunks = _chunks([doc_a, doc_b, doc_b, doc_c], ["weak", "best", "mid", "good"])
+    reranker = ChunkReranker(
+        _cross_encoder({"weak": -3.0, "best": 5.0, "mid": 1.0, "good": 2.0}),
+        top_documents=2
+    )
+
+    result = reranker.rerank("вопрос", chunks)
+
+    assert [c["chunk_text"] for c in result] == ["best", "mid", "good"]
+    assert reranker.documents_dropped == 1
+
+
+def test_scores_are_cached_per_question_and_chunk():
+    chunks = _chunks(["a", "b"], ["x", "y"])
+    cross_encoder = _cross_encoder({"x": 1.0, "y": 2.0})
+    reranker = ChunkReranker(cross_encoder, top_documents=5)
+
+    reranker.rerank("Вопрос  про договор", chunks)
+    # Нормализованный вопрос совпадает — модель повторно не вызывается
+    reranker.rerank("вопрос про договор", [dict(c) for c in chunks])
+    assert cross_encoder.predict.call_count == 1
+    assert reranker.pairs_scored == 2
+
+    reranker.rerank("другой вопрос", chunks[:1])
+    assert cross_encoder.predict.call_count == 2
+    assert len(cross_encoder.predict.call_args[0][0]) == 1
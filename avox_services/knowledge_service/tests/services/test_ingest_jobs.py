@@ -0,0 +1,95 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from avox_shared.knowledge_service.rag import AnswerStrategy, RAGResponse
+from knowledge_service.app.llm import answer_cache as answer_cache_module
+from knowledge_service.app.llm.answer_cache import AnswerCacheKey, SemanticAnswerCache, scope_key
+from knowledge_service.app.services.ingest_jobs import SYNC_JOBS_SQL
+
+
+class FakeCacheDb:
+    """
+    Таблицы documents (id -> updated_at) и answer_cache_entries в памяти:
+    выполняет только запросы SemanticAnswerCache.
+    """
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.entries = []
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def commit(self):
+        pass
+
+    async def execute(self, statement, params):
+        sql = statement.text
+        result = MagicMock()
+        if sql == answer_cache_module.SCOPE_VERSION_SQL:
+            result.scalar.return_value = max(self.documents[uuid.UUID(d)] for d in params["doc_ids"])
+        elif sql == answer_cache_module.LOOKUP_SQL:
+            result.mappings.return_value.all.return_value = [
+                {**entry, "distance": 0.0} for entry in self.entries if entry["scope_key"] == params["scope_key"]
+            ]
+        elif sql == answer_cache_module.DOCUMENT_VERSIONS_SQL:
+            result.mappings.return_value.all.return_value = [
+                {"id": doc_id, "updated_at": self.documents[doc_id]}
+                for doc_id in map(uuid.UUID, params["doc_ids"]) if doc_id in self.documents
+            ]
+        elif sql == answer_cache_module.INSERT_SQL:
+            self.entries.append({
+                "id": params["id"],
+                "scope_key": params["scope_key"],
+                "response": json.loads(params["response"]),
+                "document_versions": json.loads(params["document_versions"]),
+            })
+        return result
+
+
+def _response(used_documents):
+    return RAGResponse(
+        final_result="ok",
+        facts=[],
+        reasoning="",
+        used_documents=used_documents,
+        used_doc_chunks=[],
+        confidence=0.0,
+        llm_provider="VLLMProvider",
+        processing_time_ms=1,
+        strategy=AnswerStrategy.MAP_REDUCE,
+    )
+
+
+def test_finished_job_invalidates_answers_cached_while_it_was_running():
+    cited, new = uuid.uuid4(), uuid.uuid4()
+    ingested_at = datetime(2025, 8, 1, tzinfo=timezone.utc)
+    db = FakeCacheDb({cited: ingested_at - timedelta(days=1), new: ingested_at})
+    cache = SemanticAnswerCache(session_factory=db)
+    company_id = uuid.uuid4()
+
+    async def key():
+        version = await cache.acontent_version([cited, new])
+        return AnswerCacheKey(company_id, scope_key("fp", None, version), AnswerStrategy.MAP_REDUCE, "model", (0.1,) * 384)
+
+    async def run():
+        # Задание нового документа RUNNING: векторов ещё нет, ответ ссылается только на старый документ
+        running_key = await key()
+        await cache.astore(running_key, "вопрос", _response([str(cited)]))
+        assert await cache.alookup(running_key) is not None
+
+        # Завершение задания (SYNC_JOBS_SQL) обновляет updated_at документа
+        db.documents[new] = ingested_at + timedelta(minutes=5)
+        return await cache.alookup(await key())
+
+    assert "UPDATE documents d\nSET updated_at = now()" in SYNC_JOBS_SQL
+    assert asyncio.run(run()) is None
@@ -2,41 +2,32 @@ import uuid
 from unittest.mock import patch, MagicMock
 
 import numpy as np
-from knowledge_service.app.api.schemas.document import DocumentIngestResponse
+import pytest
 
-from knowledge_service.app.models.enums import SourceType, DocAccessLevel
+from avox_shared.knowledge_service.document import DocumentIngestRequest, DocumentIngestResponse, DocumentUpdateRequest
+from knowledge_service.app.models.core.document import Document
+from knowledge_service.app.models.enums import DocAccessLevel, EmbeddingStatus, IngestJobStatus, SourceType, UserType
 from knowledge_service.app.services import DocumentIngestor
+from knowledge_service.app.services.ingestion import DocumentEditForbidden, DocumentVersionConflict, text_hash
 
 
-@patch("knowledge_service.app.services.ingestion.SentenceTransformer")
-@patch("knowledge_service.app.services.ingestion.AutoTokenizer")
 @patch("knowledge_service.app.services.ingestion.sent_tokenize")
 def test_ingest_successful_flow(
     mock_sent_tokenize,
-    mock_tokenizer_class,
-    mock_model_class,
     sample_text,
-    mock_db_session
+    mock_db_session,
+    mock_embedding_registry
 ):
-    # Arrange: подменяем модель
-    mock_model = MagicMock()
-    mock_model.encode.return_value = np.array([[0.1] * 384] * 2)  # эмуляция двух эмбеддингов
-    mock_model_class.return_value = mock_model
-
-    # Подменяем токенайзер
-    mock_tokenizer_instance = MagicMock()
-    mock_tokenizer_instance.return_value = {
-        'input_ids': [[0] * 256, [1] * 256],
-        'offset_mapping': [[(0, 50), (51, 100)], [(100, 150), (151, 200)]]
-    }
-    mock_tokenizer_class.from_pretrained.return_value = mock_tokenizer_instance
-    mock_tokenizer_class.return_value = mock_tokenizer_instance
+    # Arrange: модель и токенайзер приходят из реестра
+    mock_model = mock_embedding_registry.get_embedder.return_value
+    # по эмбеддингу на каждый переданный подчанк
+    mock_model.encode.side_effect = lambda texts, **kwargs: np.array([[0.1] * 384] * len(texts))
 
     # Подменяем разбиение на предложения
     mock_sent_tokenize.return_value = sample_text.split(". ")
 
     # Создаём инжестор
-    ingestor = DocumentIngestor(mock_db_session)
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
 
     # Входные данные
     company_id = uuid.uuid4()
@@ -58,8 +49,308 @@ def test_ingest_successful_flow(
     assert result.status == "success"
     assert result.title == title
 
-    # Проверяем, что вызовы были
+    # Проверяем, что вызовы были, а модель не загружалась заново
+    mock_embedding_registry.ensure_nltk.assert_called_once()
     assert mock_model.encode.called
-    assert mock_db_session.add.called
     assert mock_db_session.flush.called
     assert mock_db_session.commit.called
+
+
+@patch("knowledge_service.app.services.ingestion.sent_tokenize")
+def test_ingest_many_encodes_once_and_writes_in_bulk(
+    mock_sent_tokenize,
+    sample_text,
+    mock_db_session,
+    mock_embedding_registry
+):
+    mock_model = mock_embedding_registry.get_embedder.return_value
+    mock_model.encode.side_effect = lambda texts, **kwargs: np.array([[0.1] * 384] * len(texts))
+    mock_sent_tokenize.return_value = sample_text.split(". ")
+
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
+    documents = [
+        DocumentIngestRequest(
+            text=sample_text,
+            title=f"Doc {i}",
+            source_type=SourceType.TEXT_INPUT,
+            access_level=DocAccessLevel.RESTRICTED,
+        )
+        for i in range(3)
+    ]
+
+    result = ingestor.ingest_many(documents, company_id=uuid.uuid4(), owner_id=uuid.uuid4())
+
+    # Подчанки всех документов уходят в модель одним вызовом, одинаковые тексты — один раз
+    mock_model.encode.assert_called_once()
+    texts = mock_model.encode.call_args.args[0]
+    assert len(texts) == len(set(texts))
+    assert mock_model.encode.call_args.kwargs["batch_size"] == ingestor.encode_batch_size
+
+    # Поиск известных векторов, затем чанки и эмбеддинги — по одному многострочному INSERT, одна транзакция
+    assert mock_db_session.execute.call_count == 3
+    chunk_rows = mock_db_session.execute.call_args_list[1].args[1]
+    embedding_rows = mock_db_session.execute.call_args_list[2].args[1]
+    assert len(embedding_rows) == 3 * len(texts)
+    assert {row["chunk_id"] for row in embedding_rows} <= {row["id"] for row in chunk_rows}
+    mock_db_session.commit.assert_called_once()
+
+    assert [r.status for r in result.results] == ["success"] * 3
+    assert result.stats.documents == 3
+    assert result.stats.chunks == len(chunk_rows)
+    assert result.stats.subchunks == len(embedding_rows)
+    # Три одинаковых документа: модель считает только первый
+    assert result.stats.subchunks_encoded == len(texts)
+    assert result.stats.subchunks_reused == 2 * len(texts)
+    assert result.stats.dedup_ratio == round(2 / 3, 4)
+    assert result.stats.subchunks_per_sec > 0
+
+
+def test_ingest_reuses_stored_vectors_by_content_hash(mock_db_session, mock_embedding_registry):
+    mock_model = mock_embedding_registry.get_embedder.return_value
+    mock_model.encode.side_effect = lambda texts, **kwargs: np.array([[0.1] * 384] * len(texts))
+
+    chunk_text = "x" * 40 + "   " + "x" * 57 + "y" * 100
+    known, unseen = chunk_text[0:100], chunk_text[100:200]
+    # Вектор первого подчанка уже есть в БД (текст отличался только пробелами)
+    mock_db_session.execute.return_value.all.return_value = [
+        (text_hash("x" * 40 + " " + "x" * 57), "[" + ",".join(["0.5"] * 384) + "]")
+    ]
+
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
+    _, subchunks = ingestor._chunk_rows(uuid.uuid4(), [chunk_text])
+    assert [sc.text for sc in subchunks] == [known, unseen]
+    resolved = ingestor._resolve_vectors([sc.text for sc in subchunks], [sc.content_hash for sc in subchunks])
+
+    # В модель уходит только новый подчанок, известный берётся из хранилища
+    assert mock_model.encode.call_args.args[0] == [unseen]
+    assert (resolved.encoded, resolved.reused) == (1, 1)
+    assert resolved.vectors[0][0] == np.float32(0.5)
+    assert resolved.model_ms_saved == ingestor.encode_ms_per_subchunk
+    lookup_params = mock_db_session.execute.call_args_list[0].args[1]
+    assert lookup_params["model"] == ingestor.model_name
+    assert set(lookup_params["hashes"]) == {sc.content_hash for sc in subchunks}
+
+
+@patch("knowledge_service.app.services.ingestion.sent_tokenize")
+def test_enqueue_writes_pending_embeddings_without_encoding(
+    mock_sent_tokenize,
+    sample_text,
+    mock_db_session,
+    mock_embedding_registry
+):
+    mock_model = mock_embedding_registry.get_embedder.return_value
+    mock_sent_tokenize.return_value = sample_text.split(". ")
+
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
+    req = DocumentIngestRequest(
+        text=sample_text,
+        title="Async Doc",
+        source_type=SourceType.TEXT_INPUT,
+        access_level=DocAccessLevel.RESTRICTED,
+    )
+
+    job = ingestor.enqueue(req, company_id=uuid.uuid4(), owner_id=uuid.uuid4())
+
+    # Модель не вызывается: векторы посчитает фоновая задача
+    mock_model.encode.assert_not_called()
+    embedding_rows = mock_db_session.execute.call_args_list[2].args[1]
+    assert all(row["status"] == EmbeddingStatus.PENDING and row["vector"] is None for row in embedding_rows)
+    assert job.status == IngestJobStatus.QUEUED
+    assert job.total_subchunks == len(embedding_rows)
+    assert job.reused_subchunks == 0
+    mock_db_session.commit.assert_called_once()
+
+
+def _pending_rows(chunk_text):
+    chunk_id, document_id = uuid.uuid4(), uuid.uuid4()
+    return [
+        {"id": uuid.uuid4(), "chunk_id": chunk_id, "document_id": document_id, "subchunk_idx": i, "chunk_text": chunk_text}
+        for i in range(2)
+    ]
+
+
+def test_embed_pending_restores_subchunks_and_updates_in_bulk(mock_db_session, mock_embedding_registry):
+    mock_model = mock_embedding_registry.get_embedder.return_value
+    mock_model.encode.side_effect = lambda texts, **kwargs: np.array([[0.1] * 384] * len(texts))
+
+    chunk_text = "x" * 100 + "y" * 100
+    rows = _pending_rows(chunk_text)
+    mock_db_session.execute.return_value.mappings.return_value.all.return_value = rows
+
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
+    batch = ingestor.embed_pending(document_id=uuid.uuid4())
+
+    assert batch.claimed == batch.completed == 2
+    assert batch.document_ids == [rows[0]["document_id"]]
+    # Чанк разбивается один раз, оба подчанка кодируются одной партией
+    assert mock_embedding_registry.get_tokenizer.return_value.call_count == 1
+    assert mock_model.encode.call_args.args[0] == [chunk_text[0:100], chunk_text[100:200]]
+
+    update_params = mock_db_session.execute.call_args_list[-1].args[1]
+    assert update_params["ids"] == [str(row["id"]) for row in rows]
+    assert len(update_params["vectors"]) == 2
+    assert update_params["hashes"] == [text_hash(chunk_text[0:100]), text_hash(chunk_text[100:200])]
+    mock_db_session.commit.assert_called_once()
+
+
+def test_embed_pending_encodes_identical_subchunks_once(mock_db_session, mock_embedding_registry):
+    mock_model = mock_embedding_registry.get_embedder.return_value
+    mock_model.encode.side_effect = lambda texts, **kwargs: np.array([[0.1] * 384] * len(texts))
+
+    # Оба подчанка чанка — одинаковый текст
+    chunk_text = "x" * 200
+    rows = _pending_rows(chunk_text)
+    mock_db_session.execute.return_value.mappings.return_value.all.return_value = rows
+
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
+    batch = ingestor.embed_pending()
+
+    # Модель считает текст один раз, обе строки получают один и тот же вектор и хэш
+    assert mock_model.encode.call_args.args[0] == ["x" * 100]
+    assert (batch.completed, batch.reused) == (2, 1)
+    update_params = mock_db_session.execute.call_args_list[-1].args[1]
+    assert update_params["ids"] == [str(row["id"]) for row in rows]
+    assert update_params["vectors"][0] == update_params["vectors"][1]
+    assert update_params["hashes"] == [text_hash("x" * 100)] * 2
+
+
+def test_embed_pending_schedules_retry_on_model_error(mock_db_session, mock_embedding_registry):
+    mock_model = mock_embedding_registry.get_embedder.return_value
+    mock_model.encode.side_effect = RuntimeError("CUDA out of memory")
+
+    result = mock_db_session.execute.return_value
+    result.mappings.return_value.all.return_value = _pending_rows("x" * 200)
+    # Первый подчанк исчерпал попытки, второй уходит на повтор
+    result.scalars.return_value.all.return_value = ["FAILED", "PENDING"]
+
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
+    batch = ingestor.embed_pending()
+
+    assert (batch.claimed, batch.completed, batch.retried, batch.failed) == (2, 0, 1, 1)
+    retry_params = mock_db_session.execute.call_args_list[-1].args[1]
+    assert retry_params["error"] == "CUDA out of memory"
+    assert retry_params["max_attempts"] == ingestor.max_attempts
+    # Ошибка не пробрасывается: обработчик продолжает со следующей партией
+    mock_db_session.commit.assert_called_once()
+
+
+def test_stream_writer_numbers_chunks_across_batches(mock_db_session, mock_embedding_registry):
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
+    writer = ingestor.open_stream(
+        "Big Doc", SourceType.FILE, DocAccessLevel.RESTRICTED, company_id=uuid.uuid4(), owner_id=uuid.uuid4()
+    )
+
+    writer.add_chunks(["x" * 200, "y" * 200])
+    writer.add_chunks(["z" * 200])
+    job = writer.finish()
+
+    # Каждая партия — поиск известных векторов, INSERT чанков и INSERT эмбеддингов;
+    # нумерация продолжается между партиями
+    chunk_batches = [c.args[1] for c in mock_db_session.execute.call_args_list[1:6:3]]
+    assert [row["chunk_idx"] for rows in chunk_batches for row in rows] == [0, 1, 2]
+    assert job.total_chunks == 3
+    assert job.total_subchunks == writer.subchunks == 6
+    mock_db_session.commit.assert_called_once()
+
+
+def _stored_document(mock_db_session, chunk_texts):
+    doc = MagicMock(
+        id=uuid.uuid4(), company_id=uuid.uuid4(), owner_id=uuid.uuid4(), title="Manual", version=3,
+        access_level=DocAccessLevel.RESTRICTED
+    )
+    doc.can_edit = lambda user: Document.can_edit(doc, user)
+    # Действующих грантов нет
+    doc.access_grants.filter.return_value.first.return_value = None
+    mock_db_session.get.return_value = doc
+    rows = [
+        {"id": uuid.uuid4(), "chunk_idx": i, "content_hash": text_hash(chunk_text), "chunk_text": None}
+        for i, chunk_text in enumerate(chunk_texts)
+    ]
+    mock_db_session.execute.return_value.mappings.return_value.all.return_value = rows
+    return doc, rows
+
+
+def _user(doc, user_type=UserType.EXTERNAL, owner=False):
+    return MagicMock(id=doc.owner_id if owner else uuid.uuid4(), company_id=doc.company_id, user_type=user_type)
+
+
+def test_update_reembeds_only_changed_chunks(mock_db_session, mock_embedding_registry):
+    old_texts = ["a" * 200, "b" * 200, "c" * 200, "d" * 200]
+    new_texts = ["a" * 200, "c" * 200, "d" * 200, "x" * 200]
+    doc, rows = _stored_document(mock_db_session, old_texts)
+    # Чанк, записанный до появления content_hash: хэш считается по тексту и сохраняется
+    rows[3].update(content_hash=None, chunk_text="d" * 200)
+
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
+    with patch.object(ingestor, "_chunk_texts", return_value=new_texts):
+        result = ingestor.update(doc.id, DocumentUpdateRequest(text="...", version=3), _user(doc, owner=True))
+
+    calls = [c.args[1] if len(c.args) > 1 else None for c in mock_db_session.execute.call_args_list]
+    # Удалён только "b", "c" и "d" сдвинуты на место "b" без пересчёта эмбеддингов
+    assert calls[1] == {"ids": [str(rows[1]["id"])]}
+    assert calls[2]["ids"] == [str(rows[2]["id"]), str(rows[3]["id"])]
+    assert calls[2]["chunk_idxs"] == [1, 2]
+    assert calls[2]["hashes"][1] == text_hash("d" * 200)
+    # Новый чанк встаёт последним, его подчанки ждут расчёта
+    assert [row["chunk_idx"] for row in calls[4]] == [3]
+    assert all(row["status"] == EmbeddingStatus.PENDING for row in calls[5])
+    assert calls[6] == {"document_id": str(doc.id)}
+
+    assert (result.chunks_kept, result.chunks_inserted, result.chunks_deleted) == (3, 1, 1)
+    assert result.status == "accepted" and result.job_id is not None
+    assert result.subchunks_total == 2
+    assert result.version == doc.version == 4
+    mock_embedding_registry.get_embedder.return_value.encode.assert_not_called()
+    mock_db_session.commit.assert_called_once()
+
+
+def test_update_without_changes_keeps_version(mock_db_session, mock_embedding_registry):
+    texts = ["a" * 200, "b" * 200]
+    doc, _ = _stored_document(mock_db_session, texts)
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
+
+    with patch.object(ingestor, "_chunk_texts", return_value=texts):
+        result = ingestor.update(doc.id, DocumentUpdateRequest(text="..."), _user(doc, owner=True))
+        # Документ изменили после того, как клиент прочитал версию 2
+        with pytest.raises(DocumentVersionConflict):
+            ingestor.update(doc.id, DocumentUpdateRequest(text="...", version=2), _user(doc, owner=True))
+
+    assert result.status == "unchanged"
+    assert (result.version, result.chunks_kept) == (3, 2)
+    assert doc.version == 3
+    assert mock_db_session.execute.call_count == 1
+    mock_db_session.commit.assert_not_called()
+
+
+def test_update_foreign_document_not_found(mock_db_session, mock_embedding_registry):
+    doc, _ = _stored_document(mock_db_session, ["a" * 200])
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
+
+    stranger = MagicMock(id=doc.owner_id, company_id=uuid.uuid4(), user_type=UserType.INTERNAL)
+
+    assert ingestor.update(doc.id, DocumentUpdateRequest(text="..."), stranger) is None
+
+
+def test_update_refused_without_edit_rights(mock_db_session, mock_embedding_registry):
+    doc, _ = _stored_document(mock_db_session, ["a" * 200])
+    ingestor = DocumentIngestor(mock_db_session, registry=mock_embedding_registry)
+    req = DocumentUpdateRequest(text="...")
+
+    # Клиент компании без гранта EDITOR не может менять даже INTERNAL-документ
+    doc.access_level = DocAccessLevel.INTERNAL
+    with pytest.raises(DocumentEditForbidden):
+        ingestor.update(doc.id, req, _user(doc, UserType.EXTERNAL))
+    # Сотрудник не может менять чужой RESTRICTED-документ без гранта
+    doc.access_level = DocAccessLevel.RESTRICTED
+    with pytest.raises(DocumentEditForbidden):
+        ingestor.update(doc.id, req, _user(doc, UserType.INTERNAL))
+
+    mock_db_session.execute.assert_not_called()
+    mock_db_session.commit.assert_not_called()
+
+    # С грантом EDITOR — можно; INTERNAL-документ правит любой сотрудник
+    doc.access_grants.filter.return_value.first.return_value = MagicMock()
+    assert doc.can_edit(_user(doc, UserType.EXTERNAL))
+    doc.access_grants.filter.return_value.first.return_value = None
+    doc.access_level = DocAccessLevel.INTERNAL
+    assert doc.can_edit(_user(doc, UserType.INTERNAL))
@@ -0,0 +1,85 @@
+import asyncio
+import re
+
+import pytest
+
+from knowledge_service.app.services.streaming import (
+    IncrementalSentenceSplitter,
+    SentenceChunker,
+    aiter_chunk_texts,
+    charset_from_content_type,
+)
+
+
+class RegexSentenceTokenizer:
+    """Простой заменитель Punkt: предложение заканчивается точкой и пробелом"""
+
+    def span_tokenize(self, text):
+        start = 0
+        for match in re.finditer(r"(?<=\.)\s+", text):
+            yield start, match.start()
+            start = match.end()
+        if start < len(text):
+            yield start, len(text.rstrip())
+
+    def tokenize(self, text):
+        return [text[start:end] for start, end in self.span_tokenize(text)]
+
+
+def _whole_document_chunks(sentences, chunk_size, overlap):
+    # Эталон — разбиение DocumentIngestor._split_into_chunks_with_overlap
+    chunks, i = [], 0
+    while i < len(sentences):
+        chunks.append(" ".join(sentences[i:i + chunk_size]))
+        i += chunk_size - overlap
+    return chunks
+
+
+@pytest.mark.parametrize("count", [1, 4, 5, 7, 10, 23])
+def test_sentence_chunker_matches_whole_document_split(count):
+    sentences = [f"Sentence {i}." for i in range(count)]
+    chunker = SentenceChunker(chunk_size=5, overlap=2)
+
+    chunks = []
+    for sentence in sentences:
+        chunks.extend(chunker.add([sentence]))
+    chunks.extend(chunker.finish())
+
+    assert chunks == _whole_document_chunks(sentences, 5, 2)
+
+
+def test_splitter_keeps_unfinished_sentence_in_buffer():
+    splitter = IncrementalSentenceSplitter(tokenizer=RegexSentenceTokenizer())
+
+    assert splitter.feed("First one. Second ") == ["First one."]
+    assert splitter.feed("one. Thi") == ["Second one."]
+    assert splitter.finish() == ["Thi"]
+
+
+def test_splitter_cuts_text_without_boundaries():
+    splitter = IncrementalSentenceSplitter(tokenizer=RegexSentenceTokenizer(), max_pending_chars=20)
+
+    # Буфер не растёт бесконечно, даже если в тексте нет ни одной точки
+    assert splitter.feed("word " * 10) == ["word word word word"]
+
+
+def test_stream_chunks_match_whole_document_and_survive_split_utf8():
+    sentences = [f"Предложение номер {i}." for i in range(12)]
+    data = " ".join(sentences).encode("utf-8")
+
+    async def byte_chunks():
+        # Порции по 7 байт режут кириллические символы пополам
+        for i in range(0, len(data), 7):
+            yield data[i:i + 7]
+
+    async def collect():
+        splitter = IncrementalSentenceSplitter(tokenizer=RegexSentenceTokenizer())
+        return [chunk async for chunk in aiter_chunk_texts(byte_chunks(), 5, 2, splitter=splitter)]
+
+    assert asyncio.run(collect()) == _whole_document_chunks(sentences, 5, 2)
+
+
+def test_charset_from_content_type():
+    assert charset_from_content_type("text/plain; charset=cp1251") == "cp1251"
+    assert charset_from_content_type("text/plain") == "utf-8"
+    assert charset_from_content_type(None) == "utf-8"